@@ -1,49 +1,113 @@
+import asyncio
+import contextlib
+import json
+import os
 import sys
+from dataclasses import asdict
 from pathlib import Path
 
-import pandas as pd
-from agents import Agent, Runner, function_tool
+from agents import Agent, RunConfig, Runner, function_tool
 from agents.mcp import MCPServerStdio
+from budgets import BudgetHooks, JobBudget
+from checkpoints import CheckpointHooks, resume_instructions, restore
+from column_groups import group_reader_answer
+from fallback import finish
+from model_routing import MoneyDecision, NameDecision, TimeDecision, decide
+from profiling import profiled_job
+from progress import ProgressHooks, ProgressReporter, count_rows
+from recipe import load_recipe
+from sampling import encode_table, encode_values, representative_rows, representative_values
+from table_io import is_excel, read_table
+from workbook import (
+    SHEET_CONCURRENCY,
+    data_sheet_names,
+    group_by_schema,
+    merge_sheets,
+    replay_sheet,
+    split_sheets,
+)
+
+
+# Deduplication drops exact duplicates only; near-duplicates (rows equal after
+# normalizing case, numbers and IDs) are reported unless this opts in.
+DEDUP_NEAR_DUPLICATES = os.environ.get("DEDUP_NEAR_DUPLICATES", "0") == "1"
+
+# The MCP SDK starts servers with a minimal environment (PATH, HOME, ...);
+# these settings of the tools are passed on explicitly.
+MCP_SERVER_ENV = (
+    "COMPACT_FRAMES",
+    "DATE_LANGUAGES",
+    "EXCEL_READ_ENGINE",
+    "EXCEL_WRITE_ENGINE",
+    "GROUP_COLUMNS",
+    "MEMORY_REPORT",
+    "METRICS_WORKER",
+    "PROFILE",
+    "PROFILE_INTERVAL_MS",
+    "PROMETHEUS_MULTIPROC_DIR",
+    "SAMPLE_MAX_CELL_CHARS",
+    "SAMPLE_TOKEN_BUDGET",
+    "SNAPSHOTS",
+    "SNAPSHOT_DIR",
+    "SNAPSHOT_MAX_MB",
+    "STORAGE_HARDLINKS",
+    "TOOL_EXECUTOR",
+    "TOOL_WORKERS",
+    "TYPED_OUTPUT",
+)
+
+
+def mcp_server_env() -> dict[str, str]:
+    return {name: os.environ[name] for name in MCP_SERVER_ENV if name in os.environ}
+
+
+def tool_server(timeout: float = 5) -> MCPServerStdio:
+    """The MCP server of the formatting tools, started as a subprocess when
+    entered. `timeout` is how long a tool call may take, in seconds."""
+    return MCPServerStdio(
+        name="Data Formatting Tools",
+        params={
+            "command": sys.executable,
+            "args": [str(Path(__file__).parent / "mcp_server.py")],
+            "env": mcp_server_env(),
+        },
+        client_session_timeout_seconds=timeout,
+    )
 
 
 # 1. Define local function tools for reading data
 @function_tool
 def read_column_sample(file_path: str, col_name: str, n: int = 10) -> str:
-    """Read a sample of data from a specific column in an Excel or CSV file.
+    """Read a sample of distinct, format-diverse values from a specific column
+    in an Excel or CSV file. Rare formats are included next to the common ones.
 
     Args:
         file_path: Path to the Excel or CSV file.
         col_name: Name of the column to sample.
-        n: Number of rows to sample.
+        n: Number of values to sample.
     """
     try:
-        if file_path.endswith(".csv"):
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
+        df = read_table(file_path)
         if col_name not in df.columns:
             return f"Column '{col_name}' not found. Available columns: {list(df.columns)}"
-        sample = df[col_name].dropna().head(n).tolist()
-        return str(sample)
+        sample = representative_values(df[col_name], n)
+        return encode_values(sample)
     except Exception as e:
         return f"Error reading sample: {e}"
 
 
 @function_tool
 def read_data_sample(file_path: str, n: int = 5) -> str:
-    """Read a sample of the entire dataset from an Excel or CSV file.
+    """Read a sample of format-diverse rows of the entire dataset from an Excel
+    or CSV file, encoded as CSV.
 
     Args:
         file_path: Path to the Excel or CSV file.
         n: Number of rows to sample.
     """
     try:
-        if file_path.endswith(".csv"):
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
-        sample = df.head(n).to_dict(orient="list")
-        return str(sample)
+        df = read_table(file_path)
+        return encode_table(representative_rows(df, n))
     except Exception as e:
         return f"Error reading sample: {e}"
 
@@ -56,10 +120,7 @@ def get_columns(file_path: str) -> str:
         file_path: Path to the Excel or CSV file.
     """
     try:
-        if file_path.endswith(".csv"):
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
+        df = read_table(file_path)
         return str(list(df.columns))
     except Exception as e:
         return f"Error reading columns: {e}"
@@ -74,7 +135,8 @@ header_agent = Agent(
         "You are a data parsing agent specialized in finding table structures.\n"
         "Real-world files often have titles, export dates, or blank rows at the very top. "
         "They also frequently have blank columns on the left.\n\n"
-        "STEP 1: Use the `execute_header_detection` MCP tool to get a raw preview of the first 15 rows.\n"
+        "STEP 1: Use the `execute_header_detection` MCP tool to get a raw preview of the first 15 rows. "
+        "The preview is CSV: the first line holds the 0-based column indexes and the first field of each line is the 0-based row index.\n"
         "STEP 2: Analyze the raw preview to identify the 2D starting coordinate of the ACTUAL data table:\n"
         "   - `header_row_index`: The 0-based index of the row containing the column headers (e.g., 'Txn ID', 'Date', 'Amount').\n"
         "   - `header_col_index`: The 0-based index of the column where the actual data starts (ignoring empty/blank columns to the left).\n"
@@ -90,8 +152,9 @@ na_agent = Agent(
     instructions=(
         "You are a data cleaning agent focused on missing values.\n"
         "Pandas has already handled standard 'NaN' and 'N/A' automatically.\n\n"
-        "STEP 1: Use the `detect_potential_na_strings` MCP tool to scan for punctuation-only strings "
-        "that might be NA placeholders, and to get a sample of the data.\n"
+        "STEP 1: Use the `profile_columns` MCP tool to get compact per-column statistics. Its `potential_nas` "
+        "lists punctuation-only strings that might be NA placeholders, and each column's `top` values show how they are used.\n"
+        "   Only if the profile is not enough to decide, use `detect_potential_na_strings` to see raw sample rows.\n"
         "STEP 2: Evaluate if any of these strings (like '-', '.') are being used as placeholders for missing data.\n"
         "STEP 3: Use the `execute_na_cleaning` MCP tool with your decisions:\n"
         "   - `custom_na_strings_to_wipe`: list of strings to treat as NA\n"
@@ -107,15 +170,20 @@ reader_agent = Agent(
     name="Reader Agent",
     instructions=(
         "You are a precise data analysis agent. Your job is to classify columns in a dataset.\n"
-        "Use the `read_data_sample` tool to get a sample of the data (first 5 rows).\n"
-        "For each column, determine its data type based on the values.\n"
-        "You are ONLY allowed to use these exact categories: 'time', 'money', 'int', 'string', 'float', 'name', 'unknown'.\n\n"
+        "Use the `profile_columns` MCP tool with group_similar=True to get compact per-column statistics for the whole file: top values, "
+        "null ratio, distinct count, numeric/date/money parse-success rates, detected currencies and max decimals.\n"
+        "Columns with the same value shape are grouped: only the first column of a group is profiled, and the others are listed "
+        "under its `same_shape`. Classify only the profiled columns; the others share their type.\n"
+        "For each column, determine its data type based on these statistics. Only if a column is still ambiguous, "
+        "use the `read_data_sample` tool to look at raw rows.\n"
+        "You are ONLY allowed to use these exact categories: 'time', 'money', 'int', 'string', 'float', 'name', 'category', 'unknown'.\n\n"
         "CRITICAL DEFINITIONS:\n"
         "- 'time': Includes standard formats (2023-01-01, 14:30), timestamps, AND natural language dates (e.g., 'first of january 2016', 'Q1 2024', 'yesterday'). If the core meaning represents a date or time, it is 'time', NEVER 'string'.\n"
         "- 'money': Includes currency symbols ($100, \u20ac50), accounting formats, or financial abbreviations (100 USD) and natural language money expressions ('100 dollars', 'fifty euros'). If the core meaning represents a monetary value, it is 'money', NEVER 'string'.\n"
         "- 'int': Whole numbers without decimals.\n"
         "- 'float': Numbers containing decimals.\n"
         "- 'name': Proper nouns. This includes human names (John Smith, Smith, John), cities, states (Alabama), or company names.\n"
+        "- 'category': A small set of repeated labels such as statuses, countries, currencies or departments, often written in several variants ('US', 'U.S.A.', 'usa'; 'FAILED', 'fail'). Use 'category' instead of 'name' or 'string' when the column has few distinct values relative to its rows.\n"
         "- 'string': General text, sentences, descriptions, or specific codes (e.g., ID-4552) that have no mathematical or temporal value.\n"
         "- 'unknown': Use this ONLY if the column is complete gibberish or you cannot confidently assign it to any other category.\n\n"
         "IMPORTANT: You MUST return your result as a JSON object mapping each column name to its classified type.\n"
@@ -141,9 +209,9 @@ time_agent = Agent(
         "- Date and exact time: '%d/%m/%Y %H:%M:%S'\n"
         "- Month and year: '%m/%Y'\n"
         "- Year only: '%Y'\n"
-        "Then use the `execute_time_formatting` MCP tool to apply the format.\n"
-        "You MUST pass the file_path, col_name, and target_format to the tool."
+        "Return the chosen target_format, and your confidence (0 to 1) that it fits every value of the column."
     ),
+    output_type=TimeDecision,
     model="gpt-4o-2024-08-06",
 )
 
@@ -163,9 +231,10 @@ money_agent = Agent(
         "4. Identify the decimal separator used in the numbers ('.' or ',').\n"
         "   - WARNING: Commas that group thousands (like '200,000,000') are NOT decimal separators. If a comma groups thousands, the decimal separator is '.'.\n"
         "   - Only choose ',' if the comma specifically separates fractional cents at the very end of the number (e.g., '1.500,00').\n"
-        "Then use the `execute_money_formatting` MCP tool to apply the formatting.\n"
-        "You MUST pass all required parameters: file_path, col_name, is_mixed_currency, detected_currency, scale_decision, and decimal_separator."
+        "Return is_mixed_currency, detected_currency, scale_decision and decimal_separator, and your confidence (0 to 1) "
+        "that they fit every value of the column."
     ),
+    output_type=MoneyDecision,
     model="gpt-4o-2024-08-06",
 )
 
@@ -182,8 +251,27 @@ name_agent = Agent(
         "   - Are they mostly 'Last First' (e.g., Smith John)?\n"
         "   - NOTE: If you see ambiguous names (like 'Harper Taylor'), look at the other names in the sample to deduce the pattern.\n"
         "3. If it is 'Locations/Other', select 'N/A' for the format.\n"
-        "Then use the `execute_name_formatting` MCP tool to apply the formatting.\n"
-        "You MUST pass all required parameters: file_path, col_name, entity_type, and dominant_format."
+        "Return entity_type and dominant_format, and your confidence (0 to 1) that they fit the column."
+    ),
+    output_type=NameDecision,
+    model="gpt-4o-2024-08-06",
+)
+
+# --- CATEGORY AGENT ---
+category_agent = Agent(
+    name="Category Agent",
+    instructions=(
+        "You are a precise data standardization agent specializing in categorical labels.\n"
+        "When given a file and a column name, first use the `propose_category_clusters` MCP tool. It groups spelling "
+        "variants of the same label and proposes a canonical value for each cluster.\n"
+        "Your task is to confirm the mapping once:\n"
+        "1. Remove variants that were clustered wrongly (different meanings that merely look alike).\n"
+        "2. Add merges the tool cannot know about from the `unclustered` values, such as country codes and names ('FR' and 'France').\n"
+        "3. Choose the canonical value of each cluster: prefer the most frequent, clearly written form.\n"
+        "Then use the `execute_category_normalization` MCP tool with the file_path, col_name and mapping_json, a JSON object "
+        "mapping every variant to its canonical value. If the proposed clusters are already correct, pass an empty mapping_json.\n"
+        "You MUST pass the file_path and col_name to the tools. If the message names other columns of the same group, "
+        "pass them as also_apply_to to BOTH tools, so one mapping is built from and applied to all of them."
     ),
     model="gpt-4o-2024-08-06",
 )
@@ -193,8 +281,8 @@ description_agent = Agent(
     name="Description Agent",
     instructions=(
         "You are an expert data analyst and documentation agent.\n"
-        "When given a file path, use `read_data_sample` to get a sample of the cleaned data.\n"
-        "Then use `get_columns` to get all column names.\n\n"
+        "When given a file path, use the `profile_columns` MCP tool to get every column name together with "
+        "compact statistics and top values of the cleaned data.\n\n"
         "Your task is to generate a comprehensive data dictionary:\n"
         "1. Write a 1-2 sentence `general_summary` of what this dataset represents.\n"
         "2. For every single column in the dataset, create an entry with:\n"
@@ -212,18 +300,138 @@ description_agent = Agent(
 )
 
 
+# Column agents whose decisions are routed through model tiers and checked
+# against the data before their MCP tool applies them (see model_routing.py).
+ROUTED_AGENTS = {
+    "time": (time_agent, "execute_time_formatting", "Format a time/date column."),
+    "money": (money_agent, "execute_money_formatting", "Format a money/financial column."),
+    "name": (name_agent, "execute_name_formatting", "Format a name/proper noun column."),
+}
+
+
+def routed_column_tool(route, server, hooks=None, run_config=None):
+    """An orchestrator tool that decides a column's formatting and applies it."""
+    template, mcp_tool, description = ROUTED_AGENTS[route]
+    template = template.clone(tools=[read_column_sample])
+
+    @function_tool(
+        name_override=f"{route}_agent",
+        description_override=(
+            f"{description} Pass the file_path and col_name, and the rest of the column's "
+            "group as also_apply_to."
+        ),
+    )
+    async def format_column(
+        file_path: str, col_name: str, also_apply_to: list[str] | None = None
+    ) -> str:
+        """
+        Args:
+            file_path: Path to the Excel or CSV file.
+            col_name: Name of the column to format.
+            also_apply_to: The other columns of the column's group, formatted
+                with the same decision.
+        """
+        also_apply_to = [col for col in also_apply_to or [] if col != col_name]
+        try:
+            decision, model = await decide(
+                route, template, file_path, col_name, run_config, hooks, also_apply_to
+            )
+        except Exception as e:
+            return f"Error deciding the {route} format of '{col_name}': {e}"
+        params = {k: v for k, v in asdict(decision).items() if k != "confidence"}
+        result = await server.call_tool(
+            mcp_tool,
+            {"file_path": file_path, "col_name": col_name, "also_apply_to": also_apply_to, **params},
+        )
+        text = "\n".join(c.text for c in result.content if hasattr(c, "text"))
+        if hooks and not result.isError and not text.startswith("Error"):
+            hooks.column_done(col_name, *also_apply_to)
+        return f"{text} (decided by {model}: {json.dumps(params)})"
+
+    return format_column
+
+
 # 3. Define the Orchestrator
-async def run_agentic_pipeline(file_path: str):
-    server_path = str(Path(__file__).parent / "mcp_server.py")
-    python_executable = sys.executable
+@profiled_job
+async def run_agentic_pipeline(
+    file_path: str,
+    checkpoint: bool = False,
+    run_config: RunConfig | None = None,
+    progress: ProgressReporter | None = None,
+    server: MCPServerStdio | None = None,
+    budget: JobBudget | None = None,
+):
+    """Run the full cleaning pipeline on `file_path` in place.
+
+    With `checkpoint=True`, every completed step is snapshotted next to the
+    file, and an existing snapshot is restored first so the run resumes from
+    the last completed step. `run_config` applies to the orchestrator and every
+    sub-agent, e.g. to schedule model calls (see model_scheduler.py). Stages
+    and formatted columns are reported to `progress` (see progress.py).
+    Tools are called on `server` if given (a running `tool_server`, shared by
+    concurrent runs), else on a server started for this run. Once the agents
+    exceed the deadlines or tokens of `budget`, the columns they did not
+    format are finished with heuristic decisions and listed in the budget
+    (see budgets.py).
+    """
+    manifest = restore(file_path) if checkpoint else None
+    hooks = CheckpointHooks(file_path, manifest) if checkpoint else None
+    if progress:
+        if progress.rows is None:
+            progress.set_rows(await asyncio.to_thread(count_rows, file_path))
+        hooks = ProgressHooks(progress, hooks)
+    if budget:
+        hooks = BudgetHooks(budget, hooks, manifest["column_types"] if manifest else None)
+
+    async with contextlib.nullcontext(server) if server else tool_server() as server:
+        # Each run gets its own copies of the sub-agents wired to its MCP
+        # server, so several pipelines can run concurrently.
+        header = header_agent.clone(mcp_servers=[server], tools=[])
+        na = na_agent.clone(mcp_servers=[server], tools=[])
+        reader = reader_agent.clone(mcp_servers=[server])
+        category = category_agent.clone(mcp_servers=[server], tools=[])
+        description = description_agent.clone(mcp_servers=[server], tools=[])
+
+        async def grouped_answer(result) -> str:
+            # The orchestrator gets each group of same-shaped columns once.
+            return await asyncio.to_thread(
+                group_reader_answer, file_path, str(result.final_output)
+            )
+
+        stage_tools = [
+            header.as_tool(
+                tool_name="header_agent",
+                tool_description="Detect the true header row and starting column, then re-read and crop the file accordingly. Pass the file_path.",
+                hooks=hooks,
+            ),
+            na.as_tool(
+                tool_name="na_agent",
+                tool_description="Scan for custom NA placeholder strings and clean empty rows/columns. Pass the file_path.",
+                hooks=hooks,
+            ),
+            reader.as_tool(
+                tool_name="reader_agent",
+                tool_description="Classify the data types of ALL columns in the file. Pass the file_path. Returns a JSON mapping of column_name -> type.",
+                custom_output_extractor=grouped_answer,
+                hooks=hooks,
+            ),
+            *(
+                routed_column_tool(route, server, hooks, run_config)
+                for route in ROUTED_AGENTS
+            ),
+            category.as_tool(
+                tool_name="category_agent",
+                tool_description="Normalize the spelling variants of a categorical column. You MUST include both the file_path and col_name in your message to this agent.",
+                hooks=hooks,
+            ),
+            description.as_tool(
+                tool_name="description_agent",
+                tool_description="Generate a data dictionary for the cleaned dataset and save it as a second sheet. Pass the file_path.",
+                hooks=hooks,
+            ),
+        ]
+        bound_stage = budget.bound_stage if budget else (lambda tool: tool)
 
-    async with MCPServerStdio(
-        name="Data Formatting Tools",
-        params={
-            "command": python_executable,
-            "args": [server_path],
-        },
-    ) as server:
         orchestrator = Agent(
             name="Data Pipeline Orchestrator",
             instructions=(
@@ -231,13 +439,19 @@ async def run_agentic_pipeline(file_path: str):
                 "STEP 1 - SCOUT: Use the `header_agent` to detect and apply the correct header row and crop empty columns.\n"
                 "   Pass a message like: 'Detect the header and crop the file \"<file_path>\"'.\n\n"
                 "STEP 2 - SWEEP: Use the `na_agent` to scan for and clean custom NA placeholders, empty rows, and empty columns.\n"
-                "   Pass a message like: 'Clean missing data in the file \"<file_path>\"'.\n\n"
+                "   Pass a message like: 'Clean missing data in the file \"<file_path>\"'.\n"
+                "   Then directly use the `execute_deduplication` MCP tool with file_path, drop_duplicates=True and "
+                f"near_duplicates={DEDUP_NEAR_DUPLICATES} to remove duplicate rows. Keep its other parameters at their defaults.\n\n"
                 "STEP 3 - READ: Use the `reader_agent` to classify ALL columns in the file. Pass the file_path to it.\n"
-                "   The reader_agent will return a JSON mapping of column names to types.\n\n"
-                "STEP 4 - ROUTE: Process EACH column one by one in order, based on its classified type:\n"
-                "   - 'time': Delegate to `time_agent`. Pass a message like: 'Format the time column \"<col_name>\" in file \"<file_path>\"'.\n"
-                "   - 'money': Delegate to `money_agent`. Pass a message like: 'Format the money column \"<col_name>\" in file \"<file_path>\"'.\n"
-                "   - 'name': Delegate to `name_agent`. Pass a message like: 'Format the name column \"<col_name>\" in file \"<file_path>\"'.\n"
+                "   The reader_agent will return a JSON mapping of column names to types. For files with many columns of the same shape it returns\n"
+                "   {\"types\": {column: type}, \"groups\": {column: [other columns]}}: each column under \"groups\" stands for its whole group.\n\n"
+                "STEP 4 - ROUTE: Process EACH column (or group) one by one in order, based on its classified type. For a column with a group,\n"
+                "   make ONE call for the whole group: pass the other columns of the group as also_apply_to, and do NOT process them separately.\n"
+                "   - 'time': Use the `time_agent` tool with file_path and col_name.\n"
+                "   - 'money': Use the `money_agent` tool with file_path and col_name.\n"
+                "   - 'name': Use the `name_agent` tool with file_path and col_name.\n"
+                "   - 'category': Delegate to `category_agent`. Pass a message like: 'Normalize the categorical column \"<col_name>\" in file \"<file_path>\"' "
+                "(for a group, add 'together with its group also_apply_to=[...]').\n"
                 "   - 'int': Directly use the `execute_int_formatting` MCP tool with file_path and col_name. Do NOT use an agent.\n"
                 "   - 'float': Directly use the `execute_float_formatting` MCP tool with file_path and col_name. Do NOT use an agent.\n"
                 "   - 'string' or 'unknown': Bypass - do nothing, these require no formatting.\n\n"
@@ -245,7 +459,7 @@ async def run_agentic_pipeline(file_path: str):
                 "   Pass a message like: 'Generate a dataset description for the file \"<file_path>\"'.\n\n"
                 "CRITICAL RULES:\n"
                 "   - You MUST execute ALL 5 steps in the exact order above.\n"
-                "   - For 'time', 'money', and 'name', you MUST delegate to the respective agents and NOT call the MCP formatting tools directly.\n"
+                "   - For 'time', 'money', 'name' and 'category', you MUST delegate to the respective agents and NOT call the MCP formatting tools directly.\n"
                 "   - For 'int' and 'float', you MUST call the MCP tools directly and NOT delegate to agents.\n"
                 "   - Always pass BOTH file_path AND col_name when delegating or calling tools.\n"
                 "   - Process columns in order from left to right.\n\n"
@@ -254,62 +468,101 @@ async def run_agentic_pipeline(file_path: str):
             tools=[
                 get_columns,
                 read_data_sample,
-                header_agent.as_tool(
-                    tool_name="header_agent",
-                    tool_description="Detect the true header row and starting column, then re-read and crop the file accordingly. Pass the file_path.",
-                ),
-                na_agent.as_tool(
-                    tool_name="na_agent",
-                    tool_description="Scan for custom NA placeholder strings and clean empty rows/columns. Pass the file_path.",
-                ),
-                reader_agent.as_tool(
-                    tool_name="reader_agent",
-                    tool_description="Classify the data types of ALL columns in the file. Pass the file_path. Returns a JSON mapping of column_name -> type.",
-                ),
-                time_agent.as_tool(
-                    tool_name="time_agent",
-                    tool_description="Format a time/date column. You MUST include both the file_path and col_name in your message to this agent.",
-                ),
-                money_agent.as_tool(
-                    tool_name="money_agent",
-                    tool_description="Format a money/financial column. You MUST include both the file_path and col_name in your message to this agent.",
-                ),
-                name_agent.as_tool(
-                    tool_name="name_agent",
-                    tool_description="Format a name/proper noun column. You MUST include both the file_path and col_name in your message to this agent.",
-                ),
-                description_agent.as_tool(
-                    tool_name="description_agent",
-                    tool_description="Generate a data dictionary for the cleaned dataset and save it as a second sheet. Pass the file_path.",
-                ),
+                *map(bound_stage, stage_tools),
             ],
             mcp_servers=[server],
             model="gpt-4o-2024-08-06",
         )
 
-        # Give sub-agents access to MCP server and local tools
-        header_agent.mcp_servers = [server]
-        header_agent.tools = []
+        prompt = f"Please analyze and format the data in '{file_path}'. Process every column."
+        resume = resume_instructions(manifest)
+        if resume:
+            print(f"--- RESUMING AGENTIC PIPELINE from checkpoint for {file_path} ---")
+            prompt = f"{prompt}\n\n{resume}"
 
-        na_agent.mcp_servers = [server]
-        na_agent.tools = []
-
-        time_agent.mcp_servers = [server]
-        time_agent.tools = [read_column_sample]
+        print(f"--- STARTING AGENTIC PIPELINE (MCP + SDK) for {file_path} ---")
+        try:
+            async with asyncio.timeout(budget.remaining() if budget else None):
+                if budget:
+                    budget.check()
+                result = await Runner.run(
+                    orchestrator, prompt, hooks=hooks, run_config=run_config
+                )
+        except Exception as exc:
+            if not (budget and budget.limit_hit(exc)):
+                raise
+            print(f"--- {budget.exceeded}: finishing {file_path} with heuristic decisions ---")
+            degraded = await asyncio.to_thread(finish, file_path, hooks.column_types)
+            budget.degraded.extend({"file": Path(file_path).name, **d} for d in degraded)
+            if degraded:
+                hooks.column_done(*(d["column"] for d in degraded))
+            return
+        print("\n[Orchestrator Summary]:")
+        print(result.final_output)
 
-        money_agent.mcp_servers = [server]
-        money_agent.tools = [read_column_sample]
 
-        name_agent.mcp_servers = [server]
-        name_agent.tools = [read_column_sample]
+async def run_workbook_pipeline(
+    file_path: str,
+    checkpoint: bool = False,
+    max_concurrency: int = SHEET_CONCURRENCY,
+    run_config: RunConfig | None = None,
+    progress: ProgressReporter | None = None,
+    server: MCPServerStdio | None = None,
+    budget: JobBudget | None = None,
+) -> int:
+    """Clean every data sheet of a workbook and merge them back in place.
 
-        description_agent.mcp_servers = [server]
-        description_agent.tools = [read_data_sample, get_columns]
+    Sheets are grouped by schema: the first sheet of each group runs the agent
+    pipeline, at most `max_concurrency` at a time, and the other sheets of the
+    group replay its recipe. A sheet whose columns do not match after all gets
+    its own pipeline run. Text files and single-sheet workbooks are cleaned by
+    `run_agentic_pipeline` directly.
 
-        print(f"--- STARTING AGENTIC PIPELINE (MCP + SDK) for {file_path} ---")
-        result = await Runner.run(
-            orchestrator,
-            f"Please analyze and format the data in '{file_path}'. Process every column.",
+    Returns the number of data sheets cleaned.
+    """
+    if not is_excel(file_path) or len(data_sheet_names(file_path)) <= 1:
+        await run_agentic_pipeline(
+            file_path,
+            checkpoint=checkpoint,
+            run_config=run_config,
+            progress=progress,
+            server=server,
+            budget=budget,
         )
-        print("\n[Orchestrator Summary]:")
-        print(result.final_output)
+        return 1
+
+    sheets = split_sheets(file_path)
+
+    groups = group_by_schema(sheets)
+    print(
+        f"--- {len(sheets)} sheets in {len(groups)} schema groups for {file_path} ---"
+    )
+    limit = asyncio.Semaphore(max_concurrency)
+
+    async def clean_sheet(name: str) -> None:
+        async with limit:
+            await run_agentic_pipeline(
+                str(sheets[name]["path"]),
+                checkpoint=checkpoint,
+                run_config=run_config,
+                progress=progress,
+                server=server,
+                budget=budget,
+            )
+
+    async def clean_group(names: list[str]) -> None:
+        leader, *followers = names
+        await clean_sheet(leader)
+        recipe = load_recipe(sheets[leader]["path"])
+        for name in followers:
+            replayed = await asyncio.to_thread(
+                replay_sheet, file_path, leader, recipe, sheets[name]["path"]
+            )
+            if replayed:
+                print(f"[workbook] Sheet '{name}' replayed the recipe of '{leader}'")
+            else:
+                await clean_sheet(name)
+
+    await asyncio.gather(*(clean_group(names) for names in groups))
+    merge_sheets(file_path, sheets)
+    return len(sheets)
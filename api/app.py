@@ -1,13 +1,26 @@
 import asyncio
+import json
 import shutil
 import uuid
 from pathlib import Path
 
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
-from main import main  # your async function: async def main(file_path: str)
+import metrics
+from lazy_imports import lazy_import
+from storage import ArtifactStore
+
+# The pipeline, pandas and the download formats load with the first request
+# that needs them, so the server starts (and answers /hello) without them.
+downloads = lazy_import("downloads")
+pipeline = lazy_import("main")  # async def main(file_path: str, progress=None)
+progress = lazy_import("progress")
+snapshots = lazy_import("snapshots")
+
+# Metrics recorded by the processes of an earlier server lifetime.
+metrics.clear_stale()
 
 app = FastAPI()
 
@@ -26,13 +39,145 @@ def hello():
     return {"message": "Hello from Python backend!"}
 
 
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus metrics of this server and of every runner and MCP server
+    process on the host (see metrics.py)."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 # Folder where uploaded files will be stored
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# Uploads and their results are compressed when idle and evicted by age and
+# total size; files of requests in progress are leased (see storage.py).
+store = ArtifactStore(UPLOAD_DIR)
+
+# One lock per download artifact, so concurrent requests produce it once.
+_artifact_locks: dict[Path, asyncio.Lock] = {}
+
+
+async def download_response(
+    request: Request,
+    path: Path,
+    download_name: str,
+    format: str | None = None,
+    sheet: str | None = None,
+) -> FileResponse:
+    """Serve a result in the format the request asks for (see downloads.py).
+
+    FileResponse streams the file and answers Range requests, so large
+    downloads can be resumed or fetched in parts.
+    """
+    try:
+        fmt, encoded = downloads.negotiate(
+            format,
+            request.headers.get("accept"),
+            request.headers.get("accept-encoding"),
+        )
+    except downloads.NotAcceptable as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+    target = downloads.artifact_path(path, fmt, sheet)
+    lock = _artifact_locks.setdefault(target, asyncio.Lock())
+    try:
+        async with lock:
+            artifact = await asyncio.to_thread(downloads.ensure_artifact, path, fmt, sheet)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    spec = downloads.FORMATS[fmt]
+    stem = download_name.removesuffix(Path(download_name).suffix)
+    if encoded:
+        return FileResponse(
+            path=artifact,
+            filename=f"{stem}.csv",
+            media_type="text/csv",
+            headers={"Content-Encoding": spec.codec, "Vary": "Accept, Accept-Encoding"},
+        )
+    return FileResponse(
+        path=artifact,
+        filename=f"{stem}{spec.suffix}",
+        media_type=spec.media_type,
+        headers={"Vary": "Accept, Accept-Encoding"},
+    )
+
+
+@app.get("/results/{file_name}")
+async def download_result(
+    request: Request, file_name: str, format: str | None = None, sheet: str | None = None
+):
+    """Download a cleaned result as xlsx, csv.gz, csv.zst or parquet.
+
+    The format is `format` if given, else negotiated from the Accept header.
+    """
+    path = await asyncio.to_thread(store.materialize, UPLOAD_DIR / Path(file_name).name)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+    return await download_response(request, path, file_name, format, sheet)
+
+
+# How often the event stream checks for new events, and sends a keep-alive
+# comment when there are none.
+EVENTS_POLL_SECONDS = 0.5
+EVENTS_KEEPALIVE_SECONDS = 15
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(request: Request, job_id: str):
+    """Stream the progress events of a job as server-sent events.
+
+    Works for runner jobs and for uploads made with a `job_id`. Events already
+    emitted are replayed first, after the Last-Event-ID if the client resumes;
+    the stream ends with the job_finished event.
+    """
+    path = progress.events_path(Path(job_id).name)
+    last_seq = int(request.headers.get("last-event-id") or 0)
+
+    async def stream():
+        offset, idle = 0, 0.0
+        while not await request.is_disconnected():
+            lines = []
+            if path.exists():
+                with path.open() as f:
+                    f.seek(offset)
+                    chunk = f.read()
+                # Only complete lines; a partial one is read on the next poll.
+                complete = chunk[: chunk.rfind("\n") + 1]
+                offset += len(complete.encode())
+                lines = complete.splitlines()
+            for line in lines:
+                event = json.loads(line)
+                if event["seq"] <= last_seq:
+                    continue
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {line}\n\n"
+                if event["type"] == progress.FINAL_EVENT:
+                    return
+            if lines:
+                idle = 0.0
+            elif idle >= EVENTS_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
+            idle += EVENTS_POLL_SECONDS
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/upload/")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(
+    request: Request,
+    file: UploadFile = File(...),
+    format: str | None = None,
+    job_id: str | None = None,
+):
+    """Clean an uploaded file and return it. With a `job_id`, the progress of
+    the pipeline can be followed at /jobs/{job_id}/events meanwhile."""
     # 1) Basic validation
     if not file.filename:
         raise HTTPException(status_code=400, detail="Missing filename")
@@ -41,23 +186,35 @@ async def upload_file(file: UploadFile = File(...)):
     unique_name = f"{uuid.uuid4()}_{file.filename}"
     saved_path = UPLOAD_DIR / unique_name
 
-    try:
-        # 3) Save uploaded file to disk
-        with saved_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # 4) Run your async pipeline on the saved file or sleep
-        if file.filename.lower().endswith((".xlsx", ".xls")):
-            await main(str(saved_path))
-        else:
-            await asyncio.sleep(8)
+    # Make room for the upload first
+    await asyncio.to_thread(store.gc)
+    await asyncio.to_thread(snapshots.prune)
 
-        # 5) Return the file
-        return FileResponse(
-            path=saved_path,
-            filename=f"cleaned_{file.filename}",
-            media_type="application/octet-stream",
-        )
+    try:
+        with store.lease(saved_path), snapshots.scope(saved_path):
+            # 3) Save uploaded file to disk
+            with saved_path.open("wb") as buffer:
+                shutil.copyfileobj(file.file, buffer)
+
+            # 4) Run your async pipeline on the saved file or sleep
+            if file.filename.lower().endswith((".xlsx", ".xls")):
+                if job_id:
+                    async with progress.ProgressReporter(Path(job_id).name) as reporter:
+                        try:
+                            await pipeline.main(str(saved_path), progress=reporter)
+                        except Exception as e:
+                            await reporter.complete({"status": "FAILED", "errorMessage": str(e)[:500]})
+                            raise
+                        await reporter.complete({"status": "SUCCEEDED"})
+                else:
+                    await pipeline.main(str(saved_path))
+            else:
+                await asyncio.sleep(8)
+
+            # 5) Return the file, in the format the client asked for
+            return await download_response(
+                request, saved_path, f"cleaned_{file.filename}", format
+            )
 
     except HTTPException:
         # Re-raise FastAPI HTTP errors untouched
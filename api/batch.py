@@ -0,0 +1,335 @@
+"""
+Batch Runs
+==========
+Cleans a directory or a manifest of files in one runner process, for
+backfills of archives that would otherwise cost a runner launch and an MCP
+server start per file:
+
+    python api/runner.py --batch <directory|manifest> \
+        [--output-dir <dir>] [--results <results.json>] \
+        [--concurrency 4] [--priority bulk|interactive]
+
+  - up to BATCH_CONCURRENCY pipelines run at the same time, and all of them
+    call the tools of one MCP server, started and warmed up once. Files
+    waiting for their turn are counted by the pipeline_jobs_queued metric;
+  - files are grouped by schema (the labels of their likely header row, as
+    for the sheets of a workbook): the first file of a group runs the agent
+    pipeline, the others replay its recipe without model calls. A file whose
+    columns do not match the recipe after all gets its own pipeline run;
+  - the results manifest lists every file with its status, how it was
+    cleaned, its outputs and timings, and the throughput of the batch in
+    files per hour. It is rewritten after every file: started again with the
+    same results, a batch skips the files that already succeeded, and failed
+    files resume from their checkpoint.
+
+A manifest is a text file with one path per line (relative to the manifest,
+blank lines and '#' comments skipped) or a JSON list of paths. A directory
+contributes the data files directly inside it. Cleaned files are written to
+the output directory (`<source>/cleaned` by default) as cleaned_<name>, with
+their recipe next to them.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import checkpoints
+import metrics
+import snapshots
+from agents import RunConfig
+from agents_pipeline import run_workbook_pipeline, tool_server
+from budgets import JOB_DEADLINE_SECONDS, JOB_TOKEN_BUDGET, JobBudget
+from model_scheduler import MODEL_SCHEDULER, ModelScheduler, ScheduledModelProvider
+from readers import DELIMITERS, EXCEL_SUFFIXES, JSON_SUFFIXES, NDJSON_SUFFIXES
+from recipe import load_recipe, recipe_path, replay, save_recipe
+from storage import replacing, working_copy
+from table_io import is_excel, read_table
+from workbook import (
+    SIGNATURE_SCAN_ROWS,
+    data_sheet_names,
+    discard_sheets,
+    has_sheet_checkpoint,
+    load_with_header,
+    schema_signature,
+)
+
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+# Seconds a tool call may take on the shared server, where the calls of
+# every pipeline of the batch queue for its workers.
+BATCH_TOOL_TIMEOUT = float(os.environ.get("BATCH_TOOL_TIMEOUT", "300"))
+
+DATA_SUFFIXES = EXCEL_SUFFIXES | JSON_SUFFIXES | NDJSON_SUFFIXES | set(DELIMITERS)
+# Files the pipeline leaves next to its working files.
+ARTIFACT_MARKERS = (".recipe.", ".manifest.", ".checkpoint.")
+
+
+def batch_files(source: str | Path) -> list[Path]:
+    """The files of a batch: the data files of a directory, or the paths
+    listed in a manifest."""
+    source = Path(source)
+    if source.is_dir():
+        return sorted(
+            path
+            for path in source.iterdir()
+            if path.is_file()
+            and path.suffix.lower() in DATA_SUFFIXES
+            and not path.name.startswith(".")
+            and not any(marker in path.name for marker in ARTIFACT_MARKERS)
+        )
+    text = source.read_text()
+    if source.suffix.lower() == ".json":
+        entries = json.loads(text)
+    else:
+        entries = [line.strip() for line in text.splitlines()]
+        entries = [line for line in entries if line and not line.startswith("#")]
+    return [(source.parent / entry).resolve() for entry in entries]
+
+
+def file_signature(path: Path) -> tuple[str, ...]:
+    """The schema of a file for reusing decisions; empty (no reuse) for
+    workbooks with several data sheets and unreadable files."""
+    try:
+        if is_excel(str(path)) and len(data_sheet_names(path)) > 1:
+            return ()
+        return schema_signature(read_table(str(path), header=None, nrows=SIGNATURE_SCAN_ROWS))
+    except Exception:
+        return ()
+
+
+def replay_file(recipe: dict, leader: Path, src: Path, cleaned_path: Path) -> bool:
+    """Clean `src` into `cleaned_path` with the recipe of the `leader` file of
+    its schema. Returns False, writing nothing, if the recipe's header does not
+    yield the same columns on both."""
+    expected = load_with_header(leader, recipe, nrows=0)
+    actual = load_with_header(src, recipe, nrows=0)
+    if list(actual.columns) != list(expected.columns):
+        return False
+    replay(recipe, str(src), str(cleaned_path))
+    save_recipe(cleaned_path, {**recipe, "source": src.name})
+    return True
+
+
+class BatchResults:
+    """The results manifest of a batch, rewritten after every file."""
+
+    def __init__(self, path: Path, source: Path, files: list[Path]):
+        self.path = path
+        previous = {}
+        if path.exists():
+            previous = {entry["file"]: entry for entry in json.loads(path.read_text())["files"]}
+        self.started = time.monotonic()
+        self.data = {
+            "source": str(source),
+            "startedAt": datetime.now(timezone.utc).isoformat(),
+            "files": [previous.get(str(f), {"file": str(f), "status": "PENDING"}) for f in files],
+        }
+        self._entries = {entry["file"]: entry for entry in self.data["files"]}
+        self.cleaned = 0
+
+    def succeeded(self, path: Path) -> bool:
+        entry = self._entries[str(path)]
+        return entry["status"] == "SUCCEEDED" and Path(entry["cleanedFile"]).exists()
+
+    def record(self, path: Path, status: str, **fields) -> None:
+        """Replace the entry of a file, e.g. a failure of an earlier batch."""
+        entry = self._entries[str(path)]
+        entry.clear()
+        entry.update(file=str(path), status=status, **fields)
+        self.cleaned += status == "SUCCEEDED"
+        self.save()
+
+    def save(self) -> None:
+        entries = self.data["files"]
+        statuses = [entry["status"] for entry in entries]
+        seconds = time.monotonic() - self.started
+        self.data["summary"] = {
+            "files": len(entries),
+            "succeeded": statuses.count("SUCCEEDED"),
+            "failed": statuses.count("FAILED"),
+            "pending": statuses.count("PENDING") + statuses.count("RUNNING"),
+            "pipelineRuns": sum(e.get("mode") == "pipeline" for e in entries),
+            "replays": sum(e.get("mode") == "replay" for e in entries),
+            "seconds": round(seconds, 1),
+            # Of the files cleaned by this run of the batch.
+            "filesPerHour": round(self.cleaned / seconds * 3600, 1) if seconds > 0 else None,
+        }
+        with replacing(self.path) as tmp:
+            Path(tmp).write_text(json.dumps(self.data, indent=2))
+
+
+def _cleaned_paths(files: list[Path], output_dir: Path) -> dict[Path, Path]:
+    """cleaned_<name> in the output directory, numbered when names repeat."""
+    paths, taken = {}, set()
+    for src in files:
+        name, n = f"cleaned_{src.name}", 1
+        while name in taken:
+            n += 1
+            name = f"cleaned_{n}_{src.name}"
+        taken.add(name)
+        paths[src] = output_dir / name
+    return paths
+
+
+@contextlib.asynccontextmanager
+async def _slot(limit: asyncio.Semaphore):
+    """Hold one of the batch's pipeline slots, counted as queued while
+    waiting for it."""
+    queued = metrics.jobs_queued.labels(metrics.METRICS_WORKER)
+    queued.inc()
+    try:
+        await limit.acquire()
+    finally:
+        queued.dec()
+    try:
+        yield
+    finally:
+        limit.release()
+
+
+async def run_batch(
+    source: str | Path,
+    output_dir: str | Path | None = None,
+    results_path: str | Path | None = None,
+    concurrency: int = BATCH_CONCURRENCY,
+    priority: str = "bulk",
+    deadline_seconds: float = JOB_DEADLINE_SECONDS,
+    token_budget: int = JOB_TOKEN_BUDGET,
+) -> dict:
+    """Clean every file of a batch; returns the results manifest. Every
+    pipeline run gets its own deadline and token budget."""
+    source = Path(source).resolve()
+    files = batch_files(source)
+    output_dir = Path(output_dir or (source if source.is_dir() else source.parent) / "cleaned")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results = BatchResults(
+        Path(results_path or output_dir / "batch_results.json"), source, files
+    )
+    cleaned_paths = _cleaned_paths(files, output_dir)
+    pending = [f for f in files if not results.succeeded(f)]
+    signatures = await asyncio.gather(*(asyncio.to_thread(file_signature, f) for f in pending))
+    groups: dict[tuple, list[Path]] = {}
+    for path, signature in zip(pending, signatures):
+        groups.setdefault(signature or (str(path),), []).append(path)
+    print(
+        f"[batch] {len(files)} files ({len(files) - len(pending)} already done), "
+        f"{len(groups)} schemas, {concurrency} at a time -> {output_dir}",
+        flush=True,
+    )
+    results.save()
+    limit = asyncio.Semaphore(concurrency)
+
+    async with tool_server(timeout=BATCH_TOOL_TIMEOUT) as server:
+
+        async def clean(src: Path) -> bool:
+            cleaned_path = cleaned_paths[src]
+            async with _slot(limit):
+                started = time.monotonic()
+                results.record(src, "RUNNING", mode="pipeline")
+                if not (
+                    checkpoints.has_checkpoint(cleaned_path)
+                    or has_sheet_checkpoint(cleaned_path)
+                ):
+                    working_copy(src, cleaned_path)
+                scheduler = (
+                    ModelScheduler(f"batch-{cleaned_path.stem}", lane=priority)
+                    if MODEL_SCHEDULER
+                    else None
+                )
+                run_config = (
+                    RunConfig(model_provider=ScheduledModelProvider(scheduler))
+                    if scheduler
+                    else None
+                )
+                budget = JobBudget(deadline_seconds, token_budget)
+                try:
+                    with snapshots.scope(cleaned_path):
+                        await run_workbook_pipeline(
+                            str(cleaned_path),
+                            checkpoint=True,
+                            run_config=run_config,
+                            server=server,
+                            budget=budget,
+                        )
+                    checkpoints.clear(cleaned_path)
+                except Exception as exc:
+                    if not (
+                        checkpoints.has_checkpoint(cleaned_path)
+                        or has_sheet_checkpoint(cleaned_path)
+                    ):
+                        cleaned_path.unlink(missing_ok=True)
+                    discard_sheets(cleaned_path)
+                    results.record(
+                        src,
+                        "FAILED",
+                        mode="pipeline",
+                        errorMessage=str(exc)[:500],
+                        seconds=round(time.monotonic() - started, 2),
+                    )
+                    print(f"[batch] FAILED {src.name}: {exc}", file=sys.stderr, flush=True)
+                    return False
+            results.record(
+                src,
+                "SUCCEEDED",
+                mode="pipeline",
+                cleanedFile=str(cleaned_path),
+                recipe=str(recipe_path(cleaned_path)),
+                seconds=round(time.monotonic() - started, 2),
+                **budget.result(),
+                **({"modelQueue": scheduler.stats()} if scheduler else {}),
+            )
+            return True
+
+        async def replay_on(leader: Path, src: Path) -> bool:
+            cleaned_path = cleaned_paths[src]
+            async with _slot(limit):
+                started = time.monotonic()
+                try:
+                    replayed = await asyncio.to_thread(
+                        replay_file, load_recipe(cleaned_paths[leader]), leader, src, cleaned_path
+                    )
+                except Exception as exc:
+                    print(f"[batch] Replay on {src.name} failed: {exc}", file=sys.stderr, flush=True)
+                    replayed = False
+            if replayed:
+                results.record(
+                    src,
+                    "SUCCEEDED",
+                    mode="replay",
+                    replayedFrom=str(leader),
+                    cleanedFile=str(cleaned_path),
+                    recipe=str(recipe_path(cleaned_path)),
+                    seconds=round(time.monotonic() - started, 2),
+                )
+            return replayed
+
+        async def clean_group(paths: list[Path]) -> None:
+            # The first file whose pipeline succeeds decides for the rest of
+            # its schema, which then replay its recipe concurrently.
+            for i, leader in enumerate(paths):
+                if await clean(leader):
+                    break
+            else:
+                return
+            followers = paths[i + 1 :]
+            replayed = await asyncio.gather(*(replay_on(leader, src) for src in followers))
+            await asyncio.gather(
+                *(clean(src) for src, done in zip(followers, replayed) if not done)
+            )
+
+        await asyncio.gather(*(clean_group(paths) for paths in groups.values()))
+
+    results.save()
+    summary = results.data["summary"]
+    print(
+        f"[batch] {summary['succeeded']}/{summary['files']} files cleaned "
+        f"({summary['pipelineRuns']} pipeline runs, {summary['replays']} replays, "
+        f"{summary['failed']} failed) in {summary['seconds']}s, "
+        f"{summary['filesPerHour']} files/hour -> {results.path}",
+        flush=True,
+    )
+    return results.data
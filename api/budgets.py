@@ -0,0 +1,144 @@
+"""
+Job Budgets
+===========
+Bounds the time and tokens the agents may spend on a job, so a confused
+orchestrator loop cannot run for minutes and an upload gets its result within
+a known time:
+
+  - JOB_DEADLINE_SECONDS bounds the whole pipeline run (default 20 minutes);
+  - STAGE_DEADLINE_SECONDS bounds every step the orchestrator delegates: the
+    header, NA, reader and description agents, and each column it formats;
+  - JOB_TOKEN_BUDGET bounds the tokens of every model call of the job,
+    sub-agents included (0, the default, for no limit).
+
+0 turns a limit off. The runner takes --deadline and --token-budget per job.
+
+Limits are checked before every model call (`BudgetHooks`), the job deadline
+also cancels a call in flight, and a stage that runs over its deadline fails
+the orchestrator's run. The pipeline then stops calling models and finishes
+the job with local heuristic decisions (see fallback.py); the result lists
+the columns that were finished that way under "degradedColumns".
+"""
+
+import os
+import time
+
+from agents import RunHooks
+
+JOB_DEADLINE_SECONDS = float(os.environ.get("JOB_DEADLINE_SECONDS", "1200"))
+STAGE_DEADLINE_SECONDS = float(os.environ.get("STAGE_DEADLINE_SECONDS", "300"))
+JOB_TOKEN_BUDGET = int(os.environ.get("JOB_TOKEN_BUDGET", "0"))
+
+
+class BudgetExceeded(Exception):
+    """A job ran out of time or tokens."""
+
+
+class JobBudget:
+    """The time and tokens left to the agents of one job."""
+
+    def __init__(
+        self,
+        deadline_seconds: float = JOB_DEADLINE_SECONDS,
+        token_budget: int = JOB_TOKEN_BUDGET,
+        stage_seconds: float = STAGE_DEADLINE_SECONDS,
+    ):
+        self.deadline_seconds = deadline_seconds
+        self.token_budget = token_budget
+        self.stage_seconds = stage_seconds
+        self.started = time.monotonic()
+        self.tokens = 0
+        # Why the agents were stopped, once they were.
+        self.exceeded: str | None = None
+        self.degraded: list[dict] = []
+
+    def remaining(self) -> float | None:
+        """Seconds left before the job deadline, None without one."""
+        if not self.deadline_seconds:
+            return None
+        return max(self.deadline_seconds - (time.monotonic() - self.started), 0.0)
+
+    def check(self) -> None:
+        """Raise BudgetExceeded if the job is out of time or tokens."""
+        if not self.exceeded:
+            if self.remaining() == 0:
+                self.exceeded = f"job deadline of {self.deadline_seconds:g}s reached"
+            elif self.token_budget and self.tokens >= self.token_budget:
+                self.exceeded = f"token budget of {self.token_budget:,} used up"
+        if self.exceeded:
+            raise BudgetExceeded(self.exceeded)
+
+    def limit_hit(self, exc: BaseException) -> str | None:
+        """The limit behind a failed run, or None if it failed for another reason."""
+        if self.exceeded:
+            return self.exceeded
+        if isinstance(exc, TimeoutError) and self.remaining() == 0:
+            self.exceeded = f"job deadline of {self.deadline_seconds:g}s reached"
+        elif getattr(exc, "timeout_seconds", None) is not None:
+            # ToolTimeoutError of a stage tool.
+            self.exceeded = f"stage '{exc.tool_name}' ran over {exc.timeout_seconds:g}s"
+        return self.exceeded
+
+    def bound_stage(self, tool):
+        """Make a stage tool of the orchestrator fail its run after
+        `stage_seconds` (the job deadline bounds it as well)."""
+        if self.stage_seconds:
+            tool.timeout_seconds = self.stage_seconds
+            tool.timeout_behavior = "raise_exception"
+        return tool
+
+    def result(self) -> dict:
+        """The budget's part of a job result."""
+        return {
+            "budget": {
+                "deadlineSeconds": self.deadline_seconds or None,
+                "elapsedSeconds": round(time.monotonic() - self.started, 1),
+                "tokenBudget": self.token_budget or None,
+                "tokens": self.tokens,
+                "limitHit": self.exceeded,
+            },
+            "degradedColumns": self.degraded,
+        }
+
+
+class BudgetHooks(RunHooks):
+    """Run hooks that count the tokens of every model call against a
+    `JobBudget` and stop the agents once it is exceeded.
+
+    Wraps the other hooks of the run, like `ProgressHooks`. Also keeps the
+    reader's answer, which the fallback uses as the column types.
+    """
+
+    def __init__(
+        self,
+        budget: JobBudget,
+        inner: RunHooks | None = None,
+        column_types: str | None = None,
+    ):
+        self.budget = budget
+        self.inner = inner
+        self.column_types = column_types
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items) -> None:
+        if self.inner:
+            await self.inner.on_llm_start(context, agent, system_prompt, input_items)
+        self.budget.check()
+
+    async def on_llm_end(self, context, agent, response) -> None:
+        if self.inner:
+            await self.inner.on_llm_end(context, agent, response)
+        self.budget.tokens += response.usage.total_tokens
+
+    async def on_tool_start(self, context, agent, tool) -> None:
+        if self.inner:
+            await self.inner.on_tool_start(context, agent, tool)
+
+    async def on_tool_end(self, context, agent, tool, result) -> None:
+        if self.inner:
+            await self.inner.on_tool_end(context, agent, tool, result)
+        if tool.name == "reader_agent" and isinstance(result, str):
+            self.column_types = result
+
+    def column_done(self, *col_names: str) -> None:
+        if self.inner:
+            self.inner.column_done(*col_names)
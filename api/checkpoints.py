@@ -0,0 +1,216 @@
+"""
+Pipeline Checkpoints
+====================
+Stage-level checkpoints so a failed job can resume instead of starting over.
+
+After every completed stage (header, NA cleaning, deduplication, column
+classification, each formatted column, description) the working file is
+snapshotted next to itself and a JSON manifest records what has been done:
+
+    <working>.manifest.json
+    <working stem>.checkpoint<suffix>
+
+When a job is resubmitted, the snapshot is restored over the working file and
+the orchestrator is told which steps to skip.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from agents import RunHooks
+from recipe import operation_count, truncate_operations
+from storage import replacing, working_copy
+
+MANIFEST_VERSION = 1
+
+# Tools whose successful completion marks a whole stage as done.
+STAGE_TOOLS = {
+    "apply_header_and_crop": "header",
+    "execute_na_cleaning": "na",
+    "execute_deduplication": "dedup",
+    "reader_agent": "read",
+    "execute_dataset_description": "describe",
+}
+COLUMN_TOOLS = {
+    "execute_time_formatting",
+    "execute_money_formatting",
+    "execute_int_formatting",
+    "execute_float_formatting",
+    "execute_name_formatting",
+    "execute_category_normalization",
+}
+STAGE_LABELS = {
+    "header": "STEP 1 - SCOUT",
+    "na": "STEP 2 - SWEEP",
+    "dedup": "STEP 2 - SWEEP (deduplication)",
+    "read": "STEP 3 - READ",
+    "describe": "STEP 5 - DESCRIBE",
+}
+
+
+def manifest_path(file_path: str | Path) -> Path:
+    path = Path(file_path)
+    return path.with_name(f"{path.name}.manifest.json")
+
+
+def snapshot_path(file_path: str | Path) -> Path:
+    path = Path(file_path)
+    return path.with_name(f"{path.stem}.checkpoint{path.suffix}")
+
+
+def _new_manifest(file_path: str | Path) -> dict:
+    return {
+        "version": MANIFEST_VERSION,
+        "file": Path(file_path).name,
+        "completed": [],
+        "column_types": None,
+        "columns_done": [],
+        "recipe_operations": 0,
+        "snapshot": None,
+        "updated_at": None,
+    }
+
+
+def load_manifest(file_path: str | Path) -> dict | None:
+    """Return the manifest of a working file, or None if there is no usable one."""
+    path = manifest_path(file_path)
+    if not path.exists():
+        return None
+    try:
+        manifest = json.loads(path.read_text())
+    except (OSError, json.JSONDecodeError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def has_checkpoint(file_path: str | Path) -> bool:
+    manifest = load_manifest(file_path)
+    return bool(manifest and manifest["snapshot"] and snapshot_path(file_path).exists())
+
+
+def restore(file_path: str | Path) -> dict | None:
+    """Copy the last snapshot back over the working file and return the manifest."""
+    if not has_checkpoint(file_path):
+        return None
+    with replacing(file_path) as tmp_path:
+        working_copy(snapshot_path(file_path), tmp_path)
+    manifest = load_manifest(file_path)
+    # Operations recorded after the snapshot are about to be redone.
+    truncate_operations(file_path, manifest["recipe_operations"])
+    return manifest
+
+
+def save(file_path: str | Path, manifest: dict) -> None:
+    """Snapshot the working file and persist the manifest atomically."""
+    snapshot = snapshot_path(file_path)
+    # Writers replace the working file instead of modifying it, so the
+    # snapshot can share its blocks (or inode) rather than copy them.
+    with replacing(snapshot) as tmp_snapshot:
+        working_copy(file_path, tmp_snapshot)
+
+    manifest["snapshot"] = snapshot.name
+    manifest["recipe_operations"] = operation_count(file_path)
+    manifest["updated_at"] = datetime.now(timezone.utc).isoformat()
+    path = manifest_path(file_path)
+    tmp_manifest = path.with_name(f".{path.name}.tmp")
+    tmp_manifest.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_manifest, path)
+
+
+def clear(file_path: str | Path) -> None:
+    """Remove the snapshot and manifest once a job has finished."""
+    snapshot_path(file_path).unlink(missing_ok=True)
+    manifest_path(file_path).unlink(missing_ok=True)
+
+
+def tool_columns(tool_arguments: str) -> list[str]:
+    """The columns a column tool call formats: `col_name` and the rest of its
+    group (`also_apply_to`). Empty if the arguments cannot be read."""
+    try:
+        arguments = json.loads(tool_arguments)
+        return [arguments["col_name"], *(arguments.get("also_apply_to") or [])]
+    except (AttributeError, TypeError, KeyError, json.JSONDecodeError):
+        return []
+
+
+def tool_output_text(result) -> str | None:
+    """The text of a tool result as the run hooks receive it: a string from a
+    function tool or agent-as-tool, a {"type": "text", "text": ...} item (or a
+    list of them) from an MCP tool. None if it holds no text."""
+    if isinstance(result, str):
+        return result
+    items = result if isinstance(result, list) else [result]
+    texts = []
+    for item in items:
+        text = item.get("text") if isinstance(item, dict) else getattr(item, "text", None)
+        if isinstance(text, str):
+            texts.append(text)
+    return "\n".join(texts) if texts else None
+
+
+def resume_instructions(manifest: dict | None) -> str:
+    """Describe the already completed work to the orchestrator."""
+    if not manifest or not (manifest["completed"] or manifest["columns_done"]):
+        return ""
+    lines = [
+        "RESUMING A PREVIOUS RUN. The working file already contains the results "
+        "of the steps below. Do NOT repeat them; continue with the first "
+        "unfinished step."
+    ]
+    done = [STAGE_LABELS[s] for s in STAGE_LABELS if s in manifest["completed"]]
+    if done:
+        lines.append(f"   - Completed steps: {', '.join(done)}.")
+    if manifest["column_types"]:
+        lines.append(
+            "   - STEP 3 column types (do not call reader_agent again): "
+            f"{manifest['column_types']}"
+        )
+    if manifest["columns_done"]:
+        lines.append(
+            "   - STEP 4 columns already formatted (skip them): "
+            f"{json.dumps(manifest['columns_done'])}"
+        )
+    return "\n".join(lines)
+
+
+class CheckpointHooks(RunHooks):
+    """Run hooks that checkpoint the working file after every completed step.
+
+    Must be passed to the orchestrator run and to every agent-as-tool so that
+    MCP tool calls made by sub-agents are seen as well.
+    """
+
+    def __init__(self, file_path: str, manifest: dict | None = None):
+        self.file_path = file_path
+        self.manifest = manifest or _new_manifest(file_path)
+
+    async def on_tool_end(self, context, agent, tool, result) -> None:
+        result = tool_output_text(result)
+        if result is None or result.startswith("Error"):
+            return
+        name = tool.name
+        if name in STAGE_TOOLS:
+            stage = STAGE_TOOLS[name]
+            if stage == "read":
+                self.manifest["column_types"] = result.strip()
+            if stage not in self.manifest["completed"]:
+                self.manifest["completed"].append(stage)
+        elif name in COLUMN_TOOLS:
+            columns = tool_columns(getattr(context, "tool_arguments", None))
+            if columns:
+                self.column_done(*columns)
+            return
+        else:
+            return
+        save(self.file_path, self.manifest)
+
+    def column_done(self, *col_names: str) -> None:
+        """Checkpoint formatted columns, also when formatted outside an agent."""
+        for col_name in col_names:
+            if col_name not in self.manifest["columns_done"]:
+                self.manifest["columns_done"].append(col_name)
+        save(self.file_path, self.manifest)
@@ -0,0 +1,174 @@
+"""
+Column Groups
+=============
+Wide tables often repeat one column shape hundreds of times: generated data
+with 300 `%Y-%m-%d` columns, sensor exports with one reading column per
+device. Classifying and formatting them one by one costs a model call and a
+tool call per column, so columns of the same shape are grouped and handled
+once:
+
+  - `profile_columns(group_similar=True)` profiles one column per group and
+    lists the others under its `same_shape`, and the reader classifies it
+    once;
+  - the reader's answer gets the groups appended (`group_reader_answer`),
+    and the orchestrator formats every group with one call, passing the other
+    columns as `also_apply_to`;
+  - the formatting tools decide once, on the values of the whole group, and
+    transform all its columns at once (`transforms.format_columns`).
+
+The signature of a column is computed on SIGNATURE_SAMPLE_ROWS rows spread
+over the table, from:
+
+  - its kind: empty, bool, datetime, int or float (with sign and order of
+    magnitude) or text;
+  - for text, the shapes of its values, digits and letters collapsed to '9'
+    and 'a' ('2024-01-31' -> '9-9-9', '$1,200.50' -> '$9,9.9'), keeping the
+    most frequent shapes that cover SHAPE_COVERAGE of the values;
+  - few or many distinct values;
+  - the column name with its numbering removed ('device_017' -> 'device',
+    '2024 Q3 sales' -> 'q sales'). Values alone cannot tell a city from a
+    customer name, or an amount from a ratio, so columns are only grouped
+    when they are numbered variants of one name (or all unnamed, like the
+    0..n columns of a headerless export).
+
+GROUP_COLUMNS=0 turns grouping off.
+"""
+
+import json
+import math
+import os
+import re
+
+import pandas as pd
+from pandas.api.types import (
+    is_bool_dtype,
+    is_datetime64_any_dtype,
+    is_integer_dtype,
+    is_numeric_dtype,
+)
+from table_io import read_table
+
+GROUP_COLUMNS = os.environ.get("GROUP_COLUMNS", "1") != "0"
+SIGNATURE_SAMPLE_ROWS = 5000
+SIGNATURE_MAX_DISTINCT = 1000
+SHAPE_COVERAGE = 0.9
+MAX_SHAPES = 4
+# A column with at most this share of distinct values counts as "few".
+FEW_DISTINCT_RATIO = 0.5
+
+_NUMBERING_RE = re.compile(r"[\s._#-]*\d+")
+
+
+def _name_stem(col) -> str:
+    return _NUMBERING_RE.sub("", str(col)).strip().lower()
+
+
+def _sample(df: pd.DataFrame) -> pd.DataFrame:
+    step = max(len(df) // SIGNATURE_SAMPLE_ROWS, 1)
+    return df.iloc[::step]
+
+
+def _shapes(counts: pd.Series) -> list[str]:
+    """The most frequent value shapes covering SHAPE_COVERAGE of the values."""
+    shapes = (
+        counts.index.to_series()
+        .str.replace(r"\d+", "9", regex=True)
+        .str.replace(r"[^\W\d_]+", "a", regex=True)
+        .str.replace(r"\s+", " ", regex=True)
+    )
+    shares = counts.groupby(shapes.values).sum().sort_values(ascending=False)
+    shares = shares / shares.sum()
+    kept = shares[(shares.cumsum() - shares) < SHAPE_COVERAGE].head(MAX_SHAPES)
+    return sorted(kept.index)
+
+
+def column_signature(series: pd.Series) -> str:
+    """The shape signature of a column (see the module docstring)."""
+    values = series.dropna()
+    if not len(values):
+        return "empty"
+    if is_bool_dtype(series):
+        return "bool"
+    if is_datetime64_any_dtype(series):
+        return "datetime"
+    distinct = values.nunique()
+    cardinality = "few" if distinct <= len(values) * FEW_DISTINCT_RATIO else "many"
+    if is_numeric_dtype(series):
+        kind = "int" if is_integer_dtype(series) or (values % 1 == 0).all() else "float"
+        sign = "neg" if values.min() < 0 else "pos"
+        median = float(values.abs().median())
+        magnitude = math.floor(math.log10(median)) if median > 0 else 0
+        return f"{kind}:{sign}:e{magnitude}:{cardinality}"
+    text = values.astype(str).str.strip()
+    counts = text[text != ""].value_counts().head(SIGNATURE_MAX_DISTINCT)
+    if not len(counts):
+        return "empty"
+    return f"text:{'|'.join(_shapes(counts))}:{cardinality}"
+
+
+def group_columns(df: pd.DataFrame) -> dict[str, list[str]]:
+    """Groups of columns sharing a signature, as {first column: the others}.
+
+    Columns without a peer are left out; the order of the table is kept.
+    """
+    if not GROUP_COLUMNS:
+        return {}
+    sample = _sample(df)
+    by_signature: dict[str, list[str]] = {}
+    for i, col in enumerate(df.columns):
+        signature = f"{_name_stem(col)}:{column_signature(sample.iloc[:, i])}"
+        by_signature.setdefault(signature, []).append(str(col))
+    return {cols[0]: cols[1:] for cols in by_signature.values() if len(cols) > 1}
+
+
+def grouped_types(types: dict[str, str], groups: dict[str, list[str]]) -> dict:
+    """Combine the reader's column types with the column groups.
+
+    A column the reader classified differently from its group's first column
+    leaves the group. Returns {"types": ..., "groups": ...} where "types" has
+    one entry per group and per ungrouped column.
+    """
+    kept_types = dict(types)
+    kept_groups = {}
+    for leader, members in groups.items():
+        if leader not in types:
+            continue
+        same = [m for m in members if types.get(m, types[leader]) == types[leader]]
+        for member in same:
+            kept_types.pop(member, None)
+        if same:
+            kept_groups[leader] = same
+    return {"types": kept_types, "groups": kept_groups}
+
+
+def parse_types(text: str) -> dict | None:
+    """The JSON object in an agent's answer, which may wrap it in prose or a
+    code fence; None if there is none."""
+    start, end = text.find("{"), text.rfind("}")
+    try:
+        parsed = json.loads(text[start : end + 1])
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def group_reader_answer(file_path: str, answer: str) -> str:
+    """The reader's answer as `grouped_types` JSON for the columns of
+    `file_path`; unchanged if it has no groups or no JSON mapping."""
+    types = parse_types(answer)
+    groups = group_columns(read_table(file_path)) if types else {}
+    if not groups:
+        return answer
+    return json.dumps(grouped_types(types, groups), ensure_ascii=False)
+
+
+def expand_types(answer: str) -> dict[str, str]:
+    """The type of every column from the reader's answer, the columns of a
+    group typed like its first column."""
+    parsed = parse_types(answer) or {}
+    if not isinstance(parsed.get("types"), dict):
+        return parsed
+    types = dict(parsed["types"])
+    for leader, members in (parsed.get("groups") or {}).items():
+        types.update(dict.fromkeys(members, types.get(leader)))
+    return types
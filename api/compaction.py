@@ -0,0 +1,99 @@
+"""
+Compact DataFrames
+==================
+Tables are compacted right after they are loaded, so that wide files with
+millions of rows fit in a worker's memory:
+
+  - text columns with few distinct values (statuses, country and currency
+    codes) become categoricals,
+  - other text columns use Arrow-backed strings instead of Python objects,
+  - integer columns are downcast to the smallest type that holds them, and
+    float columns to float32 when that loses nothing.
+
+Columns mixing text and numbers keep their values; they are only made
+categorical. Every stage logs the memory of its frame to stderr (stdout is the
+MCP transport).
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import (
+    is_bool_dtype,
+    is_float_dtype,
+    is_integer_dtype,
+    is_object_dtype,
+    is_string_dtype,
+)
+
+COMPACT_FRAMES = os.environ.get("COMPACT_FRAMES", "1") != "0"
+MEMORY_REPORT = os.environ.get("MEMORY_REPORT", "1") != "0"
+
+# A text column becomes categorical when its distinct values are at most this
+# share of its filled cells, and not more than CATEGORY_MAX_DISTINCT.
+CATEGORY_MAX_RATIO = 0.5
+CATEGORY_MAX_DISTINCT = 50_000
+
+
+def memory_mb(df: pd.DataFrame) -> float:
+    """Deep memory use of a frame in MiB."""
+    return float(df.memory_usage(deep=True, index=True).sum()) / 2**20
+
+
+def _compact_text(col: pd.Series) -> pd.Series:
+    filled = col.count()
+    if filled:
+        distinct = col.nunique(dropna=True)
+        if distinct <= CATEGORY_MAX_DISTINCT and distinct <= filled * CATEGORY_MAX_RATIO:
+            return col.astype("category")
+    if is_object_dtype(col.dtype):
+        values = col.dropna()
+        if len(values) and values.map(type).eq(str).all():
+            return col.astype("str")
+    return col
+
+
+def _compact_float(col: pd.Series) -> pd.Series:
+    if col.dtype == np.float32:
+        return col
+    narrow = col.astype(np.float32)
+    if np.array_equal(narrow.to_numpy(np.float64), col.to_numpy(np.float64), equal_nan=True):
+        return narrow
+    return col
+
+
+def compact_column(col: pd.Series) -> pd.Series:
+    """Return a column in its most compact lossless representation."""
+    if isinstance(col.dtype, pd.CategoricalDtype) or is_bool_dtype(col.dtype):
+        return col
+    if is_integer_dtype(col.dtype):
+        signed = col.dtype.kind == "i" or col.min() < 0
+        return pd.to_numeric(col, downcast="integer" if signed else "unsigned")
+    if is_float_dtype(col.dtype):
+        return _compact_float(col)
+    if is_object_dtype(col.dtype) or is_string_dtype(col.dtype):
+        return _compact_text(col)
+    return col
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Compact every column of a frame (see the module docstring)."""
+    df = df.copy(deep=False)
+    for i in range(df.shape[1]):
+        df.isetitem(i, compact_column(df.iloc[:, i]))
+    return df
+
+
+def log_memory(stage: str, df: pd.DataFrame, before_mb: float | None = None) -> None:
+    """Log a frame's memory for one pipeline stage."""
+    if not MEMORY_REPORT:
+        return
+    change = f"{before_mb:.1f} MiB -> " if before_mb is not None else ""
+    print(
+        f"[memory] {stage}: {change}{memory_mb(df):.1f} MiB "
+        f"({df.shape[0]:,} rows x {df.shape[1]} columns)",
+        file=sys.stderr,
+        flush=True,
+    )
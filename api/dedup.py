@@ -0,0 +1,199 @@
+"""
+Duplicate Rows
+==============
+Vectorized detection of duplicate rows, in time linear in the number of rows.
+
+  - Exact duplicates share the 64-bit hash of all their cells.
+  - Near-duplicates are compared on normalized cells: case and whitespace are
+    ignored, numbers are compared by value and IDs by their prefix and
+    number, so 'TXN-000095' matches 'txn 95' (but not 'INV-95' or '95'). With `similarity_threshold=1.0` rows must agree
+    on every normalized cell, which is again a single hash per row.
+  - Below 1.0, rows are blocked with MinHash/LSH over their (column, value)
+    pairs and only rows sharing an LSH bucket are compared, never all pairs.
+
+Duplicate groups are returned as one label per row: the position of the
+group's first row, or -1 for rows without duplicates.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+from transforms import map_distinct
+
+# MinHash signature = LSH_BANDS bands of LSH_ROWS hashes each. With 16 x 4,
+# rows with a Jaccard similarity of 0.8 share a bucket with ~99.9% chance.
+LSH_BANDS = 16
+LSH_ROWS = 4
+# Buckets larger than this (e.g. rows that only share constant columns) are
+# compared against their first row only up to this many members.
+LSH_MAX_BUCKET = 1000
+# Signatures are computed on this many rows at a time to bound temporaries.
+LSH_CHUNK_ROWS = 1_000_000
+
+_ID_RE = re.compile(r"^([a-z]{0,8})[\s\-_#:/]*0*(\d+)$")
+_SPACES_RE = re.compile(r"\s+")
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _normalize_value(val) -> str:
+    if val is None or (not isinstance(val, str) and pd.isna(val)):
+        return ""
+    if isinstance(val, (int, float, np.integer, np.floating)) and not isinstance(val, bool):
+        return format(float(val), ".10g")
+    text = _SPACES_RE.sub(" ", str(val).strip().lower())
+    id_match = _ID_RE.match(text)
+    if id_match:
+        return id_match.group(1) + id_match.group(2)
+    try:
+        return format(float(text.replace(",", "")), ".10g")
+    except ValueError:
+        return text
+
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize every cell for near-duplicate comparison (once per distinct value)."""
+    columns = {
+        i: map_distinct(df.iloc[:, i], _normalize_value) for i in range(df.shape[1])
+    }
+    return pd.DataFrame(columns, index=df.index)
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """64-bit hash of every row's cells."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def _cell_hashes(df: pd.DataFrame) -> np.ndarray:
+    """(rows, columns) matrix of cell hashes, distinct per column."""
+    hashes = np.empty(df.shape, dtype=np.uint64)
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        hashes[:, i] = _mix(
+            pd.util.hash_pandas_object(col, index=False).to_numpy() ^ np.uint64(i + 1)
+        )
+    return hashes
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, vectorized."""
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return (x ^ (x >> np.uint64(31))) & _MASK64
+
+
+def _labels_from_keys(keys: np.ndarray) -> np.ndarray:
+    """Label rows sharing a key with the position of the first of them."""
+    codes, _ = pd.factorize(keys)
+    first = np.full(codes.max() + 1 if len(codes) else 0, len(codes), dtype=np.int64)
+    np.minimum.at(first, codes, np.arange(len(codes)))
+    labels = first[codes]
+    counts = np.bincount(codes)
+    labels[counts[codes] == 1] = -1
+    return labels
+
+
+def _connected_labels(n: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Label rows connected by the (left, right) edges with their smallest row."""
+    labels = np.arange(n)
+    if len(left):
+        while True:
+            low = np.minimum(labels[left], labels[right])
+            updated = labels.copy()
+            np.minimum.at(updated, left, low)
+            np.minimum.at(updated, right, low)
+            updated = updated[updated]
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+    in_group = np.bincount(labels, minlength=n)[labels] > 1
+    return np.where(in_group, labels, -1)
+
+
+def _bucket_pairs(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Pair every row of an LSH bucket with the first row of that bucket."""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.r_[0, np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1]
+    bucket_start = np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+    rank = np.arange(len(keys)) - bucket_start
+    member = (rank > 0) & (rank < LSH_MAX_BUCKET)
+    return order[bucket_start[member]], order[member]
+
+
+def _lsh_candidates(cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Candidate pairs of rows whose MinHash signatures share a band."""
+    rng = np.random.default_rng(0)
+    seeds = rng.integers(1, 2**63, size=(LSH_BANDS, LSH_ROWS), dtype=np.uint64)
+    left, right = [], []
+    for band in range(LSH_BANDS):
+        key = np.zeros(len(cells), dtype=np.uint64)
+        for start in range(0, len(cells), LSH_CHUNK_ROWS):
+            chunk = cells[start : start + LSH_CHUNK_ROWS]
+            band_key = np.zeros(len(chunk), dtype=np.uint64)
+            for r in range(LSH_ROWS):
+                minhash = _mix(chunk ^ seeds[band, r]).min(axis=1)
+                with np.errstate(over="ignore"):
+                    band_key = _mix(band_key * np.uint64(31) + minhash)
+            key[start : start + LSH_CHUNK_ROWS] = band_key
+        a, b = _bucket_pairs(key)
+        left.append(a)
+        right.append(b)
+    pairs = np.unique(np.stack([np.concatenate(left), np.concatenate(right)]), axis=1)
+    return pairs[0], pairs[1]
+
+
+def exact_duplicate_labels(df: pd.DataFrame) -> np.ndarray:
+    return _labels_from_keys(row_hashes(df))
+
+
+def near_duplicate_labels(
+    df: pd.DataFrame, similarity_threshold: float = 1.0
+) -> np.ndarray:
+    """Label rows that are duplicates after normalization.
+
+    `similarity_threshold` is the share of (column, value) pairs two rows must
+    have in common (Jaccard similarity of their normalized cells).
+    """
+    normalized = normalize_frame(df)
+    if similarity_threshold >= 1.0:
+        return _labels_from_keys(row_hashes(normalized))
+
+    cells = _cell_hashes(normalized)
+    left, right = _lsh_candidates(cells)
+    same = (cells[left] == cells[right]).sum(axis=1)
+    similarity = same / (2 * cells.shape[1] - same)
+    keep = similarity >= similarity_threshold
+    return _connected_labels(len(df), left[keep], right[keep])
+
+
+def find_duplicates(
+    df: pd.DataFrame,
+    near_duplicates: bool = False,
+    similarity_threshold: float = 1.0,
+    ignore_columns: list[str] | None = None,
+) -> np.ndarray:
+    """Return duplicate group labels for the rows of `df` (see module docstring).
+
+    `ignore_columns` are left out of the comparison, e.g. surrogate keys.
+    """
+    if ignore_columns:
+        df = df.drop(columns=[c for c in ignore_columns if c in df.columns])
+    if near_duplicates:
+        return near_duplicate_labels(df, similarity_threshold)
+    return exact_duplicate_labels(df)
+
+
+def duplicate_groups(labels: np.ndarray) -> list[list[int]]:
+    """Row positions of every duplicate group, largest groups first."""
+    rows = np.flatnonzero(labels >= 0)
+    groups = pd.Series(rows).groupby(labels[rows]).agg(list)
+    return sorted(groups.tolist(), key=len, reverse=True)
+
+
+def drop_duplicates(df: pd.DataFrame, labels: np.ndarray) -> pd.DataFrame:
+    """Keep the first row of every duplicate group and all unique rows."""
+    keep = (labels < 0) | (labels == np.arange(len(df)))
+    return df[keep]
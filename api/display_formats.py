@@ -0,0 +1,124 @@
+"""
+Typed Output
+============
+By default the formatting tools write their decisions into the values: floats
+become padded text ('12.50') and dates strftime text ('05/01/2024'). Every
+consumer of the result then has to parse them again, and text takes several
+times the memory and disk of the numbers and dates it spells.
+
+With TYPED_OUTPUT=1 the values keep native dtypes and the decision becomes
+display metadata instead:
+
+  - float columns are rounded to the chosen decimals and stay floats;
+  - date columns stay datetimes, cut to what the format shows (a '%m/%Y'
+    column holds the first of the month). Formats without a date, such as
+    '%H:%M', are still written as text;
+  - integer and money columns are numbers in both modes.
+
+The display format of a column comes from the operation that formatted it in
+the recipe (the operation records "typed": true), so replays produce the same
+output whatever the setting. Workbooks get it as the Excel number format of
+the column, Parquet downloads as field metadata ("display_format": the
+strftime format or number of decimals) and as a "display_formats" JSON entry
+of the schema metadata. Delimited text and JSON hold the plain numbers and ISO
+dates.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import transforms
+from lazy_imports import lazy_import
+
+recipe = lazy_import("recipe")
+
+TYPED_OUTPUT = os.environ.get("TYPED_OUTPUT", "0") == "1"
+
+# strftime directives and the Excel number format codes they become.
+EXCEL_DATE_CODES = {"%Y": "yyyy", "%m": "mm", "%d": "dd", "%H": "hh", "%M": "mm", "%S": "ss"}
+
+
+def column_formats(operations: list[dict]) -> dict[str, dict]:
+    """The display formats of the typed columns a list of recipe operations
+    produces, by column: {"type": "datetime", "format": "%d/%m/%Y"} or
+    {"type": "float", "decimals": 2}."""
+    formats = {}
+    for operation in operations:
+        params = operation["params"]
+        if not params.get("typed"):
+            continue
+        if operation["op"] == "time_formatting" and transforms.is_date_format(
+            params["target_format"]
+        ):
+            formats[params["col_name"]] = {"type": "datetime", "format": params["target_format"]}
+        elif operation["op"] == "float_formatting":
+            formats[params["col_name"]] = {"type": "float", "decimals": params["decimals"]}
+    return formats
+
+
+def for_file(file_path: str | Path, sheet: str | None = None) -> dict[str, dict]:
+    """The display formats recorded in the recipe of a working file or result
+    (of one of its sheets, for a merged workbook)."""
+    if not recipe.recipe_path(file_path).exists():
+        return {}
+    recorded = recipe.load_recipe(file_path)
+    operations = recorded.get("sheets", {}).get(sheet, recorded["operations"])
+    return column_formats(operations)
+
+
+def formats_with(file_path: str | Path, op: str, params: list[dict]) -> dict[str, dict]:
+    """The display formats of a working file once operations about to be
+    recorded (see recipe.record_operations) are."""
+    pending = [{"op": op, "params": p} for p in params]
+    return {**for_file(file_path), **column_formats(pending)}
+
+
+def excel_number_format(spec: dict) -> str:
+    """The Excel number format showing a column as its display format does."""
+    if spec["type"] == "float":
+        return "0." + "0" * spec["decimals"] if spec["decimals"] else "0"
+    number_format = spec["format"]
+    for directive, code in EXCEL_DATE_CODES.items():
+        number_format = number_format.replace(directive, code)
+    return number_format
+
+
+def excel_formats(formats: dict[str, dict]) -> dict[str, str]:
+    """Excel number formats by column."""
+    return {col: excel_number_format(spec) for col, spec in formats.items()}
+
+
+def restore_types(df: pd.DataFrame, formats: dict[str, dict]) -> pd.DataFrame:
+    """Give typed columns read back from text (delimited or JSON results)
+    their dtype again."""
+    df = df.copy(deep=False)
+    for col, spec in formats.items():
+        if col not in df.columns or isinstance(df[col], pd.DataFrame):
+            continue
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        if spec["type"] == "datetime" and not pd.api.types.is_datetime64_any_dtype(values):
+            df[col] = pd.to_datetime(values, format="ISO8601", errors="coerce")
+        elif spec["type"] == "float" and not pd.api.types.is_numeric_dtype(values):
+            df[col] = pd.to_numeric(values, errors="coerce")
+    return df
+
+
+def annotate(table: pa.Table, formats: dict[str, dict]) -> pa.Table:
+    """Attach the display formats to an Arrow table: per field, and as JSON in
+    the schema metadata."""
+    if not formats:
+        return table
+    fields = []
+    for field in table.schema:
+        spec = formats.get(field.name)
+        if spec is not None:
+            shown = spec["format"] if spec["type"] == "datetime" else str(spec["decimals"])
+            field = field.with_metadata({**(field.metadata or {}), b"display_format": shown})
+        fields.append(field)
+    metadata = {**(table.schema.metadata or {}), b"display_formats": json.dumps(formats)}
+    return pa.Table.from_arrays(table.columns, schema=pa.schema(fields, metadata=metadata))
@@ -0,0 +1,209 @@
+"""
+Result Downloads
+================
+A cleaned result can be downloaded in several formats:
+
+    xlsx      the cleaned workbook itself
+    csv.gz    CSV, gzip-compressed
+    csv.zst   CSV, zstd-compressed (much faster to produce than gzip)
+    parquet   columnar and typed, zstd-compressed
+
+The format is taken from an explicit `format` or negotiated from the request's
+Accept header (and Accept-Encoding for CSV). Every artifact is produced once,
+next to the result, and reused until the result changes:
+
+    <stem>.csv.gz, <stem>.csv.zst, <stem>.parquet
+    <stem>.<sheet>.csv.gz, ...            (a sheet asked for by name)
+
+CSV and Parquet hold one table: the first data sheet of a workbook, or the
+sheet asked for. Typed columns (TYPED_OUTPUT, see display_formats.py) keep
+their display format as the Excel number format, and as field and schema
+metadata in Parquet.
+"""
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import display_formats
+import metrics
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from table_io import is_excel, read_table, write_excel
+from workbook import data_sheet_names
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+@dataclass(frozen=True)
+class DownloadFormat:
+    suffix: str
+    media_type: str
+    # Codec of compressed CSV, also its Content-Encoding when it is served as
+    # negotiated text/csv.
+    codec: str | None = None
+
+
+FORMATS = {
+    "xlsx": DownloadFormat(".xlsx", XLSX_MEDIA_TYPE),
+    "csv.gz": DownloadFormat(".csv.gz", "application/gzip", "gzip"),
+    "csv.zst": DownloadFormat(".csv.zst", "application/zstd", "zstd"),
+    "parquet": DownloadFormat(".parquet", "application/vnd.apache.parquet"),
+}
+
+# Media types of the Accept header and the format they ask for. text/csv is
+# resolved with Accept-Encoding.
+ACCEPTED_MEDIA_TYPES = {
+    XLSX_MEDIA_TYPE: "xlsx",
+    "application/vnd.ms-excel": "xlsx",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "application/gzip": "csv.gz",
+    "application/zstd": "csv.zst",
+    "text/csv": "csv",
+    "*/*": "xlsx",
+    "application/*": "xlsx",
+}
+
+PARQUET_COMPRESSION = "zstd"
+# Parquet row groups, in rows: large enough for good compression, small
+# enough to stream.
+PARQUET_ROW_GROUP = 128 * 1024
+
+
+class NotAcceptable(ValueError):
+    """No download format satisfies the request."""
+
+
+def _parse_accept(header: str | None) -> list[tuple[str, float]]:
+    """(value, q) pairs of an Accept or Accept-Encoding header, by preference."""
+    items = []
+    for position, part in enumerate((header or "").split(",")):
+        value, *params = [p.strip() for p in part.split(";")]
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, number = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        items.append((value.lower(), q, position))
+    items.sort(key=lambda item: (-item[1], item[2]))
+    return [(value, q) for value, q, _ in items if q > 0]
+
+
+def negotiate(
+    requested: str | None = None,
+    accept: str | None = None,
+    accept_encoding: str | None = None,
+) -> tuple[str, bool]:
+    """Choose a download format.
+
+    Returns (format, encoded): with `encoded`, a compressed CSV is served as
+    text/csv with a Content-Encoding instead of as a compressed file.
+    Raises NotAcceptable when nothing the request accepts is available.
+    """
+    if requested:
+        if requested not in FORMATS:
+            raise NotAcceptable(
+                f"Unknown format '{requested}', expected one of {sorted(FORMATS)}"
+            )
+        return requested, False
+    accepted = _parse_accept(accept) or [("*/*", 1.0)]
+    for media_type, _ in accepted:
+        fmt = ACCEPTED_MEDIA_TYPES.get(media_type)
+        if fmt == "csv":
+            encodings = [e for e, _ in _parse_accept(accept_encoding)]
+            for encoding in encodings:
+                if encoding in ("zstd", "gzip", "*"):
+                    return ("csv.gz" if encoding == "gzip" else "csv.zst"), True
+            continue
+        if fmt:
+            return fmt, False
+    raise NotAcceptable(f"None of the accepted types is available: {accept}")
+
+
+def _data_sheet(file_path: Path, sheet: str | None) -> str | None:
+    if not is_excel(str(file_path)):
+        return None
+    names = data_sheet_names(file_path)
+    if sheet is None:
+        return names[0]
+    if sheet not in names:
+        raise KeyError(f"Sheet '{sheet}' not found. Available sheets: {names}")
+    return sheet
+
+
+def artifact_path(file_path: str | Path, fmt: str, sheet: str | None = None) -> Path:
+    """Where the `fmt` download of a result is cached."""
+    path = Path(file_path)
+    if fmt == "xlsx" and is_excel(str(path)):
+        return path
+    stem = path.name.removesuffix(path.suffix)
+    if sheet is not None:
+        stem = f"{stem}.{sheet}"
+    return path.with_name(stem + FORMATS[fmt].suffix)
+
+
+def _arrow_table(df: pd.DataFrame, decode_categories: bool) -> pa.Table:
+    """Convert a frame, turning columns of mixed values into text."""
+    columns = {}
+    for name in df.columns:
+        col = df[name]
+        if decode_categories and isinstance(col.dtype, pd.CategoricalDtype):
+            col = col.astype(col.cat.categories.dtype)
+        try:
+            columns[str(name)] = pa.array(col, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            text = col.map(lambda v: v if pd.isna(v) else str(v))
+            columns[str(name)] = pa.array(text, type=pa.string(), from_pandas=True)
+    return pa.table(columns)
+
+
+def write_artifact(
+    df: pd.DataFrame, path: Path, fmt: str, display: dict[str, dict] | None = None
+) -> None:
+    """Write a download; `display` holds the display formats of typed columns
+    (see display_formats.py)."""
+    spec = FORMATS[fmt]
+    display = display or {}
+    if fmt == "xlsx":
+        number_formats = {"Cleaned_Data": display_formats.excel_formats(display)}
+        write_excel(str(path), {"Cleaned_Data": df}, number_formats=number_formats)
+    elif fmt == "parquet":
+        pq.write_table(
+            display_formats.annotate(_arrow_table(df, decode_categories=False), display),
+            path,
+            compression=PARQUET_COMPRESSION,
+            row_group_size=PARQUET_ROW_GROUP,
+        )
+    else:
+        with pa.CompressedOutputStream(str(path), spec.codec) as out:
+            pa_csv.write_csv(_arrow_table(df, decode_categories=True), out)
+
+
+def ensure_artifact(file_path: str | Path, fmt: str, sheet: str | None = None) -> Path:
+    """Return the `fmt` download of a result, producing it if missing or stale."""
+    path = Path(file_path)
+    target = artifact_path(path, fmt, sheet)
+    if target == path:
+        return path
+    fresh = target.exists() and target.stat().st_mtime_ns >= path.stat().st_mtime_ns
+    metrics.cache_lookup("downloads", fresh)
+    if fresh:
+        return target
+    sheet_name = _data_sheet(path, sheet)
+    display = display_formats.for_file(path, sheet_name)
+    df = display_formats.restore_types(read_table(str(path), sheet_name=sheet_name), display)
+    tmp = target.with_name(f".{os.getpid()}.{target.name}")
+    try:
+        write_artifact(df, tmp, fmt, display)
+        os.replace(tmp, target)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return target
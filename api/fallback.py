@@ -0,0 +1,205 @@
+"""
+Heuristic Decisions
+===================
+Finishes a job locally, without model calls, once its agents ran out of time
+or tokens (see budgets.py). Every column the agents did not format yet is
+decided from its own values:
+
+  - its type is the reader's, if the reader answered, else guessed from the
+    share of values that parse as amounts, numbers or dates, and from how
+    few distinct values it has (categories);
+  - time: '%d/%m/%Y', or '%d/%m/%Y %H:%M:%S' when the values have a time of
+    day; money: the currencies and decimal separator found in the values, no
+    scale; names: 'First Last' human names if the values look like names,
+    else title-cased; categories: the proposed clusters; int and float as
+    the tools do;
+  - a decision must pass the same checks as an agent's (model_routing.py),
+    otherwise the column is left as it is.
+
+If the agents stopped before any step, the header is taken from the likely
+header row (as for the schema of a workbook sheet). Skipped NA cleaning,
+deduplication and description are not made up for. Decisions are recorded in
+the recipe like the agents', so the result replays the same way.
+"""
+
+import pandas as pd
+import transforms
+from column_groups import expand_types
+from display_formats import TYPED_OUTPUT, column_formats
+from model_routing import (
+    MoneyDecision,
+    NameDecision,
+    TimeDecision,
+    validate_money,
+    validate_name,
+    validate_time,
+)
+from recipe import apply_operation, load_recipe, record_operation, save_recipe
+from table_io import read_table, save_table
+from workbook import SIGNATURE_SCAN_ROWS, likely_header_row
+
+COLUMN_OPERATIONS = {
+    "time_formatting",
+    "money_formatting",
+    "int_formatting",
+    "float_formatting",
+    "name_formatting",
+    "category_normalization",
+}
+# Shares of values that make a column of a type when the reader did not say.
+TYPE_THRESHOLD = 0.9
+NUMERIC_THRESHOLD = 0.99
+# At most this many distinct values, and this share of the rows, for a category.
+CATEGORY_MAX_DISTINCT = 50
+CATEGORY_MAX_RATIO = 0.1
+
+
+def _counts(series: pd.Series) -> pd.Series:
+    text = series.dropna().astype(str).str.strip()
+    return text[text != ""].value_counts()
+
+
+def _share(mask: pd.Series, counts: pd.Series) -> float:
+    return float(counts[mask].sum() / counts.sum())
+
+
+def guess_type(series: pd.Series) -> str:
+    """The type of a column from its values, in the reader's categories."""
+    counts = _counts(series)
+    if not len(counts):
+        return "unknown"
+    values = counts.index.to_series(index=counts.index)
+    symbols = values.str.extract(transforms.CURRENCY_RE, expand=False)
+    money = symbols.notna() & values.str.contains(r"\d", regex=True)
+    if _share(money, counts) >= TYPE_THRESHOLD:
+        return "money"
+    numeric = pd.to_numeric(values.str.replace(",", "", regex=False), errors="coerce")
+    if _share(numeric.notna(), counts) >= NUMERIC_THRESHOLD:
+        return "int" if (numeric.dropna() % 1 == 0).all() else "float"
+    dates = pd.to_datetime(values.where(numeric.isna()), errors="coerce", format="mixed")
+    if _share(dates.notna(), counts) >= TYPE_THRESHOLD:
+        return "time"
+    if len(counts) <= min(CATEGORY_MAX_DISTINCT, counts.sum() * CATEGORY_MAX_RATIO):
+        return "category"
+    return "string"
+
+
+def _time_decision(series: pd.Series) -> dict | None:
+    for target_format in ("%d/%m/%Y", "%d/%m/%Y %H:%M:%S"):
+        if validate_time(series, TimeDecision(target_format, 1.0)).passed:
+            return {"target_format": target_format}
+    return None
+
+
+def _money_decision(series: pd.Series) -> dict | None:
+    counts = _counts(series)
+    dot = _share(counts.index.str.contains(r"\d\.\d{1,2}\D*$"), counts)
+    comma = _share(counts.index.str.contains(r"\d,\d{1,2}\D*$"), counts)
+    separator = "," if comma > dot else "."
+    symbols = {transforms.parse_money(v, separator)[1] for v in counts.index} - {""}
+    decision = MoneyDecision(
+        is_mixed_currency=len(symbols) > 1,
+        detected_currency=next(iter(symbols)) if len(symbols) == 1 else "Unknown",
+        scale_decision="None",
+        decimal_separator=separator,
+        confidence=1.0,
+    )
+    if not validate_money(series, decision).passed:
+        return None
+    return {
+        "is_mixed_currency": decision.is_mixed_currency,
+        "detected_currency": decision.detected_currency,
+        "scale_decision": decision.scale_decision,
+        "decimal_separator": decision.decimal_separator,
+    }
+
+
+def _name_decision(series: pd.Series) -> dict:
+    if validate_name(series, NameDecision("Human Names", "First Last", 1.0)).passed:
+        return {"entity_type": "Human Names", "dominant_format": "First Last"}
+    return {"entity_type": "Locations/Other", "dominant_format": "N/A"}
+
+
+def decide(col_type: str, series: pd.Series) -> tuple[str, dict] | None:
+    """The recipe operation formatting a column of `col_type`, or None to
+    leave it as it is."""
+    if col_type == "time":
+        params = _time_decision(series)
+        return ("time_formatting", {**params, "typed": TYPED_OUTPUT}) if params else None
+    if col_type == "money":
+        params = _money_decision(series)
+        return ("money_formatting", params) if params else None
+    if col_type == "name":
+        return "name_formatting", _name_decision(series)
+    if col_type == "int":
+        return "int_formatting", {}
+    if col_type == "float":
+        return "float_formatting", {
+            "decimals": transforms.max_decimals(transforms.parse_floats(series)),
+            "typed": TYPED_OUTPUT,
+        }
+    if col_type == "category":
+        mapping = transforms.cluster_categories(_counts(series))
+        return "category_normalization", {"mapping": {k: v for k, v in mapping.items() if k != v}}
+    return None
+
+
+def _formatted_columns(df: pd.DataFrame, operations: list[dict]) -> set[str]:
+    """Columns the agents already formatted, under their current names."""
+    done = set()
+    for operation in operations:
+        if operation["op"] not in COLUMN_OPERATIONS:
+            continue
+        col = operation["params"]["col_name"]
+        done.add(col)
+        if operation["op"] == "money_formatting":
+            # Renamed with its currency or scale, or followed by its currencies.
+            done.update(
+                str(c) for c in df.columns if str(c).startswith(f"{col} (") or str(c) == f"{col}_currency"
+            )
+    return done
+
+
+def _apply_likely_header(file_path: str) -> None:
+    raw = read_table(file_path, header=None, nrows=SIGNATURE_SCAN_ROWS)
+    header_row = likely_header_row(raw)
+    if header_row:
+        save_table(read_table(file_path, header=header_row), file_path, stage="header")
+    record_operation(file_path, "header", header_row_index=header_row, header_col_index=0)
+
+
+def finish(file_path: str, column_types: str | None = None) -> list[dict]:
+    """Format the columns of a working file the agents did not get to.
+
+    `column_types` is the reader's answer, if it gave one. Returns one entry
+    per column finished here: its type and the decision, None where the
+    column was left as it is.
+    """
+    if not load_recipe(file_path)["operations"]:
+        _apply_likely_header(file_path)
+    df = read_table(file_path)
+    done = _formatted_columns(df, load_recipe(file_path)["operations"])
+    types = expand_types(column_types) if column_types else {}
+    degraded, operations = [], []
+    duplicated = set(df.columns[df.columns.duplicated()])
+    for col in list(df.columns):
+        if str(col) in done or col in duplicated:
+            continue
+        col_type = types.get(str(col)) or guess_type(df[col])
+        if col_type in ("string", "unknown"):
+            continue
+        operation = decide(col_type, df[col])
+        if operation:
+            op, params = operation
+            params = {"col_name": col, **params}
+            df = apply_operation(df, op, params)
+            operations.append((op, params))
+        degraded.append(
+            {"column": str(col), "type": col_type, "decision": operation[1] if operation else None}
+        )
+    if operations:
+        recipe = load_recipe(file_path)
+        recipe["operations"].extend({"op": op, "params": params} for op, params in operations)
+        save_table(df, file_path, stage="fallback", display=column_formats(recipe["operations"]))
+        save_recipe(file_path, recipe)
+    return degraded
@@ -0,0 +1,248 @@
+"""
+Incremental Processing
+======================
+Append-only sources (sensor logs, web traffic, IoT exports) only ever gain rows
+at the end. After a full pipeline run, the dataset's state is stored next to
+its cleaned output (`<cleaned>.incremental.json`):
+
+    {
+      "version": 1,
+      "source": "sensor_logs.csv",
+      "raw_columns": ["timestamp", "device_id", ...],
+      "rows": 125000,
+      "byte_offset": 8123456,
+      "tail_sha256": "...",
+      "recipe": {...}
+    }
+
+On re-submission only the rows beyond the watermark are read, cleaned by
+replaying the stored recipe (no model calls) and appended to the cleaned
+output. For CSV sources the watermark is a byte offset, so earlier rows are not
+even parsed; for workbooks it is a data-row count and a digest of those rows
+("rows_sha256"). A source whose earlier rows or columns changed, or whose last
+row was continued rather than followed by new lines, is not an append, and gets
+a full pipeline run again.
+
+Steps that compare rows with each other (deduplication) cannot run on the new
+rows alone: a new row may duplicate an old one. For recipes with such a step
+the whole source is read, the steps up to the last of them are replayed on all
+rows, and only the new rows that remain go through the rest of the recipe.
+"""
+
+import hashlib
+import io
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+import readers
+import transforms
+from display_formats import column_formats, excel_formats
+from recipe import FRAME_OPERATIONS, load_recipe, replay_frame, split_recipe
+from storage import break_link
+from table_io import read_table, read_workbook, save_table, write_excel
+
+STATE_VERSION = 1
+# Bytes before the watermark hashed to detect sources rewritten in place.
+TAIL_BYTES = 4096
+
+
+def state_path(cleaned_path: str | Path) -> Path:
+    path = Path(cleaned_path)
+    return path.with_name(f"{path.name}.incremental.json")
+
+
+def load_state(cleaned_path: str | Path) -> dict | None:
+    path = state_path(cleaned_path)
+    if not path.exists():
+        return None
+    state = json.loads(path.read_text())
+    if state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def _write_state(cleaned_path: str | Path, state: dict) -> None:
+    state["updated_at"] = datetime.now(timezone.utc).isoformat()
+    path = state_path(cleaned_path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(state, indent=2, default=str))
+    os.replace(tmp, path)
+
+
+def _is_delimited(path: str | Path) -> bool:
+    return readers.sniff(path).format == "delimited"
+
+
+def _tail_digest(path: str | Path, offset: int) -> str:
+    with open(path, "rb") as f:
+        f.seek(max(0, offset - TAIL_BYTES))
+        return hashlib.sha256(f.read(min(offset, TAIL_BYTES))).hexdigest()
+
+
+def _starts_new_line(path: str | Path, offset: int) -> bool:
+    """Whether the bytes after `offset` start a new record: the source ended in
+    a line break there, or what was appended begins with one."""
+    if offset == 0:
+        return True
+    with open(path, "rb") as f:
+        f.seek(offset - 1)
+        around = f.read(2)
+    return around[:1] in (b"\n", b"\r") or around[1:] in (b"", b"\n", b"\r")
+
+
+def _header_params(recipe: dict) -> tuple[int, int]:
+    header, _, _ = split_recipe(recipe)
+    if header is None:
+        return 0, 0
+    return header["header_row_index"], header["header_col_index"]
+
+
+def _rows_digest(raw: pd.DataFrame, rows: int) -> str:
+    """Digest of the first `rows` data rows of a table, by their text."""
+    hashes = pd.util.hash_pandas_object(raw.iloc[:rows].astype(str), index=False)
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
+
+
+def _read_source(state: dict, source_path: str | Path) -> pd.DataFrame:
+    header_row, _ = _header_params(state["recipe"])
+    return read_table(str(source_path), header=header_row)
+
+
+def _set_watermark(
+    state: dict, source_path: str | Path, raw: pd.DataFrame | None = None
+) -> None:
+    if _is_delimited(source_path):
+        offset = os.path.getsize(source_path)
+        state["byte_offset"] = offset
+        state["tail_sha256"] = _tail_digest(source_path, offset)
+    else:
+        # Workbooks can be rewritten anywhere: their rows so far are hashed.
+        state["rows_sha256"] = _rows_digest(raw, state["rows"])
+
+
+def save_state(source_path: str | Path, cleaned_path: str | Path) -> dict:
+    """Store the watermark and recipe after a full pipeline run."""
+    recipe = load_recipe(cleaned_path)
+    header_row, _ = _header_params(recipe)
+    raw = read_table(str(source_path), header=header_row)
+    state = {
+        "version": STATE_VERSION,
+        "source": Path(source_path).name,
+        "raw_columns": [str(c) for c in raw.columns],
+        "rows": len(raw),
+        "recipe": recipe,
+    }
+    _set_watermark(state, source_path, raw)
+    _write_state(cleaned_path, state)
+    return state
+
+
+def is_append_of(state: dict, source_path: str | Path) -> bool:
+    """Check that the source only grew since the watermark was taken: same
+    columns, and the rows cleaned so far unchanged."""
+    if not _is_delimited(source_path):
+        if "rows_sha256" not in state:
+            return False
+        raw = _read_source(state, source_path)
+        return (
+            [str(c) for c in raw.columns] == state["raw_columns"]
+            and len(raw) >= state["rows"]
+            and _rows_digest(raw, state["rows"]) == state["rows_sha256"]
+        )
+    offset = state.get("byte_offset")
+    if offset is None or os.path.getsize(source_path) < offset:
+        return False
+    return _tail_digest(source_path, offset) == state["tail_sha256"] and _starts_new_line(
+        source_path, offset
+    )
+
+
+def _read_new_rows(state: dict, source_path: str | Path) -> pd.DataFrame:
+    with open(source_path, "rb") as f:
+        f.seek(state["byte_offset"])
+        # After a source without a final line break, appends start with one.
+        tail = f.read().lstrip(b"\r\n")
+    if not tail.strip():
+        return pd.DataFrame(columns=state["raw_columns"])
+    sniffed = readers.sniff(source_path)
+    return pd.read_csv(
+        io.BytesIO(tail),
+        sep=sniffed.delimiter,
+        encoding=sniffed.encoding.removesuffix("-sig"),
+        header=None,
+        names=state["raw_columns"],
+    )
+
+
+def _append_output(
+    df: pd.DataFrame, cleaned_path: str | Path, display: dict[str, dict]
+) -> None:
+    fmt = readers.output_format(cleaned_path)
+    if fmt.format == "delimited":
+        existing = read_table(str(cleaned_path), nrows=0).columns
+        break_link(cleaned_path)
+        df[list(existing)].to_csv(
+            cleaned_path, sep=fmt.delimiter, mode="a", header=False, index=False
+        )
+        return
+    if fmt.format != "excel":
+        existing = read_table(str(cleaned_path))
+        save_table(
+            pd.concat([existing, df], ignore_index=True), str(cleaned_path), display=display
+        )
+        return
+    # xlsx cannot be appended to in place: the data sheet is rewritten, but
+    # only the new rows went through the transforms.
+    sheets = read_workbook(str(cleaned_path))
+    data_sheet = next(iter(sheets))
+    sheets[data_sheet] = pd.concat([sheets[data_sheet], df], ignore_index=True)
+    write_excel(
+        str(cleaned_path), sheets, number_formats={data_sheet: excel_formats(display)}
+    )
+
+
+def _clean_rows(
+    raw: pd.DataFrame, start: int, header_col: int, operations: list[dict]
+) -> pd.DataFrame:
+    """Clean the rows of `raw` from position `start` on (see the module
+    docstring for the steps comparing rows)."""
+    last = max(
+        (i for i, operation in enumerate(operations) if operation["op"] in FRAME_OPERATIONS),
+        default=-1,
+    )
+    df = transforms.crop_columns(raw.iloc[start if last < 0 else 0 :], header_col)
+    if last >= 0:
+        df = replay_frame(df.reset_index(drop=True), operations[: last + 1])
+        df, operations = df[df.index >= start], operations[last + 1 :]
+    return replay_frame(df, operations)
+
+
+def process_increment(
+    source_path: str | Path, cleaned_path: str | Path, state: dict
+) -> int:
+    """Clean the rows appended since the watermark and append them to the output.
+
+    Returns the number of cleaned rows appended.
+    """
+    _, header_col = _header_params(state["recipe"])
+    _, operations, _ = split_recipe(state["recipe"])
+    compares_rows = any(operation["op"] in FRAME_OPERATIONS for operation in operations)
+    if _is_delimited(source_path) and not compares_rows:
+        raw, start = _read_new_rows(state, source_path), 0
+    else:
+        raw, start = _read_source(state, source_path), state["rows"]
+        if [str(c) for c in raw.columns] != state["raw_columns"]:
+            raise ValueError("Source columns changed since the last full run")
+    added = 0
+    if len(raw) > start:
+        df = _clean_rows(raw, start, header_col, operations)
+        _append_output(df, cleaned_path, column_formats(operations))
+        added = len(df)
+
+    state["rows"] += len(raw) - start
+    _set_watermark(state, source_path, raw)
+    _write_state(cleaned_path, state)
+    return added
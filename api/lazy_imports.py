@@ -0,0 +1,39 @@
+"""
+Lazy Imports
+============
+Modules that load on first attribute access instead of at import time.
+
+The MCP server and the API answer their first requests long before they
+touch pandas: in the default process-pool mode the MCP server only forwards
+tool calls, and the workers import what the tools need. Declaring the heavy
+modules with `lazy_import` keeps them out of cold start:
+
+    pd = lazy_import("pandas")
+    table_io = lazy_import("table_io")
+
+    def read(path):
+        return table_io.read_table(path)  # pandas and table_io load here
+
+Only module attributes are deferred; `from m import name` and annotations
+evaluated at definition time (e.g. `def f(s: pd.Series)` without quotes) load
+the module immediately.
+"""
+
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Return module `name`, executed the first time one of its attributes is
+    used. An already imported module is returned as is."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -17,10 +17,10 @@ def get_test_file(test_file_mcp: str = "cleaned_test_pipeline_mcp.xlsx") -> str:
     return test_file_mcp
 
 
-async def main(file_path: str):
+async def main(file_path: str, progress=None):
     # test_file_path = get_test_file(file_path)
     # Run your pipeline on the uploaded file
-    await run_agentic_pipeline(file_path)
+    await run_agentic_pipeline(file_path, progress=progress)
 
 
 # if __name__ == "__main__":
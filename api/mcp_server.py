@@ -1,52 +1,141 @@
 import json
-import re
 import string
 from typing import Literal
 
-import dateparser
-import pandas as pd
+import metrics
+from lazy_imports import lazy_import
 from mcp.server.fastmcp import FastMCP
+from tool_executor import offloaded, shutdown_executor, warm_up
+
+# The tools run in worker processes by default (see tool_executor.py), so the
+# server itself never needs pandas: everything the tools use loads on first
+# use, and the server is ready to list its tools sooner.
+pd = lazy_import("pandas")
+column_groups = lazy_import("column_groups")
+dedup = lazy_import("dedup")
+display_formats = lazy_import("display_formats")
+readers = lazy_import("readers")
+recipe = lazy_import("recipe")
+sampling = lazy_import("sampling")
+table_io = lazy_import("table_io")
+transforms = lazy_import("transforms")
 
 mcp = FastMCP("data-formatting-tools")
 
+# Header detection looks at raw positions, so it keeps the first rows but only
+# the leftmost columns of very wide sheets.
+HEADER_PREVIEW_ROWS = 15
+HEADER_PREVIEW_COLUMNS = 30
 
-def _read_file(file_path: str, header: int = 0) -> pd.DataFrame:
-    """Helper to read both CSV and Excel files."""
-    if file_path.endswith(".csv"):
-        return pd.read_csv(file_path, header=header)
-    else:
-        return pd.read_excel(file_path, header=header)
 
+# Parse rates are estimated on the most frequent distinct values only, so the
+# cost of profiling depends on cardinality rather than row count.
+PROFILE_MAX_DISTINCT = 5000
+PROFILE_MAX_VALUE_LEN = 40
 
-def _save_file(df: pd.DataFrame, file_path: str, index: bool = False):
-    """Helper to save both CSV and Excel files."""
-    if file_path.endswith(".csv"):
-        df.to_csv(file_path, index=index)
-    else:
-        df.to_excel(file_path, index=index)
+# Columns with more distinct values are not treated as categorical.
+CATEGORY_MAX_DISTINCT = 1000
+
+# Duplicate groups shown by the deduplication report, and rows shown per group.
+DEDUP_REPORTED_GROUPS = 5
+DEDUP_EXAMPLE_ROWS = 3
+
+
+def _group(df: "pd.DataFrame", col_name: str, also_apply_to: list[str] | None) -> list[str]:
+    """A column and the other columns of its group (see column_groups.py)."""
+    columns = list(dict.fromkeys([col_name, *(also_apply_to or [])]))
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise ValueError(f"columns not found: {missing}; available: {list(df.columns)}")
+    return columns
+
+
+def _group_note(columns: list[str]) -> str:
+    return f" (and the {len(columns) - 1} other columns of its group)" if len(columns) > 1 else ""
+
+
+def _is_punctuation_token(val: str) -> bool:
+    return 0 < len(val) <= 2 and all(c in string.punctuation for c in val)
+
+
+def _profile_column(series: "pd.Series", top_k: int) -> dict:
+    """Compute compact statistics for one column from its value counts."""
+    total = len(series)
+    text = series.dropna().astype(str).str.strip()
+    counts = text[text != ""].value_counts()
+    filled = int(counts.sum())
+    profile = {
+        "null_ratio": round(1 - filled / total, 3) if total else 0.0,
+        "distinct": len(counts),
+        "top": {
+            val[:PROFILE_MAX_VALUE_LEN]: int(n) for val, n in counts.head(top_k).items()
+        },
+    }
+    if not filled:
+        return profile
+
+    counts = counts.head(PROFILE_MAX_DISTINCT)
+    values = counts.index.to_series(index=counts.index)
+    weights = counts / counts.sum()
+
+    numeric = pd.to_numeric(values.str.replace(",", "", regex=False), errors="coerce")
+    is_numeric = numeric.notna()
+    dates = pd.to_datetime(values.where(~is_numeric), errors="coerce", format="mixed")
+    symbols = values.str.extract(transforms.CURRENCY_RE, expand=False).str.lower()
+    has_digit = values.str.contains(r"\d", regex=True)
+
+    profile["numeric_rate"] = round(float(weights[is_numeric].sum()), 3)
+    profile["date_rate"] = round(float(weights[dates.notna()].sum()), 3)
+    profile["money_rate"] = round(float(weights[symbols.notna() & has_digit].sum()), 3)
+
+    currencies = sorted(
+        {transforms.CURRENCY_CODES.get(sym, sym.upper()) for sym in symbols.dropna()}
+    )
+    if currencies:
+        profile["currencies"] = currencies
+
+    decimals = values[is_numeric].str.extract(r"\.(\d+)$", expand=False).dropna()
+    if len(decimals):
+        profile["max_decimals"] = int(decimals.str.len().max())
+
+    lengths = values.str.len()
+    profile["len"] = [
+        int(lengths.min()),
+        round(float((lengths * weights).sum()), 1),
+        int(lengths.max()),
+    ]
+    return profile
 
 
 @mcp.tool()
+@offloaded
 def execute_header_detection(file_path: str) -> str:
     """Detect the true header row and starting column of a data table in a file.
-    Returns a raw preview of the first 15 rows for context.
+    Returns a raw preview of the first 15 rows for context, as CSV whose first
+    line holds the 0-based column indexes and whose first field is the 0-based
+    row index. For delimited text, the sniffed delimiter and whether the first
+    line looks like a header are reported as well.
 
     Args:
-        file_path: Path to the Excel or CSV file.
+        file_path: Path to the Excel, delimited text or JSON file.
     """
     try:
-        if file_path.endswith(".csv"):
-            df_raw = pd.read_csv(file_path, header=None, nrows=15)
-        else:
-            df_raw = pd.read_excel(file_path, header=None, nrows=15)
-        df_raw = df_raw.fillna("")
-        raw_sample = df_raw.to_dict(orient="records")
-        return f"RAW_PREVIEW: {raw_sample}"
+        df_raw = table_io.read_table(file_path, header=None, nrows=HEADER_PREVIEW_ROWS)
+        preview = sampling.encode_table(df_raw, index=True, max_columns=HEADER_PREVIEW_COLUMNS)
+        sniffed = readers.sniff(file_path)
+        if sniffed.format != "delimited":
+            return f"RAW_PREVIEW:\n{preview}"
+        return (
+            f"SNIFFED: delimiter={sniffed.delimiter!r}, encoding={sniffed.encoding}, "
+            f"first line looks like a header: {sniffed.has_header}\n"
+            f"RAW_PREVIEW:\n{preview}"
+        )
     except Exception as e:
         return f"Error reading file for header detection: {e}"
 
 
 @mcp.tool()
+@offloaded
 def apply_header_and_crop(
     file_path: str, header_row_index: int, header_col_index: int
 ) -> str:
@@ -59,10 +148,15 @@ def apply_header_and_crop(
         header_col_index: The 0-based column index where data starts.
     """
     try:
-        df = _read_file(file_path, header=header_row_index)
-        if header_col_index > 0:
-            df = df.iloc[:, header_col_index:]
-        _save_file(df, file_path)
+        df = table_io.read_table(file_path, header=header_row_index)
+        df = transforms.crop_columns(df, header_col_index)
+        table_io.save_table(df, file_path, stage="header")
+        recipe.record_operation(
+            file_path,
+            "header",
+            header_row_index=header_row_index,
+            header_col_index=header_col_index,
+        )
         return (
             f"Successfully applied header at row {header_row_index}, "
             f"cropped {header_col_index} columns. Shape: {df.shape}. "
@@ -73,30 +167,72 @@ def apply_header_and_crop(
 
 
 @mcp.tool()
+@offloaded
 def detect_potential_na_strings(file_path: str) -> str:
     """Pre-scan the dataset for short punctuation-only strings that might be NA placeholders.
-    Also returns a sample of the first 10 rows for context.
+    Also returns a sample of 10 format-diverse rows for context.
 
     Args:
         file_path: Path to the Excel or CSV file.
     """
     try:
-        df = _read_file(file_path)
+        df = table_io.read_table(file_path)
         potential_nas = set()
         for col in df.columns:
             str_vals = df[col].dropna().astype(str)
             for val in str_vals:
                 val = val.strip()
-                if 0 < len(val) <= 2 and all(c in string.punctuation for c in val):
+                if _is_punctuation_token(val):
                     potential_nas.add(val)
 
-        sample_data = df.head(10).to_dict(orient="records")
-        return f"POTENTIAL_NAS: {list(potential_nas)}\nSAMPLE: {sample_data}"
+        sample_data = sampling.encode_table(sampling.representative_rows(df, 10))
+        return f"POTENTIAL_NAS: {list(potential_nas)}\nSAMPLE:\n{sample_data}"
     except Exception as e:
         return f"Error detecting NAs: {e}"
 
 
 @mcp.tool()
+@offloaded
+def profile_columns(file_path: str, top_k: int = 5, group_similar: bool = False) -> str:
+    """Profile every column of the dataset in a single pass.
+    Returns compact JSON with, per column: null_ratio, distinct count, the top-k
+    values with counts, numeric/date/money parse-success rates, detected
+    currencies, max_decimals and [min, mean, max] value length. Also lists
+    punctuation-only strings that might be NA placeholders.
+
+    Args:
+        file_path: Path to the Excel or CSV file.
+        top_k: Number of most frequent values to report per column.
+        group_similar: Profile only the first column of each group of columns
+            with the same value shape; the others are listed under its
+            "same_shape" and share its type.
+    """
+    try:
+        df = table_io.read_table(file_path)
+        groups = column_groups.group_columns(df) if group_similar else {}
+        grouped = {member for members in groups.values() for member in members}
+        columns = {}
+        potential_nas = set()
+        for col in df.columns:
+            if str(col) in grouped:
+                continue
+            profile = _profile_column(df[col], top_k)
+            if str(col) in groups:
+                profile["same_shape"] = groups[str(col)]
+            columns[str(col)] = profile
+            potential_nas.update(v for v in profile["top"] if _is_punctuation_token(v))
+        result = {
+            "rows": len(df),
+            "columns": columns,
+            "potential_nas": sorted(potential_nas),
+        }
+        return json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+    except Exception as e:
+        return f"Error profiling columns: {e}"
+
+
+@mcp.tool()
+@offloaded
 def execute_na_cleaning(
     file_path: str,
     custom_na_strings_to_wipe: list[str],
@@ -112,17 +248,11 @@ def execute_na_cleaning(
         remove_completely_empty_columns: Whether to drop columns where all values are missing.
     """
     try:
-        df = _read_file(file_path)
+        df = table_io.read_table(file_path)
         messages = []
 
         if custom_na_strings_to_wipe:
-
-            def wipe_custom_na(val):
-                if isinstance(val, str) and val.strip() in custom_na_strings_to_wipe:
-                    return pd.NA
-                return val
-
-            df = df.map(wipe_custom_na)
+            df = transforms.wipe_na_strings(df, custom_na_strings_to_wipe)
             messages.append(f"Wiped custom NA strings: {custom_na_strings_to_wipe}")
 
         if remove_completely_empty_rows:
@@ -132,20 +262,94 @@ def execute_na_cleaning(
             if rows_removed > 0:
                 messages.append(f"Dropped {rows_removed} completely empty rows.")
 
+        dropped_columns = []
         if remove_completely_empty_columns:
-            initial_cols = len(df.columns)
-            df = df.dropna(axis=1, how="all")
-            cols_removed = initial_cols - len(df.columns)
-            if cols_removed > 0:
-                messages.append(f"Dropped {cols_removed} completely empty columns.")
-
-        _save_file(df, file_path)
+            dropped_columns = transforms.empty_columns(df)
+            df = df.drop(columns=dropped_columns)
+            if dropped_columns:
+                messages.append(
+                    f"Dropped {len(dropped_columns)} completely empty columns."
+                )
+
+        table_io.save_table(df, file_path, stage="na_cleaning")
+        recipe.record_operation(
+            file_path,
+            "na_cleaning",
+            custom_na_strings_to_wipe=custom_na_strings_to_wipe,
+            remove_completely_empty_rows=remove_completely_empty_rows,
+            dropped_columns=[str(c) for c in dropped_columns],
+        )
         return f"NA cleaning complete. {'; '.join(messages)}. Shape: {df.shape}"
     except Exception as e:
         return f"Error cleaning NAs: {e}"
 
 
 @mcp.tool()
+@offloaded
+def execute_deduplication(
+    file_path: str,
+    drop_duplicates: bool,
+    near_duplicates: bool = False,
+    similarity_threshold: float = 1.0,
+    ignore_columns: list[str] | None = None,
+) -> str:
+    """Find duplicate rows and optionally drop them, keeping the first row of each group.
+    Exact duplicates are found by hashing rows. With near_duplicates, cells are
+    compared after normalization (case, whitespace, number and ID formatting, so
+    'TXN-000095' equals 'txn 95'). A similarity_threshold below 1.0 also groups rows
+    that share only that fraction of their cells (MinHash/LSH blocking).
+    Returns counts and the largest groups with their 0-based row positions. Without
+    near_duplicates, the near-duplicates left are counted but never dropped.
+
+    Args:
+        file_path: Path to the Excel or CSV file.
+        drop_duplicates: Whether to remove the duplicates from the file.
+        near_duplicates: Compare normalized cells instead of raw cells.
+        similarity_threshold: Share of equal cells for rows to count as duplicates (1.0 = all).
+        ignore_columns: Columns left out of the comparison, e.g. surrogate keys.
+    """
+    try:
+        df = table_io.read_table(file_path)
+        params = {
+            "near_duplicates": near_duplicates,
+            "similarity_threshold": similarity_threshold,
+            "ignore_columns": ignore_columns or [],
+        }
+        labels = dedup.find_duplicates(df, **params)
+        groups = dedup.duplicate_groups(labels)
+        redundant = sum(len(group) - 1 for group in groups)
+        message = (
+            f"Found {len(groups)} duplicate groups ({redundant} redundant rows) "
+            f"among {len(df)} rows."
+        )
+        examples = [
+            sampling.encode_table(df.iloc[group[:DEDUP_EXAMPLE_ROWS]], index=True)
+            for group in groups[:DEDUP_REPORTED_GROUPS]
+        ]
+
+        if drop_duplicates and groups:
+            df = dedup.drop_duplicates(df, labels)
+            table_io.save_table(df, file_path, stage="deduplication")
+            recipe.record_operation(file_path, "deduplication", **params)
+            message += f" Dropped {redundant} rows. Shape: {df.shape}"
+        if not near_duplicates:
+            near = dedup.duplicate_groups(
+                dedup.find_duplicates(df, True, ignore_columns=params["ignore_columns"])
+            )
+            if near:
+                message += (
+                    f"\nKept {len(near)} groups of near-duplicates (equal after normalization); "
+                    "pass near_duplicates=True to drop them."
+                )
+        if examples:
+            message += "\nLARGEST GROUPS:\n" + "\n".join(examples)
+        return message
+    except Exception as e:
+        return f"Error finding duplicates: {e}"
+
+
+@mcp.tool()
+@offloaded
 def execute_time_formatting(
     file_path: str,
     col_name: str,
@@ -159,6 +363,7 @@ def execute_time_formatting(
         "%m/%Y",
         "%Y",
     ],
+    also_apply_to: list[str] | None = None,
 ) -> str:
     """Format a time/date column in a file to a specific target format.
 
@@ -166,74 +371,37 @@ def execute_time_formatting(
         file_path: Path to the Excel or CSV file.
         col_name: Name of the column to format.
         target_format: The target strftime format (e.g., '%H:%M', '%d/%m/%Y').
+        also_apply_to: Other columns of the same group (from the reader's
+            "groups") to format with the same decision in this call.
     """
     try:
-        df = _read_file(file_path)
-
-        def parse_natural_language(date_str):
-            if pd.isna(date_str):
-                return pd.NaT
-
-            clean_str = str(date_str).lower()
-            replacements = {
-                "first": "1st",
-                "second": "2nd",
-                "third": "3rd",
-                "fourth": "4th",
-                "fifth": "5th",
-                "sixth": "6th",
-                "seventh": "7th",
-                "eighth": "8th",
-                "ninth": "9th",
-                "tenth": "10th",
-                "eleventh": "11th",
-                "twelfth": "12th",
-                "thirteenth": "13th",
-                "fourteenth": "14th",
-                "fifteenth": "15th",
-                "sixteenth": "16th",
-                "seventeenth": "17th",
-                "eighteenth": "18th",
-                "nineteenth": "19th",
-                "twentieth": "20th",
-                "twenty-first": "21st",
-                "twenty first": "21st",
-                "twenty-second": "22nd",
-                "twenty second": "22nd",
-                "twenty-third": "23rd",
-                "twenty third": "23rd",
-                "twenty-fourth": "24th",
-                "twenty fourth": "24th",
-                "twenty-fifth": "25th",
-                "twenty fifth": "25th",
-                "twenty-sixth": "26th",
-                "twenty sixth": "26th",
-                "twenty-seventh": "27th",
-                "twenty seventh": "27th",
-                "twenty-eighth": "28th",
-                "twenty eighth": "28th",
-                "twenty-ninth": "29th",
-                "twenty ninth": "29th",
-                "thirtieth": "30th",
-                "thirty-first": "31st",
-                "thirty first": "31st",
-                "last": "last",
-            }
-            for word, num in replacements.items():
-                clean_str = clean_str.replace(word, num)
-
-            parsed = dateparser.parse(clean_str)
-            return parsed if parsed else pd.NaT
-
-        df[col_name] = df[col_name].apply(parse_natural_language)
-        df[col_name] = df[col_name].dt.strftime(target_format)
-        _save_file(df, file_path)
-        return f"Successfully formatted column '{col_name}' to '{target_format}'."
+        typed = display_formats.TYPED_OUTPUT
+        df = table_io.read_table(file_path)
+        columns = _group(df, col_name, also_apply_to)
+        df = transforms.format_columns(
+            df, columns, transforms.format_time, target_format, typed
+        )
+        operations = [
+            {"col_name": col, "target_format": target_format, "typed": typed}
+            for col in columns
+        ]
+        table_io.save_table(
+            df,
+            file_path,
+            stage="time_formatting",
+            display=display_formats.formats_with(file_path, "time_formatting", operations),
+        )
+        recipe.record_operations(file_path, "time_formatting", operations)
+        return (
+            f"Successfully formatted column '{col_name}'{_group_note(columns)} "
+            f"to '{target_format}'."
+        )
     except Exception as e:
         return f"Error formatting time: {e}"
 
 
 @mcp.tool()
+@offloaded
 def execute_money_formatting(
     file_path: str,
     col_name: str,
@@ -241,6 +409,7 @@ def execute_money_formatting(
     detected_currency: str,
     scale_decision: Literal["None", "Thousands", "Millions", "Billions"],
     decimal_separator: Literal[".", ","],
+    also_apply_to: list[str] | None = None,
 ) -> str:
     """Format a money/financial column in a file. For mixed currencies, a separate
     currency column is inserted to the right. For single currencies, the currency
@@ -253,200 +422,104 @@ def execute_money_formatting(
         detected_currency: The primary currency detected (e.g., 'USD', 'EUR').
         scale_decision: The scale to apply.
         decimal_separator: The decimal separator used in the raw data.
+        also_apply_to: Other columns of the same group (from the reader's
+            "groups") to format with the same decision in this call.
     """
     try:
-        df = _read_file(file_path)
-
-        def parse_money_string(val):
-            if pd.isna(val):
-                return pd.NA, ""
-
-            val_str = str(val).lower().strip()
-            original_str = str(val).strip()
-
-            symbol_match = re.search(
-                r"([\$\u20ac\u00a3\u00a5]|(?:usd|eur|gbp|jpy|dollars?|euros?|pounds?|yen))",
-                original_str,
-                re.IGNORECASE,
-            )
-            raw_symbol = symbol_match.group(1).lower() if symbol_match else ""
-
-            currency_map = {
-                "dollar": "USD",
-                "dollars": "USD",
-                "$": "USD",
-                "usd": "USD",
-                "euro": "EUR",
-                "euros": "EUR",
-                "eur": "EUR",
-                "\u20ac": "EUR",
-                "pound": "GBP",
-                "pounds": "GBP",
-                "gbp": "GBP",
-                "\u00a3": "GBP",
-                "yen": "JPY",
-                "jpy": "JPY",
-                "\u00a5": "JPY",
-            }
-            symbol = currency_map.get(raw_symbol, raw_symbol.upper())
-
-            if decimal_separator == ",":
-                val_str = val_str.replace(".", "").replace(",", ".")
-            else:
-                val_str = val_str.replace(",", "")
-
-            if val_str.count(".") > 1:
-                parts = val_str.rsplit(".", 1)
-                val_str = parts[0].replace(".", "") + "." + parts[1]
-
-            match = re.search(r"[\d\.]+", val_str)
-            if not match:
-                return pd.NA, symbol
-            try:
-                num = float(match.group())
-            except ValueError:
-                return pd.NA, symbol
-
-            isolated_words = re.sub(
-                r"[\d\.\,\u20ac\$\u00a3\u00a5]", " ", val_str
-            ).split()
-
-            if any(
-                w in isolated_words for w in ["billion", "billions", "bill", "bil", "b"]
-            ):
-                num *= 1_000_000_000
-            elif any(
-                w in isolated_words for w in ["million", "millions", "mill", "mil", "m"]
-            ):
-                num *= 1_000_000
-            elif any(w in isolated_words for w in ["thousand", "thousands", "k"]):
-                num *= 1_000
-            elif any(w in isolated_words for w in ["cent", "cents"]):
-                num /= 100
-
-            return num, symbol
-
-        parsed_data = df[col_name].apply(parse_money_string)
-        nums = [x[0] if isinstance(x, tuple) else pd.NA for x in parsed_data]
-        symbols = [x[1] if isinstance(x, tuple) else "" for x in parsed_data]
-
-        df[col_name] = nums
-
-        scale_suffix = ""
-        if scale_decision == "Billions":
-            df[col_name] = df[col_name] / 1_000_000_000
-            scale_suffix = "in billions"
-        elif scale_decision == "Millions":
-            df[col_name] = df[col_name] / 1_000_000
-            scale_suffix = "in millions"
-        elif scale_decision == "Thousands":
-            df[col_name] = df[col_name] / 1_000
-            scale_suffix = "in thousands"
-
-        if is_mixed_currency:
-            # Insert a separate currency column to the right
-            col_idx = df.columns.get_loc(col_name)
-            new_currency_col = f"{col_name}_currency"
-            df.insert(loc=col_idx + 1, column=new_currency_col, value=symbols)
-
-            if scale_suffix:
-                new_col_name = f"{col_name} ({scale_suffix})"
-                df.rename(columns={col_name: new_col_name}, inplace=True)
-        else:
-            parts = []
-            if detected_currency and detected_currency != "Unknown":
-                parts.append(detected_currency)
-            if scale_suffix:
-                parts.append(scale_suffix)
-
-            if parts:
-                header_addition = " ".join(parts)
-                new_col_name = f"{col_name} ({header_addition})"
-                df.rename(columns={col_name: new_col_name}, inplace=True)
-
-        _save_file(df, file_path)
-        return f"Successfully formatted money column '{col_name}'."
+        df = table_io.read_table(file_path)
+        columns = _group(df, col_name, also_apply_to)
+        decision = {
+            "is_mixed_currency": is_mixed_currency,
+            "detected_currency": detected_currency,
+            "scale_decision": scale_decision,
+            "decimal_separator": decimal_separator,
+        }
+        # Renames columns and may insert currency columns, so one at a time.
+        for col in columns:
+            df = transforms.format_money(df, col_name=col, **decision)
+        table_io.save_table(df, file_path, stage="money_formatting")
+        recipe.record_operations(
+            file_path, "money_formatting", [{"col_name": col, **decision} for col in columns]
+        )
+        return f"Successfully formatted money column '{col_name}'{_group_note(columns)}."
     except Exception as e:
         return f"Error formatting money: {e}"
 
 
 @mcp.tool()
-def execute_int_formatting(file_path: str, col_name: str) -> str:
+@offloaded
+def execute_int_formatting(
+    file_path: str, col_name: str, also_apply_to: list[str] | None = None
+) -> str:
     """Clean and truncate a column to integers.
 
     Args:
         file_path: Path to the Excel or CSV file.
         col_name: Name of the column to format.
+        also_apply_to: Other columns of the same group (from the reader's
+            "groups") to format with the same decision in this call.
     """
     try:
-        df = _read_file(file_path)
-
-        def parse_int(val):
-            if pd.isna(val):
-                return pd.NA
-            val_str = str(val).lower().replace(",", "").strip()
-            try:
-                num = float(val_str)
-                return int(num)
-            except ValueError:
-                return pd.NA
-
-        df[col_name] = df[col_name].apply(parse_int)
-        df[col_name] = df[col_name].astype("Int64")
-        _save_file(df, file_path)
-        return f"Successfully formatted integer column '{col_name}'."
+        df = table_io.read_table(file_path)
+        columns = _group(df, col_name, also_apply_to)
+        df = transforms.format_columns(df, columns, transforms.format_int)
+        table_io.save_table(df, file_path, stage="int_formatting")
+        recipe.record_operations(
+            file_path, "int_formatting", [{"col_name": col} for col in columns]
+        )
+        return f"Successfully formatted integer column '{col_name}'{_group_note(columns)}."
     except Exception as e:
         return f"Error formatting integers: {e}"
 
 
 @mcp.tool()
-def execute_float_formatting(file_path: str, col_name: str) -> str:
+@offloaded
+def execute_float_formatting(
+    file_path: str, col_name: str, also_apply_to: list[str] | None = None
+) -> str:
     """Standardize floats for a column.
 
     Args:
         file_path: Path to the Excel or CSV file.
         col_name: Name of the column to format.
+        also_apply_to: Other columns of the same group (from the reader's
+            "groups") to format with the same decision in this call.
     """
     try:
-        df = _read_file(file_path)
-
-        def extract_float(val):
-            if pd.isna(val):
-                return pd.NA
-            val_str = str(val).lower().replace(",", "").strip()
-            try:
-                return float(val_str)
-            except ValueError:
-                return pd.NA
-
-        raw_floats = df[col_name].apply(extract_float)
-
-        max_decimals = 0
-        for val in raw_floats.dropna():
-            parts = str(val).split(".")
-            if len(parts) == 2:
-                decimals = len(parts[1])
-                if max_decimals < decimals:
-                    max_decimals = decimals
-
-        def pad_float(val):
-            if pd.isna(val):
-                return pd.NA
-            return f"{val:.{max_decimals}f}"
-
-        df[col_name] = raw_floats.apply(pad_float)
-        _save_file(df, file_path)
-        return f"Successfully formatted float column '{col_name}' to {max_decimals} decimal places."
+        df = table_io.read_table(file_path)
+        columns = _group(df, col_name, also_apply_to)
+        # Parsed together; every column keeps its own number of decimals.
+        df = transforms.format_columns(df, columns, transforms.parse_floats)
+        typed = display_formats.TYPED_OUTPUT
+        operations = []
+        for col in columns:
+            decimals = transforms.max_decimals(df[col])
+            df[col] = transforms.format_float(df[col], decimals, typed)
+            operations.append({"col_name": col, "decimals": decimals, "typed": typed})
+        table_io.save_table(
+            df,
+            file_path,
+            stage="float_formatting",
+            display=display_formats.formats_with(file_path, "float_formatting", operations),
+        )
+        recipe.record_operations(file_path, "float_formatting", operations)
+        decimals = operations[0]["decimals"]
+        return (
+            f"Successfully formatted float column '{col_name}'{_group_note(columns)} "
+            f"to {decimals} decimal places."
+        )
     except Exception as e:
         return f"Error formatting floats: {e}"
 
 
 @mcp.tool()
+@offloaded
 def execute_name_formatting(
     file_path: str,
     col_name: str,
     entity_type: Literal["Human Names", "Locations/Other"],
     dominant_format: Literal["First Last", "Last First", "N/A"],
+    also_apply_to: list[str] | None = None,
 ) -> str:
     """Standardize proper nouns/names in a column.
 
@@ -455,40 +528,136 @@ def execute_name_formatting(
         col_name: Name of the column to format.
         entity_type: 'Human Names' or 'Locations/Other'.
         dominant_format: 'First Last', 'Last First', or 'N/A'.
+        also_apply_to: Other columns of the same group (from the reader's
+            "groups") to format with the same decision in this call.
     """
     try:
-        df = _read_file(file_path)
-
-        def parse_name(val):
-            if pd.isna(val):
-                return pd.NA
-            clean_name = str(val).strip().title()
-            if entity_type == "Locations/Other":
-                return clean_name
-            if "," in clean_name:
-                parts = [p.strip() for p in clean_name.split(",")]
-                if len(parts) == 2:
-                    return f"{parts[1]} {parts[0]}"
-            if dominant_format == "Last First":
-                parts = clean_name.split()
-                if len(parts) == 2:
-                    return f"{parts[1]} {parts[0]}"
-            return clean_name
-
-        df[col_name] = df[col_name].apply(parse_name)
-        _save_file(df, file_path)
-        return f"Successfully formatted name column '{col_name}'."
+        df = table_io.read_table(file_path)
+        columns = _group(df, col_name, also_apply_to)
+        df = transforms.format_columns(
+            df, columns, transforms.format_name, entity_type, dominant_format
+        )
+        table_io.save_table(df, file_path, stage="name_formatting")
+        recipe.record_operations(
+            file_path,
+            "name_formatting",
+            [
+                {"col_name": col, "entity_type": entity_type, "dominant_format": dominant_format}
+                for col in columns
+            ],
+        )
+        return f"Successfully formatted name column '{col_name}'{_group_note(columns)}."
     except Exception as e:
         return f"Error formatting names: {e}"
 
 
+def _category_counts(series: "pd.Series") -> "pd.Series":
+    text = series.dropna().astype(str).str.strip()
+    return text[text != ""].value_counts()
+
+
+@mcp.tool()
+@offloaded
+def propose_category_clusters(
+    file_path: str, col_name: str, also_apply_to: list[str] | None = None
+) -> str:
+    """Cluster the spelling variants of a categorical column (e.g. 'US', 'U.S.A.',
+    'usa' or 'FAILED', 'fail') by fingerprint, n-gram, stem and initials keys
+    over its distinct values. Returns JSON with the proposed clusters (canonical
+    value and variant counts) and the values left on their own.
+
+    Args:
+        file_path: Path to the Excel or CSV file.
+        col_name: Name of the categorical column.
+        also_apply_to: Other columns of the same group, whose values are
+            clustered together with the column's.
+    """
+    try:
+        df = table_io.read_table(file_path)
+        columns = _group(df, col_name, also_apply_to)
+        counts = _category_counts(transforms.stack_columns(df, columns))
+        if len(counts) > CATEGORY_MAX_DISTINCT:
+            return (
+                f"Column '{col_name}' has {len(counts)} distinct values; "
+                f"too many for a categorical column (max {CATEGORY_MAX_DISTINCT})."
+            )
+        mapping = transforms.cluster_categories(counts)
+        clusters = {}
+        for variant, canonical in mapping.items():
+            clusters.setdefault(canonical, {canonical: int(counts[canonical])})
+            clusters[canonical][variant] = int(counts[variant])
+        clustered = set(mapping) | set(clusters)
+        result = {
+            "distinct": len(counts),
+            "clusters": [
+                {"canonical": canonical, "variants": variants}
+                for canonical, variants in clusters.items()
+            ],
+            "unclustered": {
+                val: int(n) for val, n in counts.items() if val not in clustered
+            },
+        }
+        return json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+    except Exception as e:
+        return f"Error clustering categories: {e}"
+
+
+@mcp.tool()
+@offloaded
+def execute_category_normalization(
+    file_path: str,
+    col_name: str,
+    mapping_json: str = "",
+    also_apply_to: list[str] | None = None,
+) -> str:
+    """Replace the variants of a categorical column by their canonical value.
+
+    Args:
+        file_path: Path to the Excel or CSV file.
+        col_name: Name of the categorical column.
+        mapping_json: JSON object mapping each variant to its canonical value,
+            e.g. '{"U.S.A.": "USA", "usa": "USA"}'. If empty, the clusters from
+            `propose_category_clusters` are applied unchanged.
+        also_apply_to: Other columns of the same group (from the reader's
+            "groups") to normalize with the same mapping in this call.
+    """
+    try:
+        df = table_io.read_table(file_path)
+        columns = _group(df, col_name, also_apply_to)
+        if mapping_json:
+            mapping = {str(k).strip(): str(v) for k, v in json.loads(mapping_json).items()}
+        else:
+            mapping = transforms.cluster_categories(
+                _category_counts(transforms.stack_columns(df, columns))
+            )
+        mapping = {k: v for k, v in mapping.items() if k != v}
+        df = transforms.format_columns(
+            df, columns, transforms.apply_category_mapping, mapping
+        )
+        table_io.save_table(df, file_path, stage="category_normalization")
+        recipe.record_operations(
+            file_path,
+            "category_normalization",
+            [{"col_name": col, "mapping": mapping} for col in columns],
+        )
+        canonical = df[col_name].nunique()
+        return (
+            f"Normalized {len(mapping)} variants in column '{col_name}'{_group_note(columns)}; "
+            f"{canonical} distinct values remain."
+        )
+    except Exception as e:
+        return f"Error normalizing categories: {e}"
+
+
 @mcp.tool()
+@offloaded
 def execute_dataset_description(
     file_path: str, general_summary: str, features_json: str
 ) -> str:
     """Save a dataset description as a second sheet in the Excel file.
     The cleaned data goes to "Cleaned_Data" sheet and the description goes to
-    "dataset_description" sheet.
+    "dataset_description" sheet. Text files get a "<name>_description.csv"
+    next to them instead.
 
     Args:
         file_path: Path to the Excel file.
@@ -497,28 +666,26 @@ def execute_dataset_description(
             "Feature Name", "Conceptual Data Type", "Description".
     """
     try:
-        df = _read_file(file_path)
+        df = table_io.read_table(file_path)
         features = json.loads(features_json)
         desc_df = pd.DataFrame(features)
+        recipe.record_operation(
+            file_path,
+            "dataset_description",
+            general_summary=general_summary,
+            features=features,
+        )
 
-        if file_path.endswith(".csv"):
-            desc_path = file_path.replace(".csv", "_description.csv")
-            df.to_csv(file_path, index=False)
-            desc_df.to_csv(desc_path, index=False)
-            return (
-                f"Saved cleaned data to '{file_path}' and description to '{desc_path}'."
-            )
-        else:
-            with pd.ExcelWriter(file_path, engine="openpyxl") as writer:
-                df.to_excel(writer, sheet_name="Cleaned_Data", index=False)
-                desc_df.to_excel(writer, sheet_name="dataset_description", index=False)
-            return (
-                f"Saved multi-sheet file to '{file_path}' with "
-                f"Cleaned_Data and dataset_description sheets."
-            )
+        saved_to = table_io.save_with_description(df, desc_df, file_path)
+        return f"Saved cleaned data to '{file_path}' and description to {saved_to}."
     except Exception as e:
         return f"Error saving description: {e}"
 
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    try:
+        warm_up("sampling", "table_io", "transforms")
+        mcp.run(transport="stdio")
+    finally:
+        shutdown_executor()
+        metrics.process_exited()
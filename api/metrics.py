@@ -0,0 +1,153 @@
+"""
+Metrics
+=======
+Prometheus metrics of the backend, served as text by `GET /metrics` in
+app.py.
+
+Jobs run in other processes than the server: every runner.py job, the MCP
+server it starts and the FastAPI app itself. All of them record into the
+multiprocess directory PROMETHEUS_MULTIPROC_DIR (a temp dir by default), and
+the endpoint aggregates it, so one scrape covers every worker of the host.
+The directory outlives the processes, so the API clears the files of the
+processes that are gone when it starts (`clear_stale`): counters of an
+earlier server lifetime are not summed into the new one, and the files do
+not build up. Jobs and tool servers still running keep theirs. Every process
+marks itself dead when it exits (`process_exited`; the MCP tool workers do so
+at exit), which drops its live gauges.
+Job metrics carry a `worker` label (METRICS_WORKER, the host name by default)
+so the hosts of a fleet can be compared.
+
+    pipeline_jobs_in_flight               jobs running now
+    pipeline_jobs_queued                  batch files waiting for a pipeline slot
+                                          (BATCH_CONCURRENCY)
+    pipeline_jobs_total                   finished jobs, by status
+    pipeline_job_seconds                  job latency, by status
+    pipeline_stage_seconds                stage latency, by stage
+    pipeline_rows_processed_total         rows of the finished jobs
+    model_calls_queued                    model calls waiting for rate capacity
+    model_calls_total                     model calls, by agent and model
+    model_tokens_total                    tokens, by agent and direction
+                                          (input, cached_input, output)
+    mcp_tool_seconds                      MCP tool run time, by tool
+    cache_requests_total                  cache lookups, by cache and result
+                                          (hit, miss)
+    worker_resident_memory_bytes          RSS, by process id
+
+Cache hit ratios and the share of cached input tokens are ratios of these
+counters, e.g. sum(rate(cache_requests_total{result="hit"}[5m])) by (cache)
+/ sum(rate(cache_requests_total[5m])) by (cache).
+"""
+
+import os
+import socket
+import tempfile
+from pathlib import Path
+
+# The multiprocess mode is chosen when prometheus_client is first imported.
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", str(Path(tempfile.gettempdir()) / "hackeurope-metrics")
+)
+Path(os.environ["PROMETHEUS_MULTIPROC_DIR"]).mkdir(parents=True, exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+METRICS_WORKER = os.environ.get("METRICS_WORKER") or socket.gethostname()
+
+# Jobs take minutes, tools and stages seconds.
+JOB_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, float("inf"))
+STAGE_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float("inf"))
+TOOL_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+jobs_in_flight = Gauge(
+    "pipeline_jobs_in_flight", "Jobs running now", ["worker"], multiprocess_mode="livesum"
+)
+jobs_queued = Gauge(
+    "pipeline_jobs_queued",
+    "Batch files waiting for a pipeline slot",
+    ["worker"],
+    multiprocess_mode="livesum",
+)
+jobs_total = Counter("pipeline_jobs_total", "Finished jobs", ["worker", "status"])
+job_seconds = Histogram(
+    "pipeline_job_seconds", "Job latency", ["worker", "status"], buckets=JOB_BUCKETS
+)
+stage_seconds = Histogram(
+    "pipeline_stage_seconds", "Stage latency", ["worker", "stage"], buckets=STAGE_BUCKETS
+)
+rows_processed = Counter("pipeline_rows_processed_total", "Rows of the finished jobs", ["worker"])
+model_calls_queued = Gauge(
+    "model_calls_queued",
+    "Model calls waiting for rate-limit capacity",
+    ["lane"],
+    multiprocess_mode="livesum",
+)
+model_calls = Counter("model_calls_total", "Model calls", ["agent", "model"])
+model_tokens = Counter("model_tokens_total", "Model tokens", ["agent", "direction"])
+tool_seconds = Histogram("mcp_tool_seconds", "MCP tool run time", ["tool"], buckets=TOOL_BUCKETS)
+cache_requests = Counter("cache_requests_total", "Cache lookups", ["cache", "result"])
+resident_memory = Gauge(
+    "worker_resident_memory_bytes", "Resident memory of the process", multiprocess_mode="liveall"
+)
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    cache_requests.labels(cache, "hit" if hit else "miss").inc()
+
+
+def observe_model_call(agent: str, model: str | None, usage) -> None:
+    """Count a model call and its tokens, from an agents SDK `Usage`."""
+    model_calls.labels(agent, model if isinstance(model, str) else "default").inc()
+    cached = getattr(getattr(usage, "input_tokens_details", None), "cached_tokens", 0) or 0
+    model_tokens.labels(agent, "input").inc(usage.input_tokens or 0)
+    model_tokens.labels(agent, "cached_input").inc(cached)
+    model_tokens.labels(agent, "output").inc(usage.output_tokens or 0)
+
+
+def sample_memory() -> None:
+    """Record the RSS of this process (Linux; no-op elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return
+    resident_memory.set(pages * os.sysconf("SC_PAGE_SIZE"))
+
+
+def process_exited(pid: int | None = None) -> None:
+    """Drop the live gauges of a finished process from the aggregate."""
+    multiprocess.mark_process_dead(pid or os.getpid())
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clear_stale() -> None:
+    """Remove the metric files of processes that are no longer running from
+    the multiprocess directory, e.g. those of an earlier server lifetime."""
+    for path in Path(os.environ["PROMETHEUS_MULTIPROC_DIR"]).glob("*.db"):
+        pid = path.stem.rpartition("_")[2]
+        if pid.isdigit() and not _alive(int(pid)):
+            path.unlink(missing_ok=True)
+
+
+def render() -> tuple[bytes, str]:
+    """The aggregated metrics of all processes, and their content type."""
+    sample_memory()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,344 @@
+"""
+Model Tiering
+=============
+Most column decisions are easy: '%Y' for a column of years, 'First Last' for
+clean names. The column agents (time, money, name) therefore try a small,
+fast model first and only escalate to the large model when the small one is
+not good enough.
+
+An agent returns its decision as structured output, with a confidence. Before
+anything is written, the decision is checked against the column's own data:
+
+  - time: the values must parse (PARSE_THRESHOLD of them), and the format
+    must not drop the time of day of timestamps or the date of date-times;
+  - money: the values must parse, the currencies found must agree with
+    `is_mixed_currency` and `detected_currency`, the decimal separator must
+    match the values, and the scale must not shrink them below 0.1;
+  - name: human names must mostly look like names, and 'Locations/Other'
+    must not be mostly 'Last, First' pairs.
+
+A decision that fails a check, or whose confidence is below
+CONFIDENCE_THRESHOLD, is retried on the next tier of the agent's policy, with
+the failed checks in its prompt. The last tier's decision is applied as is.
+
+Policies map an agent to its tiers, smallest first. They can be replaced per
+agent with MODEL_ROUTING_POLICY, e.g. '{"money": ["gpt-4o-2024-08-06"]}', and
+MODEL_ROUTING=0 sends every agent straight to the large model.
+
+Every attempt is appended to MODEL_ROUTING_LOG (JSON lines) so the policy can
+be tuned from its escalation rates:
+
+    python api/model_routing.py
+"""
+
+import functools
+import json
+import os
+import re
+import sys
+import tempfile
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Literal
+
+import metrics
+import pandas as pd
+import transforms
+from agents import Agent, RunConfig, RunHooks, Runner
+from table_io import read_table
+
+SMALL_MODEL = "gpt-4o-mini"
+LARGE_MODEL = "gpt-4o-2024-08-06"
+
+MODEL_ROUTING = os.environ.get("MODEL_ROUTING", "1") != "0"
+MODEL_ROUTING_LOG = Path(
+    os.environ.get(
+        "MODEL_ROUTING_LOG",
+        Path(tempfile.gettempdir()) / "hackeurope-model-routing.jsonl",
+    )
+)
+
+DEFAULT_POLICY = {
+    "time": [SMALL_MODEL, LARGE_MODEL],
+    "money": [SMALL_MODEL, LARGE_MODEL],
+    "name": [SMALL_MODEL, LARGE_MODEL],
+}
+
+CONFIDENCE_THRESHOLD = 0.8
+PARSE_THRESHOLD = 0.99
+# Share of values allowed to lose information to the chosen format.
+MAX_LOSSY_SHARE = 0.01
+NAME_SHAPE_THRESHOLD = 0.9
+# Checks run on this many of the most frequent distinct values, weighted by
+# their counts.
+VALIDATION_MAX_DISTINCT = 2000
+
+_NAME_RE = re.compile(r"^[^\W\d_]+(?:[\s'.\-]+[^\W\d_]+){1,3}$")
+_LAST_FIRST_RE = re.compile(r"^[^\W\d_][^,]*,\s*[^\W\d_][^,]*$")
+_DOT_DECIMAL_RE = re.compile(r"\d\.\d{1,2}\D*$")
+_COMMA_DECIMAL_RE = re.compile(r"\d,\d{1,2}\D*$")
+
+
+@dataclass
+class TimeDecision:
+    target_format: Literal[
+        "%H:%M",
+        "%H:%M:%S",
+        "%S",
+        "%d/%m/%Y",
+        "%d/%m/%Y %H:%M",
+        "%d/%m/%Y %H:%M:%S",
+        "%m/%Y",
+        "%Y",
+    ]
+    confidence: float
+
+
+@dataclass
+class MoneyDecision:
+    is_mixed_currency: bool
+    detected_currency: str
+    scale_decision: Literal["None", "Thousands", "Millions", "Billions"]
+    decimal_separator: Literal[".", ","]
+    confidence: float
+
+
+@dataclass
+class NameDecision:
+    entity_type: Literal["Human Names", "Locations/Other"]
+    dominant_format: Literal["First Last", "Last First", "N/A"]
+    confidence: float
+
+
+@dataclass
+class Validation:
+    passed: bool
+    failures: list[str] = field(default_factory=list)
+    metrics: dict = field(default_factory=dict)
+
+
+def routing_policy() -> dict[str, list[str]]:
+    """The tiers of every routed agent, smallest model first."""
+    if not MODEL_ROUTING:
+        return {agent: [LARGE_MODEL] for agent in DEFAULT_POLICY}
+    policy = dict(DEFAULT_POLICY)
+    policy.update(json.loads(os.environ.get("MODEL_ROUTING_POLICY", "{}")))
+    return policy
+
+
+def _value_counts(series: pd.Series) -> pd.Series:
+    text = series.dropna().astype(str).str.strip()
+    return text[text != ""].value_counts().head(VALIDATION_MAX_DISTINCT)
+
+
+def _share(mask, counts: pd.Series) -> float:
+    total = counts.sum()
+    return float(counts[mask].sum() / total) if total else 1.0
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_dates(values: tuple[str, ...]) -> pd.Series:
+    """Parsed dates of distinct values, shared by the tiers of a column."""
+    return pd.to_datetime(
+        pd.Series([transforms.parse_natural_date(v) for v in values], index=values)
+    )
+
+
+def validate_time(series: pd.Series, decision: TimeDecision) -> Validation:
+    counts = _value_counts(series)
+    hits = _parse_dates.cache_info().hits
+    parsed = _parse_dates(tuple(counts.index))
+    metrics.cache_lookup("parsed_dates", _parse_dates.cache_info().hits > hits)
+    ok = parsed.notna()
+    result = Validation(True, metrics={"parsed": round(_share(ok, counts), 4)})
+    if result.metrics["parsed"] < PARSE_THRESHOLD:
+        result.failures.append(
+            f"only {result.metrics['parsed']:.1%} of the values parse as dates or times"
+        )
+
+    fmt = decision.target_format
+    parsed, counts = parsed[ok], counts[ok]
+    if "%H" not in fmt:
+        has_time = parsed.dt.normalize() != parsed
+        result.metrics["time_dropped"] = round(_share(has_time, counts), 4)
+        if result.metrics["time_dropped"] > MAX_LOSSY_SHARE:
+            result.failures.append(
+                f"'{fmt}' drops the time of day of "
+                f"{result.metrics['time_dropped']:.1%} of the values"
+            )
+    if "%Y" not in fmt and parsed.dt.normalize().nunique() > 1:
+        result.failures.append(f"'{fmt}' drops the date of values spanning several days")
+    result.passed = not result.failures
+    return result
+
+
+def validate_money(series: pd.Series, decision: MoneyDecision) -> Validation:
+    counts = _value_counts(series)
+    parsed = [transforms.parse_money(v, decision.decimal_separator) for v in counts.index]
+    nums = pd.Series([p[0] for p in parsed], index=counts.index, dtype="Float64")
+    symbols = {p[1] for p in parsed if p[1]}
+    result = Validation(
+        True,
+        metrics={
+            "parsed": round(_share(nums.notna(), counts), 4),
+            "currencies": sorted(symbols),
+        },
+    )
+    if result.metrics["parsed"] < PARSE_THRESHOLD:
+        result.failures.append(
+            f"only {result.metrics['parsed']:.1%} of the values parse as amounts"
+        )
+
+    if not decision.is_mixed_currency and len(symbols) > 1:
+        result.failures.append(
+            f"several currencies found ({', '.join(sorted(symbols))}) but not marked as mixed"
+        )
+    if decision.is_mixed_currency and len(symbols) <= 1:
+        result.failures.append("marked as mixed but at most one currency found")
+    if (
+        len(symbols) == 1
+        and not decision.is_mixed_currency
+        and decision.detected_currency not in (*symbols, "Unknown")
+    ):
+        result.failures.append(
+            f"detected currency '{decision.detected_currency}' "
+            f"but the values use {next(iter(symbols))}"
+        )
+
+    dot = _share(counts.index.str.contains(_DOT_DECIMAL_RE), counts)
+    comma = _share(counts.index.str.contains(_COMMA_DECIMAL_RE), counts)
+    if (decision.decimal_separator == ".") == (comma > dot) and max(dot, comma) > 0:
+        result.failures.append(
+            f"decimal separator '{decision.decimal_separator}' does not match the values "
+            f"({dot:.0%} end in '.dd', {comma:.0%} in ',dd')"
+        )
+
+    divisor = {"Thousands": 1e3, "Millions": 1e6, "Billions": 1e9}.get(decision.scale_decision)
+    magnitude = nums.abs().dropna()
+    if divisor and len(magnitude) and magnitude.median() / divisor < 0.1:
+        result.failures.append(
+            f"scale '{decision.scale_decision}' turns the median amount {magnitude.median():,.0f} "
+            f"into {magnitude.median() / divisor:.3g}"
+        )
+    result.passed = not result.failures
+    return result
+
+
+def validate_name(series: pd.Series, decision: NameDecision) -> Validation:
+    counts = _value_counts(series)
+    names = _share(counts.index.str.match(_NAME_RE), counts)
+    last_first = _share(counts.index.str.match(_LAST_FIRST_RE), counts)
+    result = Validation(True, metrics={"name_shaped": round(names + last_first, 4)})
+    if (
+        decision.entity_type == "Human Names"
+        and names + last_first < NAME_SHAPE_THRESHOLD
+    ):
+        result.failures.append(
+            f"only {names + last_first:.1%} of the values look like person names"
+        )
+    if decision.entity_type == "Locations/Other" and last_first >= NAME_SHAPE_THRESHOLD:
+        result.failures.append(f"{last_first:.1%} of the values look like 'Last, First' names")
+    result.passed = not result.failures
+    return result
+
+
+VALIDATORS = {"time": validate_time, "money": validate_money, "name": validate_name}
+
+
+def log_attempt(record: dict) -> None:
+    MODEL_ROUTING_LOG.parent.mkdir(parents=True, exist_ok=True)
+    with open(MODEL_ROUTING_LOG, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+async def decide(
+    route: str,
+    template: Agent,
+    file_path: str,
+    col_name: str,
+    run_config: RunConfig | None = None,
+    hooks: RunHooks | None = None,
+    also_apply_to: list[str] | tuple = (),
+):
+    """Get a validated decision for a column, escalating through the tiers.
+
+    Returns (decision, model). `template` is the agent of the route, whose
+    output type is the route's decision. `hooks` see the calls of every tier.
+    A decision for a group of columns (`also_apply_to`, see column_groups.py)
+    is validated against the values of all of them.
+    """
+    tiers = routing_policy()[route]
+    validate = VALIDATORS[route]
+    series = transforms.stack_columns(read_table(file_path), [col_name, *also_apply_to])
+    prompt = f'Decide how to format the column "{col_name}" in file "{file_path}".'
+    if also_apply_to:
+        prompt += (
+            f" The decision also applies to {len(also_apply_to)} other columns of the "
+            "same shape, so it must fit values like theirs too."
+        )
+    feedback = ""
+    for tier, model in enumerate(tiers):
+        last = tier == len(tiers) - 1
+        record = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "agent": route,
+            "file": Path(file_path).name,
+            "column": col_name,
+            "tier": tier,
+            "model": model,
+        }
+        try:
+            result = await Runner.run(
+                template.clone(model=model),
+                prompt + feedback,
+                run_config=run_config,
+                hooks=hooks,
+            )
+            decision = result.final_output
+            validation = validate(series, decision)
+        except Exception as e:
+            if last:
+                raise
+            record.update(error=str(e)[:200], escalated=True)
+            log_attempt(record)
+            feedback = f"\n\nA previous attempt failed: {e}"
+            continue
+        if decision.confidence < CONFIDENCE_THRESHOLD:
+            validation.failures.append(f"confidence {decision.confidence:.2f} is too low")
+        accepted = last or not validation.failures
+        record.update(
+            decision=asdict(decision),
+            checks=validation.metrics,
+            failures=validation.failures,
+            escalated=not accepted,
+        )
+        log_attempt(record)
+        if accepted:
+            return decision, model
+        feedback = (
+            f"\n\nA previous attempt decided {json.dumps(asdict(decision))}, "
+            f"which failed these checks against the data: {'; '.join(validation.failures)}. "
+            "Look at more of the data before deciding."
+        )
+
+
+def escalation_summary(log_path: Path | None = None) -> pd.DataFrame:
+    """Per agent and tier: attempts, escalations and escalation rate."""
+    path = log_path or MODEL_ROUTING_LOG
+    if not path.exists():
+        return pd.DataFrame()
+    log = pd.read_json(path, lines=True)
+    summary = log.groupby(["agent", "tier", "model"]).agg(
+        attempts=("escalated", "size"), escalated=("escalated", "sum")
+    )
+    summary["escalation_rate"] = (summary["escalated"] / summary["attempts"]).round(3)
+    return summary.reset_index()
+
+
+if __name__ == "__main__":
+    summary = escalation_summary()
+    if summary.empty:
+        print(f"No routing decisions logged in {MODEL_ROUTING_LOG}", file=sys.stderr)
+    else:
+        print(summary.to_string(index=False))
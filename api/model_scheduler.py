@@ -0,0 +1,403 @@
+"""
+Model Request Scheduler
+=======================
+Every runner job is its own process, and each used to send its model calls
+independently. When several jobs ran at once, they hit the provider's rate
+limits and stalled in uncoordinated retries.
+
+Model calls now go through one scheduler shared by all jobs on the machine.
+Its state is a small JSON file guarded by a file lock:
+
+  - Two token buckets enforce MODEL_RPM requests and MODEL_TPM tokens per
+    minute, with bursts of at most MODEL_BURST_SECONDS worth of either (a
+    minute by default, as providers count). Set them to the limits of your
+    provider tier; a limit left at 0 (the default) is not enforced, and only
+    the provider's rate-limit errors slow the jobs down. A call reserves an
+    estimate of its tokens, which is corrected by the usage the provider
+    reports, for streamed calls too.
+  - Waiting calls are granted by priority lane first: "interactive" uploads go
+    ahead of "bulk" backfills. A bulk call waiting longer than
+    LANE_PROMOTION_SECONDS is served like an interactive one, so backfills are
+    never starved.
+  - Within a lane, the job that was served longest ago goes first, so one job
+    with many columns cannot crowd out the others.
+  - A rate-limit error pauses every job for the retry delay (the provider's
+    Retry-After, or an exponential backoff with full jitter), and the call is
+    retried up to MODEL_MAX_RETRIES times.
+
+The time every job spent waiting is kept per job, both in the job
+(`ModelScheduler.stats`) and in the shared state:
+
+    python api/model_scheduler.py    # queue wait of the recent jobs
+
+Wrap a provider with `ScheduledModelProvider` and pass it in the RunConfig of
+the run; sub-agents used as tools inherit it.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections.abc import AsyncIterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import metrics
+from agents import Model, ModelProvider, OpenAIProvider
+
+MODEL_SCHEDULER = os.environ.get("MODEL_SCHEDULER", "1") != "0"
+MODEL_RPM = int(os.environ.get("MODEL_RPM", "0"))
+MODEL_TPM = int(os.environ.get("MODEL_TPM", "0"))
+MODEL_BURST_SECONDS = float(os.environ.get("MODEL_BURST_SECONDS", "60"))
+MODEL_MAX_RETRIES = int(os.environ.get("MODEL_MAX_RETRIES", "6"))
+SCHEDULER_STATE = Path(
+    os.environ.get(
+        "SCHEDULER_STATE",
+        Path(tempfile.gettempdir()) / "hackeurope-model-scheduler.json",
+    )
+)
+
+LANES = {"interactive": 0, "bulk": 1}
+LANE_PROMOTION_SECONDS = 60.0
+# Backoff delays are drawn from [0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt)].
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Waiting calls re-check the shared state at least this often, and are dropped
+# from it when their process has not done so for TICKET_TTL (e.g. it died).
+POLL_SECONDS = 0.5
+TICKET_TTL = 10.0
+# Per-job statistics are kept this long after the job's last call.
+JOB_TTL = 3600.0
+# Rough size of a token in characters, and the output reserved when a call
+# does not set max_tokens.
+CHARS_PER_TOKEN = 4
+DEFAULT_OUTPUT_TOKENS = 1000
+
+
+def _limits() -> dict[str, tuple[float, float]]:
+    """(capacity, refill per second) of every enforced bucket."""
+    return {
+        name: (limit * MODEL_BURST_SECONDS / 60.0, limit / 60.0)
+        for name, limit in (("requests", MODEL_RPM), ("tokens", MODEL_TPM))
+        if limit > 0
+    }
+
+
+def _empty_state(now: float) -> dict:
+    return {
+        "buckets": {
+            name: {"level": capacity, "updated": now}
+            for name, (capacity, _) in _limits().items()
+        },
+        "paused_until": 0.0,
+        "waiting": {},
+        "jobs": {},
+    }
+
+
+@contextmanager
+def _shared_state(path: Path = SCHEDULER_STATE):
+    """Yield the shared state under an exclusive lock and save it afterwards."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix(path.suffix + ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            now = time.time()
+            try:
+                state = json.loads(path.read_text())
+            except (FileNotFoundError, ValueError):
+                state = _empty_state(now)
+            yield state, now
+            tmp = path.with_suffix(path.suffix + ".tmp")
+            tmp.write_text(json.dumps(state))
+            os.replace(tmp, path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _refill(state: dict, now: float) -> None:
+    for name, (capacity, rate) in _limits().items():
+        bucket = state["buckets"].setdefault(name, {"level": capacity, "updated": now})
+        elapsed = max(0.0, now - bucket["updated"])
+        bucket["level"] = min(capacity, bucket["level"] + elapsed * rate)
+        bucket["updated"] = now
+
+
+def _prune(state: dict, now: float) -> None:
+    state["waiting"] = {
+        ticket: w for ticket, w in state["waiting"].items() if now - w["seen"] < TICKET_TTL
+    }
+    state["jobs"] = {
+        job: s for job, s in state["jobs"].items() if now - s["seen"] < JOB_TTL
+    }
+
+
+def _queue(state: dict, now: float) -> list[str]:
+    """Waiting calls in serving order: by lane, then least recently served job."""
+
+    def order(item):
+        _, w = item
+        lane = LANES.get(w["lane"], len(LANES))
+        if now - w["since"] >= LANE_PROMOTION_SECONDS:
+            lane = 0
+        last_grant = state["jobs"].get(w["job"], {}).get("last_grant", 0.0)
+        return lane, last_grant, w["since"]
+
+    return [ticket for ticket, _ in sorted(state["waiting"].items(), key=order)]
+
+
+def estimate_tokens(*parts, max_output_tokens: int | None = None) -> int:
+    """Rough token count of a request: its serialized text plus reserved output."""
+    chars = sum(len(json.dumps(p, default=str)) for p in parts if p is not None)
+    return chars // CHARS_PER_TOKEN + (max_output_tokens or DEFAULT_OUTPUT_TOKENS)
+
+
+def is_rate_limit(exc: Exception) -> bool:
+    return getattr(exc, "status_code", None) == 429
+
+
+def _retry_after(exc: Exception) -> float | None:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelScheduler:
+    """Admission of one job's model calls into the shared rate limits."""
+
+    def __init__(self, job_id: str, lane: str = "interactive", state_path: Path | None = None):
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane '{lane}', expected one of {sorted(LANES)}")
+        self.job_id = job_id
+        self.lane = lane
+        self.state_path = state_path or SCHEDULER_STATE
+        self.requests = 0
+        self.rate_limited = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _try_grant(self, ticket: str, tokens: int) -> float:
+        """Grant the call if it is next and fits; else return the time to wait."""
+        with _shared_state(self.state_path) as (state, now):
+            _refill(state, now)
+            _prune(state, now)
+            limits = _limits()
+            if "tokens" in limits:
+                tokens = min(tokens, limits["tokens"][0])
+            waiting = state["waiting"].setdefault(
+                ticket,
+                {"job": self.job_id, "lane": self.lane, "since": now, "tokens": tokens},
+            )
+            waiting["seen"] = now
+            job = state["jobs"].setdefault(
+                self.job_id,
+                {"lane": self.lane, "requests": 0, "wait_seconds": 0.0, "last_grant": 0.0},
+            )
+            job["seen"] = now
+
+            if now < state["paused_until"]:
+                return state["paused_until"] - now
+            # A call may go once the buckets hold enough for it and for every
+            # call ahead of it, so it never takes capacity they are waiting for.
+            queue = _queue(state, now)
+            ahead = queue[: queue.index(ticket) + 1]
+            buckets = state["buckets"]
+            needed = {
+                "requests": len(ahead),
+                "tokens": sum(state["waiting"][t]["tokens"] for t in ahead),
+            }
+            short = max(
+                ((needed[name] - buckets[name]["level"]) / rate for name, (_, rate) in limits.items()),
+                default=0.0,
+            )
+            if short > 0:
+                return short
+
+            for name, used in (("requests", 1), ("tokens", waiting["tokens"])):
+                if name in limits:
+                    buckets[name]["level"] -= used
+            waited = now - waiting["since"]
+            del state["waiting"][ticket]
+            job["requests"] += 1
+            job["wait_seconds"] += waited
+            job["last_grant"] = now
+        self.requests += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return 0.0
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until a call of about `tokens` tokens may be sent."""
+        ticket = uuid.uuid4().hex
+        delay = await asyncio.to_thread(self._try_grant, ticket, tokens)
+        if delay <= 0:
+            return
+        queued = metrics.model_calls_queued.labels(self.lane)
+        queued.inc()
+        try:
+            while delay > 0:
+                await asyncio.sleep(min(delay, POLL_SECONDS) * random.uniform(0.8, 1.0))
+                delay = await asyncio.to_thread(self._try_grant, ticket, tokens)
+        finally:
+            queued.dec()
+
+    async def settle(self, reserved: int, used: int) -> None:
+        """Return the unused part of a reservation, or charge the excess."""
+        if not used or used == reserved or "tokens" not in _limits():
+            return
+        await asyncio.to_thread(self._settle, reserved, used)
+
+    def _settle(self, reserved: int, used: int) -> None:
+        with _shared_state(self.state_path) as (state, now):
+            _refill(state, now)
+            capacity = _limits()["tokens"][0]
+            bucket = state["buckets"]["tokens"]
+            bucket["level"] = min(capacity, bucket["level"] + min(reserved, capacity) - used)
+
+    async def backoff(self, attempt: int, exc: Exception) -> float:
+        """Pause every job after a rate-limit error; returns the delay."""
+        self.rate_limited += 1
+        delay = _retry_after(exc)
+        if delay is None:
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+        await asyncio.to_thread(self._pause, delay)
+        return delay
+
+    def _pause(self, delay: float) -> None:
+        with _shared_state(self.state_path) as (state, now):
+            state["paused_until"] = max(state["paused_until"], now + delay)
+            # The provider disagrees with our buckets: assume they are empty.
+            for bucket in state["buckets"].values():
+                bucket["level"] = min(bucket["level"], 0.0)
+
+    def stats(self) -> dict:
+        return {
+            "jobId": self.job_id,
+            "lane": self.lane,
+            "modelRequests": self.requests,
+            "rateLimited": self.rate_limited,
+            "queueWaitSeconds": round(self.wait_seconds, 2),
+            "maxQueueWaitSeconds": round(self.max_wait_seconds, 2),
+        }
+
+
+class ScheduledModel(Model):
+    """A model whose calls are admitted by a ModelScheduler."""
+
+    def __init__(self, model: Model, scheduler: ModelScheduler):
+        self.model = model
+        self.scheduler = scheduler
+
+    def _reservation(self, system_instructions, input, model_settings, tools) -> int:
+        return estimate_tokens(
+            system_instructions,
+            input,
+            [getattr(t, "params_json_schema", t.name) for t in tools],
+            max_output_tokens=model_settings.max_tokens,
+        )
+
+    async def _retries(self, attempt: int, exc: Exception) -> bool:
+        """Whether a failed call is retried; pauses every job if it is."""
+        if not is_rate_limit(exc) or attempt >= MODEL_MAX_RETRIES:
+            return False
+        delay = await self.scheduler.backoff(attempt, exc)
+        print(
+            f"[scheduler] {self.scheduler.job_id}: rate limited, retrying in {delay:.1f}s",
+            file=sys.stderr,
+            flush=True,
+        )
+        return True
+
+    async def get_response(
+        self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs
+    ):
+        reserved = self._reservation(system_instructions, input, model_settings, tools)
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(reserved)
+            try:
+                response = await self.model.get_response(
+                    system_instructions, input, model_settings, tools,
+                    output_schema, handoffs, tracing, **kwargs,
+                )
+            except Exception as exc:
+                if not await self._retries(attempt, exc):
+                    raise
+                attempt += 1
+                continue
+            await self.scheduler.settle(reserved, response.usage.total_tokens)
+            return response
+
+    async def stream_response(
+        self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs
+    ) -> AsyncIterator:
+        reserved = self._reservation(system_instructions, input, model_settings, tools)
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(reserved)
+            started, used = False, 0
+            try:
+                async for event in self.model.stream_response(
+                    system_instructions, input, model_settings, tools,
+                    output_schema, handoffs, tracing, **kwargs,
+                ):
+                    if getattr(event, "type", None) == "response.completed":
+                        usage = getattr(event.response, "usage", None)
+                        used = getattr(usage, "total_tokens", 0) or 0
+                    started = True
+                    yield event
+            except Exception as exc:
+                # Only a stream that has not sent anything yet can be retried.
+                if started or not await self._retries(attempt, exc):
+                    raise
+                attempt += 1
+                continue
+            await self.scheduler.settle(reserved, used)
+            return
+
+
+class ScheduledModelProvider(ModelProvider):
+    """Route every model of a provider through a ModelScheduler.
+
+    Without a provider, the OpenAI provider is used with the client's own
+    retries disabled, so rate-limit retries are left to the scheduler.
+    """
+
+    def __init__(self, scheduler: ModelScheduler, provider: ModelProvider | None = None):
+        self.scheduler = scheduler
+        self._provider = provider
+
+    def get_model(self, model_name: str | None) -> Model:
+        if self._provider is None:
+            from openai import AsyncOpenAI
+
+            self._provider = OpenAIProvider(openai_client=AsyncOpenAI(max_retries=0))
+        return ScheduledModel(self._provider.get_model(model_name), self.scheduler)
+
+
+def job_stats(state_path: Path | None = None) -> dict[str, dict]:
+    """Queue statistics of the recent jobs, from the shared state."""
+    with _shared_state(state_path or SCHEDULER_STATE) as (state, now):
+        _prune(state, now)
+        waiting = {}
+        for w in state["waiting"].values():
+            waiting[w["job"]] = waiting.get(w["job"], 0) + 1
+        return {
+            job: {**s, "waiting": waiting.get(job, 0)} for job, s in state["jobs"].items()
+        }
+
+
+if __name__ == "__main__":
+    for job, s in sorted(job_stats().items(), key=lambda kv: -kv[1]["last_grant"]):
+        print(
+            f"{job:<40} {s['lane']:<12} {s['requests']:>6} calls  "
+            f"{s['wait_seconds']:>8.1f}s queued  {s['waiting']} waiting"
+        )
@@ -0,0 +1,266 @@
+"""
+Profiling
+=========
+Opt-in CPU and memory profiles of a job and of every MCP tool call, to find
+out after the fact why one file took ten times longer than usual.
+
+Enabled with PROFILE=1 (or `runner.py --profile`), or PROFILE=cpu for the CPU
+profile alone. Each profiled run writes, into `<working file>.profile/` next
+to the job's other artifacts:
+
+    <stamp>-<name>.speedscope.json   CPU samples of every thread, for
+                                     https://www.speedscope.app
+    <stamp>-<name>.folded            the same as folded stacks, for
+                                     flamegraph.pl or inferno
+    <stamp>-<name>.alloc.txt         peak memory (Python heap, Arrow pool,
+                                     RSS) and the lines that had allocated
+                                     the most near the peak
+
+<name> is "pipeline" for `run_agentic_pipeline` and the tool name for tools.
+
+The CPU profiler samples the stacks of all threads every PROFILE_INTERVAL_MS
+from a background thread, so code runs unmodified between samples. Memory is
+traced with tracemalloc, which slows allocation-heavy pandas code several
+times over: profile the slow job, not every job, or use PROFILE=cpu.
+tracemalloc does not see Arrow buffers, hence the separate Arrow peak. When
+PROFILE is off, a profiled call costs one environment lookup.
+"""
+
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from lazy_imports import lazy_import
+
+pa = lazy_import("pyarrow")
+
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_TOP = 25
+# Frames kept per traced allocation: enough to tell pandas internals from the
+# tool line that called them.
+PROFILE_TRACE_FRAMES = 8
+# A new allocation snapshot is taken when traced memory grows by this much
+# over the last one, so the report reflects the peak.
+SNAPSHOT_GROWTH = 1.1
+SNAPSHOT_MIN_BYTES = 1 << 20
+API_DIR = Path(__file__).resolve().parent
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_owns_tracing = False
+
+
+def enabled() -> bool:
+    return os.environ.get("PROFILE", "0") not in ("", "0")
+
+
+def traces_memory() -> bool:
+    return os.environ.get("PROFILE", "0") != "cpu"
+
+
+def profile_dir(file_path: str | Path) -> Path:
+    path = Path(file_path)
+    return path.with_name(f"{path.name}.profile")
+
+
+def _start_tracing() -> None:
+    """Start tracemalloc, shared by overlapping profiles of one process."""
+    global _tracing_users, _owns_tracing
+    with _tracing_lock:
+        if _tracing_users == 0:
+            _owns_tracing = not tracemalloc.is_tracing()
+            if _owns_tracing:
+                tracemalloc.start(PROFILE_TRACE_FRAMES)
+        _tracing_users += 1
+
+
+def _stop_tracing() -> None:
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _owns_tracing:
+            tracemalloc.stop()
+
+
+class SamplingProfiler:
+    """Samples the stacks of every other thread, and traced memory."""
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, memory: bool = True):
+        self.interval = interval_ms / 1000
+        self.memory = memory
+        self.samples: Counter = Counter()
+        self.peak = 0
+        self.arrow_peak = 0
+        self.snapshot: tracemalloc.Snapshot | None = None
+        self._snapshot_at = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        if self.memory:
+            _start_tracing()
+            # Shared with overlapping profiles, whose peak may then be missed.
+            tracemalloc.reset_peak()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._check_memory(final=True)
+        if self.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            _stop_tracing()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_qualname, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                self.samples[(names.get(ident, str(ident)), tuple(reversed(stack)))] += 1
+            self._check_memory()
+
+    def _check_memory(self, final: bool = False) -> None:
+        self.arrow_peak = max(self.arrow_peak, pa.total_allocated_bytes())
+        if not self.memory or not tracemalloc.is_tracing():
+            return
+        current, _ = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, current)
+        grown = current >= max(self._snapshot_at * SNAPSHOT_GROWTH, SNAPSHOT_MIN_BYTES)
+        if grown or (final and self.snapshot is None):
+            self.snapshot = tracemalloc.take_snapshot()
+            self._snapshot_at = current
+
+    # --- reports ---
+
+    def write_speedscope(self, path: Path, name: str) -> None:
+        frames, index = [], {}
+        profiles: dict[str, dict] = {}
+        for (thread, stack), count in self.samples.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                ids.append(index[frame])
+            profile = profiles.setdefault(
+                thread,
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": 0,
+                    "samples": [],
+                    "weights": [],
+                },
+            )
+            weight = count * self.interval * 1000
+            profile["samples"].append(ids)
+            profile["weights"].append(weight)
+            profile["endValue"] += weight
+        document = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "hackeurope profiling",
+            "shared": {"frames": frames},
+            "profiles": sorted(profiles.values(), key=lambda p: -p["endValue"]),
+        }
+        path.write_text(json.dumps(document))
+
+    def write_folded(self, path: Path) -> None:
+        with open(path, "w") as f:
+            for (thread, stack), count in self.samples.most_common():
+                names = [thread] + [f"{n} ({Path(file).name}:{line})" for n, file, line in stack]
+                f.write(";".join(s.replace(";", ",") for s in names) + f" {count}\n")
+
+    def write_allocations(self, path: Path, seconds: float) -> None:
+        lines = [
+            f"wall time: {seconds:.3f}s, {sum(self.samples.values())} samples "
+            f"every {self.interval * 1000:g} ms",
+            f"peak memory: {self.peak / 2**20:.1f} MiB traced Python heap, "
+            f"{self.arrow_peak / 2**20:.1f} MiB Arrow pool (sampled), "
+            f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10:.1f} MiB "
+            "max RSS of the process",
+        ]
+        if self.snapshot is not None:
+            snapshot = self.snapshot.filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__)]
+            )
+            total = sum(s.size for s in snapshot.statistics("filename"))
+            lines.append(
+                f"top {PROFILE_TOP} allocating lines near the peak "
+                f"({total / 2**20:.1f} MiB traced in that snapshot):"
+            )
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP]:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"  {stat.size / 2**20:9.2f} MiB {stat.count:>9} blocks  "
+                    f"{frame.filename}:{frame.lineno}"
+                )
+            # The same memory attributed to the innermost line of this
+            # package, i.e. the tool code that called into pandas.
+            own: Counter = Counter()
+            for stat in snapshot.statistics("traceback"):
+                for frame in stat.traceback:
+                    if Path(frame.filename).parent == API_DIR:
+                        own[f"{Path(frame.filename).name}:{frame.lineno}"] += stat.size
+                        break
+            lines.append(f"top {PROFILE_TOP} lines of api/ near the peak:")
+            for where, size in own.most_common(PROFILE_TOP):
+                lines.append(f"  {size / 2**20:9.2f} MiB  {where}")
+        path.write_text("\n".join(lines) + "\n")
+
+
+@contextmanager
+def profiled(name: str, file_path: str | Path | None):
+    """Profile the enclosed code if PROFILE is set (see the module docstring)."""
+    if not enabled() or file_path is None:
+        yield
+        return
+    profiler = SamplingProfiler(memory=traces_memory())
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        seconds = time.perf_counter() - start
+        try:
+            out = profile_dir(file_path)
+            out.mkdir(exist_ok=True)
+            stem = out / f"{datetime.now():%Y%m%dT%H%M%S%f}-{name}"
+            profiler.write_speedscope(stem.with_name(stem.name + ".speedscope.json"), name)
+            profiler.write_folded(stem.with_name(stem.name + ".folded"))
+            profiler.write_allocations(stem.with_name(stem.name + ".alloc.txt"), seconds)
+            print(f"[profile] {name}: {seconds:.2f}s, written to {stem}.*", file=sys.stderr, flush=True)
+        except OSError as e:
+            print(f"[profile] WARNING: cannot write the {name} profile: {e}", file=sys.stderr)
+
+
+def profiled_job(fn):
+    """Profile an async pipeline entry point whose first argument is the file."""
+
+    @functools.wraps(fn)
+    async def wrapper(file_path, *args, **kwargs):
+        if not enabled():
+            return await fn(file_path, *args, **kwargs)
+        with profiled("pipeline", file_path):
+            return await fn(file_path, *args, **kwargs)
+
+    return wrapper
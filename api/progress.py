@@ -0,0 +1,332 @@
+"""
+Job Progress
+============
+Progress of a running pipeline, streamed while it runs instead of only
+reported when it ends.
+
+`ProgressHooks` turns what the agents do into events:
+
+    stage_started / stage_finished   header, na, dedup, read, describe
+                                     (with rows per second when finished)
+    columns                          columns formatted out of the columns to format
+    job_finished                     final status, total rows per second
+
+`ProgressReporter` publishes them twice, without ever making the pipeline
+wait:
+
+  - appended to PROGRESS_DIR/<job id>.jsonl, which the server-sent-events
+    endpoint of app.py (`GET /jobs/{job_id}/events`) tails;
+  - posted to the job's callback URL as {"status": "RUNNING", "progress": ...}
+    by a background task. Posts are coalesced: only the latest state is sent,
+    at most every PROGRESS_INTERVAL_SECONDS, and a failed progress post is
+    dropped.
+
+The final callback (`complete`) goes through the same pooled connection and
+is retried with exponential backoff on network errors, 429 and 5xx answers.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import metrics
+from agents import RunHooks
+from checkpoints import COLUMN_TOOLS, STAGE_TOOLS, tool_columns, tool_output_text
+from table_io import is_excel
+
+PROGRESS_DIR = Path(
+    os.environ.get("PROGRESS_DIR", Path(tempfile.gettempdir()) / "hackeurope-progress")
+)
+PROGRESS_INTERVAL_SECONDS = float(os.environ.get("PROGRESS_INTERVAL_SECONDS", "1"))
+CALLBACK_TIMEOUT_SECONDS = 30
+CALLBACK_RETRIES = 5
+CALLBACK_BACKOFF_SECONDS = 0.5
+
+# Agents-as-tools whose start is the start of a stage; the stage finishes with
+# its MCP tool (checkpoints.STAGE_TOOLS).
+STAGE_AGENTS = {
+    "header_agent": "header",
+    "na_agent": "na",
+    "reader_agent": "read",
+    "description_agent": "describe",
+}
+# Column types that the orchestrator formats (see agents_pipeline.py).
+FORMATTED_TYPES = {"time", "money", "name", "category", "int", "float"}
+FINAL_EVENT = "job_finished"
+
+
+def events_path(job_id: str) -> Path:
+    return PROGRESS_DIR / f"{job_id}.jsonl"
+
+
+def count_rows(file_path: str) -> int | None:
+    """Rows of a working file, cheaply: sheet dimensions or line count."""
+    try:
+        if is_excel(file_path):
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(file_path, read_only=True)
+            try:
+                return max((workbook.worksheets[0].max_row or 1) - 1, 0)
+            finally:
+                workbook.close()
+        if Path(file_path).suffix.lower() not in (".csv", ".tsv", ".tab", ".psv", ".txt"):
+            return None
+        lines = 0
+        with open(file_path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                lines += chunk.count(b"\n")
+        return max(lines - 1, 0)
+    except Exception:
+        return None
+
+
+class ProgressReporter:
+    """Publishes the progress events of one job; see the module docstring.
+
+    Use as an async context manager so its sender task and connection pool
+    are closed with the job.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        callback_url: str | None = None,
+        callback_secret: str | None = None,
+    ):
+        self.job_id = job_id
+        self.callback_url = callback_url
+        self.client = httpx.AsyncClient(
+            timeout=CALLBACK_TIMEOUT_SECONDS,
+            headers={
+                "Content-Type": "application/json",
+                "X-Callback-Secret": callback_secret or "",
+            },
+        )
+        self.path = events_path(job_id)
+        self.seq = 0
+        self.state = {"stage": None, "stagesDone": [], "columnsDone": 0, "columnsTotal": None}
+        self.rows: int | None = None
+        self.started = time.monotonic()
+        self._stage_started: dict[str, float] = {}
+        self._columns: set[str] = set()
+        self._changed = asyncio.Event()
+        self._sender: asyncio.Task | None = None
+        self._in_flight = False
+
+    async def __aenter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        metrics.jobs_in_flight.labels(metrics.METRICS_WORKER).inc()
+        self._in_flight = True
+        if self.callback_url:
+            self._sender = asyncio.create_task(self._send_progress())
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self) -> None:
+        if self._in_flight:
+            metrics.jobs_in_flight.labels(metrics.METRICS_WORKER).dec()
+            self._in_flight = False
+        if self._sender:
+            self._sender.cancel()
+            await asyncio.gather(self._sender, return_exceptions=True)
+            self._sender = None
+        await self.client.aclose()
+
+    # --- events ---
+
+    def emit(self, event_type: str, **data) -> None:
+        """Record an event. Never waits: posting happens in the background."""
+        self.seq += 1
+        event = {"seq": self.seq, "time": time.time(), "type": event_type, **data}
+        try:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(event, default=str) + "\n")
+        except OSError as e:
+            print(f"[progress] WARNING: cannot write {self.path}: {e}", file=sys.stderr)
+        self.state["lastEvent"] = event
+        self._changed.set()
+        metrics.sample_memory()
+
+    def set_rows(self, rows: int | None) -> None:
+        self.rows = rows
+        self.state["rows"] = rows
+
+    def stage_started(self, stage: str) -> None:
+        if stage in self._stage_started:
+            return
+        self._stage_started[stage] = time.monotonic()
+        self.state["stage"] = stage
+        self.emit("stage_started", stage=stage)
+
+    def stage_finished(self, stage: str) -> None:
+        if stage in self.state["stagesDone"]:
+            return
+        started = self._stage_started.setdefault(stage, time.monotonic())
+        elapsed = time.monotonic() - started
+        self.state["stagesDone"].append(stage)
+        metrics.stage_seconds.labels(metrics.METRICS_WORKER, stage).observe(elapsed)
+        self.emit(
+            "stage_finished",
+            stage=stage,
+            seconds=round(elapsed, 3),
+            rowsPerSecond=self._rate(elapsed),
+        )
+
+    def columns_total(self, total: int) -> None:
+        self.state["columnsTotal"] = total
+        self.emit("columns", done=len(self._columns), total=total)
+
+    def column_done(self, *col_names: str) -> None:
+        new = [col for col in col_names if col not in self._columns]
+        if not new:
+            return
+        self._columns.update(new)
+        self.state["columnsDone"] = len(self._columns)
+        self.emit(
+            "columns",
+            column=new[0],
+            columns=new,
+            done=len(self._columns),
+            total=self.state["columnsTotal"],
+        )
+
+    def _rate(self, seconds: float) -> float | None:
+        if self.rows is None or seconds <= 0:
+            return None
+        return round(self.rows / seconds, 1)
+
+    # --- callbacks ---
+
+    async def _post(self, payload: dict, retries: int) -> bool:
+        for attempt in range(retries + 1):
+            try:
+                response = await self.client.post(self.callback_url, json=payload)
+                if response.status_code < 400:
+                    return True
+                if response.status_code != 429 and response.status_code < 500:
+                    print(
+                        f"[progress] WARNING: callback rejected: {response.status_code}",
+                        file=sys.stderr,
+                        flush=True,
+                    )
+                    return False
+            except httpx.HTTPError as e:
+                if attempt == retries:
+                    print(f"[progress] WARNING: callback failed: {e}", file=sys.stderr, flush=True)
+            if attempt < retries:
+                await asyncio.sleep(CALLBACK_BACKOFF_SECONDS * 2**attempt)
+        return False
+
+    async def _send_progress(self) -> None:
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            await self._post({"status": "RUNNING", "progress": dict(self.state)}, retries=0)
+            await asyncio.sleep(PROGRESS_INTERVAL_SECONDS)
+
+    async def complete(self, payload: dict) -> bool:
+        """Send the final callback and close the event stream.
+
+        Progress posts stop first, so a late one cannot overwrite the result.
+        Returns whether the callback was delivered.
+        """
+        if self._sender:
+            self._sender.cancel()
+            await asyncio.gather(self._sender, return_exceptions=True)
+            self._sender = None
+        elapsed = time.monotonic() - self.started
+        status = str(payload.get("status"))
+        metrics.jobs_total.labels(metrics.METRICS_WORKER, status).inc()
+        metrics.job_seconds.labels(metrics.METRICS_WORKER, status).observe(elapsed)
+        if self.rows and status == "SUCCEEDED":
+            metrics.rows_processed.labels(metrics.METRICS_WORKER).inc(self.rows)
+        self.emit(
+            FINAL_EVENT,
+            status=payload.get("status"),
+            **({"errorMessage": payload["errorMessage"]} if "errorMessage" in payload else {}),
+            seconds=round(elapsed, 3),
+            rowsPerSecond=self._rate(elapsed),
+        )
+        if not self.callback_url:
+            return False
+        delivered = await self._post(payload, retries=CALLBACK_RETRIES)
+        if delivered:
+            print(f"[progress] Callback delivered: {payload.get('status')}", flush=True)
+        return delivered
+
+
+class ProgressHooks(RunHooks):
+    """Run hooks reporting stages and columns to a `ProgressReporter`, and
+    model calls to the metrics.
+
+    Wraps the checkpoint hooks of the run, if any, so the pipeline still
+    passes a single hooks object to the orchestrator and every agent-as-tool.
+    """
+
+    def __init__(self, reporter: ProgressReporter, inner: RunHooks | None = None):
+        self.reporter = reporter
+        self.inner = inner
+
+    async def on_llm_end(self, context, agent, response) -> None:
+        if self.inner:
+            await self.inner.on_llm_end(context, agent, response)
+        metrics.observe_model_call(agent.name, agent.model, response.usage)
+
+    async def on_tool_start(self, context, agent, tool) -> None:
+        if self.inner:
+            await self.inner.on_tool_start(context, agent, tool)
+        stage = STAGE_AGENTS.get(tool.name) or STAGE_TOOLS.get(tool.name)
+        if stage:
+            self.reporter.stage_started(stage)
+
+    async def on_tool_end(self, context, agent, tool, result) -> None:
+        if self.inner:
+            await self.inner.on_tool_end(context, agent, tool, result)
+        result = tool_output_text(result)
+        if result is None or result.startswith("Error"):
+            return
+        name = tool.name
+        if name in STAGE_TOOLS:
+            stage = STAGE_TOOLS[name]
+            self.reporter.stage_finished(stage)
+            if stage == "read":
+                self._count_columns(result)
+        elif name in COLUMN_TOOLS:
+            columns = tool_columns(getattr(context, "tool_arguments", None))
+            if columns:
+                self.column_done(*columns)
+
+    def _count_columns(self, column_types: str) -> None:
+        # The reader may wrap its mapping in prose or a code fence.
+        start, end = column_types.find("{"), column_types.rfind("}")
+        try:
+            types = json.loads(column_types[start : end + 1])
+        except json.JSONDecodeError:
+            return
+        if not isinstance(types, dict):
+            return
+        # With column groups: {"types": {leader: type}, "groups": {leader: [...]}}.
+        groups = {}
+        if isinstance(types.get("types"), dict):
+            groups, types = types.get("groups") or {}, types["types"]
+        self.reporter.columns_total(
+            sum(
+                1 + len(groups.get(col, []))
+                for col, t in types.items()
+                if str(t).lower() in FORMATTED_TYPES
+            )
+        )
+
+    def column_done(self, *col_names: str) -> None:
+        if self.inner:
+            self.inner.column_done(*col_names)
+        self.reporter.column_done(*col_names)
@@ -0,0 +1,362 @@
+"""
+Input Readers
+=============
+Format detection and fast readers for the non-Excel inputs the pipeline
+accepts: delimited text (CSV, TSV, PSV, semicolon exports) and JSON / NDJSON.
+
+The encoding, delimiter and header are sniffed from the first kilobytes of a
+file. Delimited text is parsed by the multi-threaded pyarrow CSV reader; JSON
+records are flattened so nested objects become dotted columns
+(`metadata.source`) and lists become comma-joined strings. A file whose format
+cannot be identified raises an error instead of being handed to another
+parser.
+"""
+
+import codecs
+import csv
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.json as pa_json
+
+SNIFF_BYTES = 64 * 1024
+# Rows handed to json_normalize at a time when flattening NDJSON in Python.
+JSON_BATCH_ROWS = 50_000
+
+EXCEL_SUFFIXES = {".xlsx", ".xlsm", ".xlsb", ".xls", ".ods"}
+JSON_SUFFIXES = {".json"}
+NDJSON_SUFFIXES = {".ndjson", ".jsonl"}
+DELIMITERS = {".csv": ",", ".tsv": "\t", ".tab": "\t", ".psv": "|"}
+SNIFF_DELIMITERS = ",;\t|"
+
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+class UnsupportedFormatError(ValueError):
+    """Raised for inputs that none of the readers can parse."""
+
+
+@dataclass
+class Sniffed:
+    format: str  # "excel", "delimited", "json" or "ndjson"
+    encoding: str | None = None
+    delimiter: str | None = None
+    has_header: bool | None = None
+
+
+def _sniff_encoding(head: bytes) -> str:
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    try:
+        head.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the sniff window is still UTF-8.
+        if e.start >= len(head) - 3 and e.reason == "unexpected end of data":
+            return "utf-8"
+    try:
+        head.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def _decode_head(head: bytes, encoding: str) -> str:
+    return head.decode(encoding, errors="ignore")
+
+
+def _sniff_delimiter(text: str, suffix: str) -> str:
+    lines = [line for line in text.splitlines()[:-1] if line.strip()][:50]
+    if lines:
+        try:
+            return csv.Sniffer().sniff("\n".join(lines), SNIFF_DELIMITERS).delimiter
+        except csv.Error:
+            pass
+    if suffix in DELIMITERS:
+        return DELIMITERS[suffix]
+    raise UnsupportedFormatError("Could not detect the delimiter of the file")
+
+
+def _sniff_header(text: str) -> bool | None:
+    sample = "\n".join(text.splitlines()[:-1][:50])
+    try:
+        return csv.Sniffer().has_header(sample)
+    except csv.Error:
+        return None
+
+
+def sniff(file_path: str | Path) -> Sniffed:
+    """Detect the format, encoding, delimiter and header of a file."""
+    path = Path(file_path)
+    suffix = path.suffix.lower()
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+
+    if suffix in EXCEL_SUFFIXES or head.startswith((b"PK\x03\x04", b"\xd0\xcf\x11\xe0")):
+        return Sniffed("excel")
+
+    encoding = _sniff_encoding(head)
+    text = _decode_head(head, encoding).lstrip("\ufeff")
+    if encoding != "utf-16" and "\x00" in text:
+        raise UnsupportedFormatError(f"'{path.name}' is not a text or Excel file")
+
+    stripped = text.lstrip()
+    if suffix in NDJSON_SUFFIXES:
+        return Sniffed("ndjson", encoding)
+    if suffix in JSON_SUFFIXES or stripped.startswith(("[", "{")):
+        lines = [line.strip() for line in stripped.splitlines() if line.strip()]
+        is_ndjson = (
+            len(lines) > 1 and lines[0].startswith("{") and lines[0].endswith("}")
+            and lines[1].startswith("{")
+        )
+        return Sniffed("ndjson" if is_ndjson else "json", encoding)
+
+    delimiter = _sniff_delimiter(text, suffix)
+    return Sniffed("delimited", encoding, delimiter, _sniff_header(text))
+
+
+# --- delimited text ---------------------------------------------------------
+
+
+def _physical_row(file_path: str | Path, encoding: str, row: int) -> int:
+    """Line number of the `row`-th non-empty line, as pandas counts header rows.
+
+    Only empty lines are skipped, as in the header=None previews: a row of
+    delimiters only (',,') is a row of empty cells there, and counts.
+    """
+    seen = 0
+    with open(file_path, encoding=encoding, errors="ignore", newline="") as f:
+        for line_no, line in enumerate(f):
+            if line.strip():
+                if seen == row:
+                    return line_no
+                seen += 1
+    return 0
+
+
+def _max_fields(file_path: str | Path, sniffed: Sniffed) -> int:
+    """Widest row among the first kilobytes of a delimited file."""
+    with open(file_path, "rb") as f:
+        text = _decode_head(f.read(SNIFF_BYTES), sniffed.encoding)
+    lines = text.lstrip("\ufeff").splitlines()[:-1] or text.splitlines()
+    rows = csv.reader(lines, delimiter=sniffed.delimiter)
+    return max((len(row) for row in rows), default=1)
+
+
+def _read_delimited_pyarrow(
+    file_path: str | Path, sniffed: Sniffed, header: int | None
+) -> pd.DataFrame:
+    skip_rows = 0
+    if header:
+        skip_rows = _physical_row(file_path, sniffed.encoding, header)
+    read_options = pa_csv.ReadOptions(
+        encoding=sniffed.encoding,
+        skip_rows=skip_rows,
+        autogenerate_column_names=header is None,
+        use_threads=True,
+    )
+    parse_options = pa_csv.ParseOptions(
+        delimiter=sniffed.delimiter, newlines_in_values=True
+    )
+    # Dates and times are kept as text, as pandas reads them, so the time
+    # agent sees the original formats. Their columns are found on the first
+    # block and forced to string for the full read.
+    convert_options = pa_csv.ConvertOptions(strings_can_be_null=True)
+    with pa_csv.open_csv(
+        file_path, read_options=read_options, parse_options=parse_options,
+        convert_options=convert_options,
+    ) as reader:
+        schema = reader.schema
+    convert_options.column_types = {
+        field.name: pa.string()
+        for field in schema
+        if pa.types.is_temporal(field.type)
+    }
+
+    table = pa_csv.read_csv(
+        file_path, read_options=read_options, parse_options=parse_options,
+        convert_options=convert_options,
+    )
+    df = table.to_pandas()
+    if header is None:
+        df.columns = range(df.shape[1])
+    return df
+
+
+def read_delimited(
+    file_path: str | Path,
+    sniffed: Sniffed,
+    header: int | None = 0,
+    nrows: int | None = None,
+) -> pd.DataFrame:
+    """Read delimited text with the sniffed encoding and delimiter.
+
+    Full reads use the multi-threaded pyarrow reader. Short previews (`nrows`)
+    and files pyarrow rejects, such as rows with fewer fields than the header,
+    are read by pandas with the same settings.
+    """
+    if nrows is None:
+        try:
+            return _read_delimited_pyarrow(file_path, sniffed, header)
+        except pa.ArrowInvalid:
+            pass
+    if header is None:
+        # Title rows above the table have fewer fields than the table itself.
+        names = range(_max_fields(file_path, sniffed))
+        return pd.read_csv(
+            file_path,
+            sep=sniffed.delimiter,
+            encoding=sniffed.encoding,
+            header=None,
+            names=names,
+            nrows=nrows,
+        )
+    skip_rows = _physical_row(file_path, sniffed.encoding, header)
+    return pd.read_csv(
+        file_path,
+        sep=sniffed.delimiter,
+        encoding=sniffed.encoding,
+        skiprows=skip_rows,
+        header=0,
+        nrows=nrows,
+    )
+
+
+# --- JSON / NDJSON ----------------------------------------------------------
+
+
+def _join_list(val):
+    if isinstance(val, (list, tuple)):
+        items = [str(v) for v in val if v is not None]
+        return ", ".join(items) if items else None
+    return val
+
+
+def _flatten_records(records: list) -> pd.DataFrame:
+    df = pd.json_normalize(records, sep=".")
+    # A record with `"metadata": null` next to records with nested metadata
+    # leaves an all-empty `metadata` column beside `metadata.*`.
+    nested_parents = {c.rsplit(".", 1)[0] for c in df.columns if "." in c}
+    empty_parents = [c for c in nested_parents if c in df.columns and df[c].isna().all()]
+    df = df.drop(columns=empty_parents)
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(_join_list)
+    return df
+
+
+def _records_from_document(doc) -> list:
+    if isinstance(doc, list):
+        return doc
+    if isinstance(doc, dict):
+        # {"data": [...]} style envelopes hold the records in their only list.
+        lists = [v for v in doc.values() if isinstance(v, list)]
+        if len(lists) == 1 and all(isinstance(r, dict) for r in lists[0]):
+            return lists[0]
+        return [doc]
+    raise UnsupportedFormatError("JSON document does not contain records")
+
+
+def _read_ndjson_pyarrow(file_path: str | Path) -> pd.DataFrame:
+    table = pa_json.read_json(file_path, read_options=pa_json.ReadOptions(use_threads=True))
+    while any(pa.types.is_struct(field.type) for field in table.schema):
+        table = table.flatten()
+    df = table.to_pandas()
+    for field in table.schema:
+        if pa.types.is_list(field.type) or pa.types.is_large_list(field.type):
+            df[field.name] = df[field.name].map(
+                lambda v: _join_list(list(v)) if v is not None else None
+            )
+    return df
+
+
+def _read_ndjson_stream(file_path: str | Path, encoding: str) -> pd.DataFrame:
+    frames = []
+    batch = []
+    with open(file_path, encoding=encoding) as f:
+        for line in f:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) >= JSON_BATCH_ROWS:
+                frames.append(_flatten_records(batch))
+                batch = []
+    if batch or not frames:
+        frames.append(_flatten_records(batch))
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_json_table(file_path: str | Path, sniffed: Sniffed) -> pd.DataFrame:
+    """Read JSON records or NDJSON into a flat table."""
+    if sniffed.format == "ndjson":
+        # pyarrow parses NDJSON on all cores but needs consistent types per
+        # field; messy files with mixed types are flattened batch by batch.
+        if sniffed.encoding in ("utf-8", "utf-8-sig"):
+            try:
+                return _read_ndjson_pyarrow(file_path)
+            except pa.ArrowInvalid:
+                pass
+        return _read_ndjson_stream(file_path, sniffed.encoding)
+    with open(file_path, encoding=sniffed.encoding) as f:
+        doc = json.load(f)
+    return _flatten_records(_records_from_document(doc))
+
+
+def apply_header(df: pd.DataFrame, header: int | None) -> pd.DataFrame:
+    """Present a table that has its labels already as if it were read raw.
+
+    With `header=None` the labels become the first row, and with `header=k`
+    row k of that raw view becomes the header, as for delimited text.
+    """
+    if header == 0:
+        return df
+    labels = pd.DataFrame([list(df.columns)], columns=df.columns)
+    raw = pd.concat([labels, df], ignore_index=True)
+    raw.columns = range(raw.shape[1])
+    if header is None:
+        return raw
+    out = raw.iloc[header + 1 :].reset_index(drop=True)
+    out.columns = raw.iloc[header].tolist()
+    return out
+
+
+# --- writers ----------------------------------------------------------------
+
+
+def output_format(file_path: str | Path) -> Sniffed:
+    """Format to write a working file in, from its extension."""
+    suffix = Path(file_path).suffix.lower()
+    if suffix in EXCEL_SUFFIXES:
+        return Sniffed("excel")
+    if suffix in NDJSON_SUFFIXES:
+        return Sniffed("ndjson", "utf-8")
+    if suffix in JSON_SUFFIXES:
+        return Sniffed("json", "utf-8")
+    return Sniffed("delimited", "utf-8", DELIMITERS.get(suffix, ","))
+
+
+def write_text_table(
+    df: pd.DataFrame, file_path: str | Path, fmt: Sniffed, index: bool = False
+) -> None:
+    """Write a frame as delimited text, JSON records or NDJSON (UTF-8)."""
+    if fmt.format == "delimited":
+        df.to_csv(file_path, sep=fmt.delimiter, index=index)
+        return
+    if index:
+        df = df.reset_index()
+    text = df.to_json(
+        orient="records",
+        lines=fmt.format == "ndjson",
+        force_ascii=False,
+        date_format="iso",
+    )
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(text)
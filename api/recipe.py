@@ -0,0 +1,287 @@
+"""
+Cleaning Recipes
+================
+Every parameter the agents decide on is recorded as an operation in a
+versioned recipe next to the working file (`<working>.recipe.json`):
+
+    {
+      "version": 1,
+      "source": "sales_jan.xlsx",
+      "created_at": "...",
+      "operations": [
+        {"op": "header", "params": {"header_row_index": 2, "header_col_index": 1}},
+        {"op": "float_formatting", "params": {"col_name": "Qty", "decimals": 2}},
+        ...
+      ]
+    }
+
+A recipe can be replayed on new files of the same schema with pure pandas and
+no model calls. Rows are processed in chunks across a process pool; operations
+that need every row at once (deduplication) run on the whole frame.
+
+Usage:
+    python api/recipe.py \
+        --recipe <path/to/file.recipe.json> \
+        --input <new_file.xlsx> \
+        --output <cleaned_new_file.xlsx> \
+        [--workers 8] [--chunk-size 50000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import repeat
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import dedup  # noqa: E402
+import display_formats  # noqa: E402
+import transforms  # noqa: E402
+from table_io import read_table, save_table, save_with_description  # noqa: E402
+
+RECIPE_VERSION = 1
+DEFAULT_CHUNK_SIZE = 50_000
+# Operations that compare rows with each other and cannot run chunk by chunk.
+FRAME_OPERATIONS = {"deduplication"}
+
+
+def recipe_path(file_path: str | Path) -> Path:
+    path = Path(file_path)
+    return path.with_name(f"{path.name}.recipe.json")
+
+
+def _new_recipe(file_path: str | Path) -> dict:
+    return {
+        "version": RECIPE_VERSION,
+        "source": Path(file_path).name,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "operations": [],
+    }
+
+
+def read_recipe(path: str | Path) -> dict:
+    """Load a recipe file and check that this engine can replay it."""
+    recipe = json.loads(Path(path).read_text())
+    if recipe.get("version") != RECIPE_VERSION:
+        raise ValueError(
+            f"Unsupported recipe version {recipe.get('version')!r}, "
+            f"expected {RECIPE_VERSION}"
+        )
+    return recipe
+
+
+def load_recipe(file_path: str | Path) -> dict:
+    """Return the recipe recorded for a working file (empty if none yet)."""
+    path = recipe_path(file_path)
+    if path.exists():
+        return read_recipe(path)
+    return _new_recipe(file_path)
+
+
+def save_recipe(file_path: str | Path, recipe: dict) -> None:
+    """Write the recipe of a working file atomically."""
+    path = recipe_path(file_path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(recipe, indent=2, default=str))
+    os.replace(tmp, path)
+
+
+def record_operation(file_path: str | Path, op: str, **params) -> None:
+    """Append an applied operation and its resolved parameters to the recipe."""
+    recipe = load_recipe(file_path)
+    recipe["operations"].append({"op": op, "params": params})
+    save_recipe(file_path, recipe)
+
+
+def record_operations(file_path: str | Path, op: str, params: list[dict]) -> None:
+    """Append one operation per parameter set (e.g. per column of a group) in
+    a single write of the recipe."""
+    recipe = load_recipe(file_path)
+    recipe["operations"].extend({"op": op, "params": p} for p in params)
+    save_recipe(file_path, recipe)
+
+
+def operation_count(file_path: str | Path) -> int:
+    return len(load_recipe(file_path)["operations"])
+
+
+def truncate_operations(file_path: str | Path, count: int) -> None:
+    """Forget operations recorded after the first `count` ones."""
+    if not recipe_path(file_path).exists():
+        return
+    recipe = load_recipe(file_path)
+    if len(recipe["operations"]) > count:
+        recipe["operations"] = recipe["operations"][:count]
+        save_recipe(file_path, recipe)
+
+
+def apply_operation(df: pd.DataFrame, op: str, params: dict) -> pd.DataFrame:
+    """Apply one recipe operation to a frame (or, if row-local, a chunk of rows)."""
+    if op == "header":
+        if params["header_row_index"] != 0:
+            raise ValueError("A header change after loading cannot be replayed")
+        return transforms.crop_columns(df, params["header_col_index"])
+    if op == "na_cleaning":
+        if params["custom_na_strings_to_wipe"]:
+            df = transforms.wipe_na_strings(df, params["custom_na_strings_to_wipe"])
+        if params["remove_completely_empty_rows"]:
+            df = df.dropna(axis=0, how="all")
+        dropped = [c for c in params["dropped_columns"] if c in df.columns]
+        return df.drop(columns=dropped)
+    if op == "deduplication":
+        return dedup.drop_duplicates(df, dedup.find_duplicates(df, **params))
+    if op == "time_formatting":
+        df = df.copy()
+        col = params["col_name"]
+        df[col] = transforms.format_time(
+            df[col], params["target_format"], typed=params.get("typed", False)
+        )
+        return df
+    if op == "money_formatting":
+        return transforms.format_money(df, **params)
+    if op == "int_formatting":
+        df = df.copy()
+        df[params["col_name"]] = transforms.format_int(df[params["col_name"]])
+        return df
+    if op == "float_formatting":
+        df = df.copy()
+        col = params["col_name"]
+        floats = transforms.parse_floats(df[col])
+        df[col] = transforms.format_float(
+            floats, params["decimals"], typed=params.get("typed", False)
+        )
+        return df
+    if op == "category_normalization":
+        df = df.copy()
+        col = params["col_name"]
+        df[col] = transforms.apply_category_mapping(df[col], params["mapping"])
+        return df
+    if op == "name_formatting":
+        df = df.copy()
+        col = params["col_name"]
+        df[col] = transforms.format_name(
+            df[col], params["entity_type"], params["dominant_format"]
+        )
+        return df
+    raise ValueError(f"Unknown recipe operation: {op!r}")
+
+
+def _replay_chunk(chunk: pd.DataFrame, operations: list[dict]) -> pd.DataFrame:
+    for operation in operations:
+        chunk = apply_operation(chunk, operation["op"], operation["params"])
+    return chunk
+
+
+def _replay_chunked(
+    df: pd.DataFrame, operations: list[dict], workers: int | None, chunk_size: int
+) -> pd.DataFrame:
+    if len(df) <= chunk_size or workers == 1:
+        return _replay_chunk(df, operations)
+    chunks = [df.iloc[i : i + chunk_size] for i in range(0, len(df), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_replay_chunk, chunks, repeat(operations)))
+    return pd.concat(results)
+
+
+def replay_frame(
+    df: pd.DataFrame,
+    operations: list[dict],
+    workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> pd.DataFrame:
+    """Apply operations to an already loaded frame.
+
+    Runs of row-local operations are applied chunk by chunk; frame operations
+    in between are applied to all rows.
+    """
+    pending = []
+    for operation in operations:
+        if operation["op"] not in FRAME_OPERATIONS:
+            pending.append(operation)
+            continue
+        if pending:
+            df = _replay_chunked(df, pending, workers, chunk_size)
+            pending = []
+        df = apply_operation(df, operation["op"], operation["params"])
+    if pending:
+        df = _replay_chunked(df, pending, workers, chunk_size)
+    return df
+
+
+def split_recipe(recipe: dict) -> tuple[dict | None, list[dict], dict | None]:
+    """Separate the load-time header, the row operations and the description."""
+    operations = list(recipe["operations"])
+    header = None
+    if operations and operations[0]["op"] == "header":
+        header = operations.pop(0)["params"]
+    description = None
+    row_operations = []
+    for operation in operations:
+        if operation["op"] == "dataset_description":
+            description = operation["params"]
+        else:
+            row_operations.append(operation)
+    return header, row_operations, description
+
+
+def replay(
+    recipe: dict,
+    input_path: str,
+    output_path: str,
+    workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> pd.DataFrame:
+    """Clean `input_path` with a recorded recipe and write it to `output_path`."""
+    header, operations, description = split_recipe(recipe)
+
+    if header is not None:
+        df = read_table(input_path, header=header["header_row_index"])
+        df = transforms.crop_columns(df, header["header_col_index"])
+    else:
+        df = read_table(input_path)
+
+    df = replay_frame(df, operations, workers=workers, chunk_size=chunk_size)
+    display = display_formats.column_formats(operations)
+
+    if description is None:
+        save_table(df, output_path, display=display)
+    else:
+        desc_df = pd.DataFrame(description["features"])
+        save_with_description(df, desc_df, output_path, display=display)
+    return df
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a cleaning recipe")
+    parser.add_argument("--recipe", required=True)
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df = replay(
+        read_recipe(args.recipe),
+        args.input,
+        args.output,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+    )
+    elapsed = time.perf_counter() - start
+    print(
+        f"[recipe] Replayed {args.recipe} on {args.input}: "
+        f"{len(df):,} rows in {elapsed:.2f}s -> {args.output}",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -8,97 +8,339 @@ Usage:
         --job-id <jobId> \
         --file-path <absolutePathToExcelFile> \
         --callback-url <http://localhost:3000/api/jobs/<jobId>/complete> \
-        --callback-secret <AGENT_CALLBACK_SECRET>
+        --callback-secret <AGENT_CALLBACK_SECRET> \
+        [--dataset-id <datasetId>] \
+        [--priority interactive|bulk] \
+        [--profile]
 
 The runner:
-  1. Copies the source file to a <uuid>_cleaned_<original> path.
-  2. Runs run_agentic_pipeline() on the copy.
-  3. POSTs {status, resultJson|errorMessage} to the callback URL.
+  1. Copies the source file to a <jobId>_cleaned_<original> path (a reflink or
+     hard link where possible, see storage.py), or resumes from the
+     checkpoint left next to it by a previous failed attempt.
+  2. Runs the pipeline on the copy, checkpointing every step. Every data sheet
+     of a workbook is cleaned, sheets of the same schema sharing one run.
+  3. POSTs {status, resultJson|errorMessage} to the callback URL, retrying
+     on network errors and 5xx answers. While the job runs, its progress is
+     posted there as status RUNNING and streamed by app.py as server-sent
+     events (see progress.py). The result links the cleaned file and the
+     recipe of every applied operation, which `python api/recipe.py` can
+     replay on later files of the same schema. Under "downloads" it also
+     links compressed copies of the result in the RESULT_FORMATS (csv.zst
+     and parquet by default; see downloads.py).
+
+Resubmitting the same job id after a failure resumes from the last completed
+step instead of repeating every model call.
+
+With --dataset-id the runner works incrementally: the cleaned output is keyed
+by the dataset, and when the source has only gained rows since the last run,
+just those rows are cleaned with the stored decisions and appended.
+
+Model calls of all concurrent jobs share the rate limits of one scheduler
+(model_scheduler.py). --priority bulk queues a backfill behind interactive
+uploads; the job's queue wait is reported in the result as "modelQueue".
+
+--deadline and --token-budget bound the time and tokens of the job's agents
+(JOB_DEADLINE_SECONDS, JOB_TOKEN_BUDGET; see budgets.py). Past them, the
+remaining columns are finished with heuristic decisions instead of failing
+the job, and listed in the result under "degradedColumns".
+
+--profile (or PROFILE=1) writes CPU and memory profiles of the pipeline and of
+every tool call into <cleaned file>.profile/ (see profiling.py).
+
+Batch mode cleans every file of a directory or manifest in one process, with
+a bounded pool of concurrent pipelines sharing one MCP server, reusing the
+decisions of a file for the other files of its schema, and writes a results
+manifest with the status and timings of every file (see batch.py):
+
+    python api/runner.py --batch <directory|manifest> \
+        [--output-dir <dir>] [--results <results.json>] [--concurrency 4]
 
 Exit codes: 0 = success (callback sent), 1 = fatal error before callback.
+In batch mode: 0 = every file cleaned, 1 = some files failed.
 """
 
 import argparse
 import asyncio
-import json
-import shutil
+import os
+import re
 import sys
-import uuid
 from pathlib import Path
-from urllib.error import URLError
-from urllib.request import Request, urlopen
 
 # ---------------------------------------------------------------------------
 # Add api/ to path so agents_pipeline can be imported regardless of cwd
 # ---------------------------------------------------------------------------
 sys.path.insert(0, str(Path(__file__).parent))
 
-from agents_pipeline import run_agentic_pipeline  # noqa: E402
+import checkpoints  # noqa: E402
+import downloads  # noqa: E402
+import incremental  # noqa: E402
+import metrics  # noqa: E402
+import snapshots  # noqa: E402
+import workbook  # noqa: E402
+from agents import RunConfig  # noqa: E402
+from budgets import JOB_DEADLINE_SECONDS, JOB_TOKEN_BUDGET, JobBudget  # noqa: E402
+from lazy_imports import lazy_import  # noqa: E402
+from model_scheduler import (  # noqa: E402
+    MODEL_SCHEDULER,
+    ModelScheduler,
+    ScheduledModelProvider,
+)
+from progress import ProgressReporter  # noqa: E402
+from recipe import recipe_path  # noqa: E402
+from storage import ArtifactStore, working_copy  # noqa: E402
 
+# The agents, their MCP client and prompts load only when the full pipeline
+# runs, not for incremental refreshes and failures before it.
+agents_pipeline = lazy_import("agents_pipeline")
+batch = lazy_import("batch")
 
-def _post_callback(url: str, secret: str, payload: dict) -> None:
-    body = json.dumps(payload).encode("utf-8")
-    req = Request(
-        url,
-        data=body,
-        headers={
-            "Content-Type": "application/json",
-            "X-Callback-Secret": secret,
-        },
-        method="POST",
-    )
-    try:
-        with urlopen(req, timeout=30) as resp:
-            print(f"[runner] Callback response: {resp.status}", flush=True)
-    except URLError as exc:
-        print(f"[runner] WARNING: callback failed: {exc}", file=sys.stderr, flush=True)
 
+# The upload directory belongs to the Next.js app; the runner only collects
+# the checkpoints that failed jobs left behind and nobody resumed. The .zst
+# variants were compressed by earlier versions of the collection.
+LEFTOVER_PATTERNS = ("*.checkpoint.*", "*.manifest.json", "*.manifest.json.zst")
 
-async def run(file_path: str, job_id: str, callback_url: str, callback_secret: str) -> None:
+# Compressed downloads produced next to the cleaned file when a job succeeds.
+RESULT_FORMATS = [
+    f for f in os.environ.get("RESULT_FORMATS", "csv.zst,parquet").split(",") if f
+]
+
+
+def collect_leftovers(upload_dir: str | Path) -> dict:
+    """Evict the checkpoints of failed jobs once they expire. They are never
+    compressed: a resubmitted job must still find them to resume."""
+    store = ArtifactStore(upload_dir, patterns=LEFTOVER_PATTERNS, compress_after_minutes=None)
+    return store.gc()
+
+
+def _result_downloads(cleaned_path: Path) -> dict:
+    """Produce the compressed downloads of a result; returns their URLs by format."""
+    urls = {cleaned_path.suffix.lstrip(".").lower(): f"/uploads/{cleaned_path.name}"}
+    for fmt in RESULT_FORMATS:
+        try:
+            artifact = downloads.ensure_artifact(cleaned_path, fmt)
+        except Exception as exc:
+            print(f"[runner] WARNING: {fmt} download failed: {exc}", file=sys.stderr, flush=True)
+            continue
+        urls[fmt] = f"/uploads/{artifact.name}"
+    return urls
+
+
+async def run(
+    file_path: str,
+    job_id: str,
+    callback_url: str,
+    callback_secret: str,
+    dataset_id: str | None = None,
+    priority: str = "interactive",
+    budget: JobBudget | None = None,
+) -> None:
+    async with ProgressReporter(job_id, callback_url, callback_secret) as progress:
+        await _run(progress, file_path, job_id, dataset_id, priority, budget or JobBudget())
+
+
+async def _run(
+    progress: ProgressReporter,
+    file_path: str,
+    job_id: str,
+    dataset_id: str | None,
+    priority: str,
+    budget: JobBudget,
+) -> None:
     src = Path(file_path)
     if not src.exists():
-        _post_callback(callback_url, callback_secret, {
+        await progress.complete({
             "status": "FAILED",
             "errorMessage": f"Source file not found: {file_path}",
         })
         return
 
-    # Work on a copy so the original is preserved
-    cleaned_name = f"{uuid.uuid4().hex}_cleaned_{src.name}"
+    # Work on a copy so the original is preserved. The name is derived from the
+    # job id so a resubmitted job finds the checkpoint of its previous attempt,
+    # or from the dataset id so an incremental refresh finds its last output.
+    safe_id = re.sub(r"[^A-Za-z0-9_-]", "_", dataset_id or job_id)
+    cleaned_name = f"{safe_id}_cleaned_{src.name}"
     cleaned_path = src.parent / cleaned_name
-    shutil.copy2(src, cleaned_path)
-    print(f"[runner] Working copy: {cleaned_path}", flush=True)
+    result_json = {
+        "cleanedFileUrl": f"/uploads/{cleaned_name}",
+        "cleanedFileName": f"cleaned_{src.name}",
+        "recipeUrl": f"/uploads/{recipe_path(cleaned_path).name}",
+    }
 
-    try:
-        await run_agentic_pipeline(str(cleaned_path))
-        _post_callback(callback_url, callback_secret, {
-            "status": "SUCCEEDED",
-            "resultJson": {
-                "cleanedFileUrl": f"/uploads/{cleaned_name}",
-                "cleanedFileName": f"cleaned_{src.name}",
-                "summary": "Agent pipeline completed — columns classified and formatted.",
-            },
-        })
-    except Exception as exc:
-        # Clean up the copy on failure
-        if cleaned_path.exists():
-            cleaned_path.unlink(missing_ok=True)
-        _post_callback(callback_url, callback_secret, {
-            "status": "FAILED",
-            "errorMessage": str(exc)[:500],
-        })
+    # The working files are leased so no collection deletes them mid-job, and
+    # their in-memory snapshots are dropped when it ends.
+    with (
+        ArtifactStore(src.parent).lease(src, cleaned_path),
+        snapshots.scope(src, cleaned_path),
+    ):
+        state = incremental.load_state(cleaned_path) if dataset_id else None
+        if state and cleaned_path.exists() and incremental.is_append_of(state, src):
+            print(f"[runner] Incremental refresh from row {state['rows']}", flush=True)
+            try:
+                added = incremental.process_increment(src, cleaned_path, state)
+                result_json["downloads"] = await asyncio.to_thread(
+                    _result_downloads, cleaned_path
+                )
+                await progress.complete({
+                    "status": "SUCCEEDED",
+                    "resultJson": {
+                        **result_json,
+                        "summary": f"Incremental refresh — {added} new rows cleaned and appended.",
+                    },
+                })
+            except Exception as exc:
+                await progress.complete({
+                    "status": "FAILED",
+                    "errorMessage": str(exc)[:500],
+                })
+            return
+
+        if checkpoints.has_checkpoint(cleaned_path) or workbook.has_sheet_checkpoint(cleaned_path):
+            print(f"[runner] Resuming from checkpoint: {cleaned_path}", flush=True)
+        else:
+            method = working_copy(src, cleaned_path)
+            print(f"[runner] Working copy ({method}): {cleaned_path}", flush=True)
+
+        scheduler = ModelScheduler(job_id, lane=priority) if MODEL_SCHEDULER else None
+        run_config = (
+            RunConfig(model_provider=ScheduledModelProvider(scheduler)) if scheduler else None
+        )
+        try:
+            sheet_count = await agents_pipeline.run_workbook_pipeline(
+                str(cleaned_path),
+                checkpoint=True,
+                run_config=run_config,
+                progress=progress,
+                budget=budget,
+            )
+            checkpoints.clear(cleaned_path)
+            # Incremental refreshes only track a single table.
+            if dataset_id and sheet_count == 1:
+                incremental.save_state(src, cleaned_path)
+            result_json["downloads"] = await asyncio.to_thread(_result_downloads, cleaned_path)
+            await progress.complete({
+                "status": "SUCCEEDED",
+                "resultJson": {
+                    **result_json,
+                    "summary": (
+                        "Agent pipeline completed — columns classified and formatted."
+                        if not budget.exceeded
+                        else f"Agent pipeline stopped ({budget.exceeded}) — "
+                        f"{len(budget.degraded)} columns finished with heuristic decisions."
+                    ),
+                    **budget.result(),
+                    **({"modelQueue": scheduler.stats()} if scheduler else {}),
+                },
+            })
+        except Exception as exc:
+            # Keep the copy when it or one of its sheets has a checkpoint to
+            # resume from, otherwise clean up
+            if checkpoints.has_checkpoint(cleaned_path) or workbook.has_sheet_checkpoint(
+                cleaned_path
+            ):
+                print(f"[runner] Checkpoint kept for resume: {cleaned_path}", flush=True)
+            elif cleaned_path.exists():
+                cleaned_path.unlink(missing_ok=True)
+            workbook.discard_sheets(cleaned_path)
+            await progress.complete({
+                "status": "FAILED",
+                "errorMessage": str(exc)[:500],
+            })
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Hackeurope agent pipeline runner")
-    parser.add_argument("--job-id", required=True)
-    parser.add_argument("--file-path", required=True)
-    parser.add_argument("--callback-url", required=True)
-    parser.add_argument("--callback-secret", required=True)
+    parser.add_argument("--job-id")
+    parser.add_argument("--file-path")
+    parser.add_argument("--callback-url")
+    parser.add_argument("--callback-secret")
+    parser.add_argument(
+        "--dataset-id",
+        help="Process incrementally: only rows appended since the last run of this dataset.",
+    )
+    parser.add_argument(
+        "--priority",
+        choices=["interactive", "bulk"],
+        help="Scheduling lane of the job's model calls: bulk backfills wait for interactive "
+        "uploads. Defaults to interactive, and to bulk in batch mode.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write CPU and memory profiles of the pipeline and its tools (see profiling.py).",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=JOB_DEADLINE_SECONDS,
+        help="Seconds the job's agents may take before heuristics finish it (0: no limit).",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=JOB_TOKEN_BUDGET,
+        help="Tokens the job's agents may use before heuristics finish it (0: no limit).",
+    )
+    parser.add_argument(
+        "--batch",
+        help="Clean every data file of this directory, or listed in this manifest, instead of one job.",
+    )
+    parser.add_argument("--output-dir", help="Batch mode: directory of the cleaned files.")
+    parser.add_argument("--results", help="Batch mode: path of the results manifest.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Batch mode: number of files cleaned at the same time (BATCH_CONCURRENCY).",
+    )
     args = parser.parse_args()
+    if args.profile:
+        os.environ["PROFILE"] = "1"
+
+    if args.batch:
+        _main_batch(args)
+        return
+    missing = [
+        f"--{name.replace('_', '-')}"
+        for name in ("job_id", "file_path", "callback_url", "callback_secret")
+        if not getattr(args, name)
+    ]
+    if missing:
+        parser.error(f"the following arguments are required: {', '.join(missing)}")
 
     print(f"[runner] Starting job {args.job_id} on {args.file_path}", flush=True)
-    asyncio.run(run(args.file_path, args.job_id, args.callback_url, args.callback_secret))
+    try:
+        asyncio.run(run(
+            args.file_path,
+            args.job_id,
+            args.callback_url,
+            args.callback_secret,
+            dataset_id=args.dataset_id,
+            priority=args.priority or "interactive",
+            budget=JobBudget(args.deadline, args.token_budget),
+        ))
+        collect_leftovers(Path(args.file_path).parent)
+        snapshots.prune()
+    finally:
+        metrics.process_exited()
+
+
+def _main_batch(args: argparse.Namespace) -> None:
+    print(f"[runner] Starting batch on {args.batch}", flush=True)
+    try:
+        results = asyncio.run(batch.run_batch(
+            args.batch,
+            output_dir=args.output_dir,
+            results_path=args.results,
+            concurrency=args.concurrency or batch.BATCH_CONCURRENCY,
+            priority=args.priority or "bulk",
+            deadline_seconds=args.deadline,
+            token_budget=args.token_budget,
+        ))
+        snapshots.prune()
+    finally:
+        metrics.process_exited()
+    if results["summary"]["succeeded"] < results["summary"]["files"]:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+"""
+Representative sampling and compact prompt encoding
+===================================================
+Helpers shared by the MCP tools and the local agent tools to show the models a
+small but informative slice of a table.
+
+Values are grouped by their "shape" (letters, digits and punctuation with runs
+collapsed, e.g. 'TXN-000095' -> 'A-9', '95' -> '9') and the sample is drawn
+round-robin across shapes, so rare formats further down the column are shown
+next to the dominant one. Samples are encoded as CSV with per-cell truncation
+and stop at a configurable token budget.
+"""
+
+import csv
+import io
+import os
+
+import pandas as pd
+
+# Rough prompt budget for one encoded sample, in tokens (~4 chars per token).
+SAMPLE_TOKEN_BUDGET = int(os.environ.get("SAMPLE_TOKEN_BUDGET", "1500"))
+SAMPLE_MAX_CELL_CHARS = int(os.environ.get("SAMPLE_MAX_CELL_CHARS", "40"))
+CHARS_PER_TOKEN = 4
+
+# Shapes are computed on at most this many evenly spaced rows of a table.
+MAX_SCAN_ROWS = 100_000
+
+
+def value_shape(values: pd.Series) -> pd.Series:
+    """Map each value to its shape pattern: 'A' upper, 'a' lower, '9' digits."""
+    text = values.astype(str).str.strip()
+    return (
+        text.str.replace(r"[A-Z]+", "A", regex=True)
+        .str.replace(r"[a-z]+", "a", regex=True)
+        .str.replace(r"\d+", "9", regex=True)
+    )
+
+
+def _pick_round_robin(keys: pd.Series, weights: pd.Series, n: int) -> pd.Index:
+    """Pick up to n labels of `keys`, cycling through the distinct key groups.
+
+    Groups are visited from the most to the least frequent (by `weights`). When
+    there are more groups than slots, half of the slots go to the most common
+    groups and the rest to the rarest ones, so outliers are never crowded out.
+    """
+    group_weight = weights.groupby(keys, sort=False).sum().sort_values(
+        ascending=False, kind="stable"
+    )
+    groups = list(group_weight.index)
+    if len(groups) > n:
+        common = (n + 1) // 2
+        groups = groups[:common] + groups[len(groups) - (n - common) :]
+    group_order = {group: i for i, group in enumerate(groups)}
+
+    candidates = keys[keys.isin(group_order)]
+    ranks = pd.DataFrame(
+        {
+            "rank": candidates.groupby(candidates, sort=False).cumcount(),
+            "group": candidates.map(group_order),
+        }
+    )
+    return ranks.sort_values(["rank", "group"], kind="stable").head(n).index
+
+
+def representative_values(series: pd.Series, n: int = 10) -> list:
+    """Return up to n distinct, format-diverse non-null values of a column."""
+    text = series.dropna().astype(str).str.strip()
+    counts = text[text != ""].value_counts(sort=False)
+    if counts.empty:
+        return []
+    values = counts.index.to_series(index=counts.index)
+    picked = _pick_round_robin(value_shape(values), counts, n)
+    return list(picked)
+
+
+def representative_rows(df: pd.DataFrame, n: int = 5) -> pd.DataFrame:
+    """Return up to n rows, cycling through the distinct combined row shapes.
+
+    Rows keep their original order and index so positions stay meaningful.
+    """
+    if len(df) <= n:
+        return df
+    step = max(1, len(df) // MAX_SCAN_ROWS)
+    scanned = df.iloc[::step]
+    row_shape = pd.Series("", index=scanned.index)
+    for i in range(scanned.shape[1]):
+        col = scanned.iloc[:, i]
+        row_shape = row_shape + "\x1f" + value_shape(col).where(col.notna(), "")
+    weights = pd.Series(1, index=row_shape.index)
+    picked = _pick_round_robin(row_shape, weights, n)
+    return df.loc[sorted(picked)]
+
+
+def _truncate(val, max_cell_chars: int) -> str:
+    if val is None or (not isinstance(val, (list, dict)) and pd.isna(val)):
+        return ""
+    text = str(val).replace("\n", " ").strip()
+    if len(text) > max_cell_chars:
+        return text[: max_cell_chars - 1] + "…"
+    return text
+
+
+def encode_table(
+    df: pd.DataFrame,
+    index: bool = False,
+    max_columns: int | None = None,
+    max_cell_chars: int = SAMPLE_MAX_CELL_CHARS,
+    token_budget: int = SAMPLE_TOKEN_BUDGET,
+) -> str:
+    """Encode a sample as CSV text that fits within `token_budget` tokens.
+
+    Cells are truncated to `max_cell_chars`, columns beyond `max_columns` are
+    dropped and rows that would exceed the budget are replaced by a note.
+    """
+    notes = []
+    if max_columns is not None and df.shape[1] > max_columns:
+        notes.append(f"... {df.shape[1] - max_columns} more columns not shown")
+        df = df.iloc[:, :max_columns]
+
+    header = [_truncate(c, max_cell_chars) for c in df.columns]
+    if index:
+        header = [""] + header
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(header)
+    budget_chars = token_budget * CHARS_PER_TOKEN
+
+    rows_written = 0
+    for label, row in zip(df.index, df.itertuples(index=False, name=None)):
+        cells = [_truncate(v, max_cell_chars) for v in row]
+        if index:
+            cells = [str(label)] + cells
+        line = io.StringIO()
+        csv.writer(line, lineterminator="\n").writerow(cells)
+        if rows_written and buffer.tell() + line.tell() > budget_chars:
+            break
+        buffer.write(line.getvalue())
+        rows_written += 1
+
+    if rows_written < len(df):
+        notes.append(f"... {len(df) - rows_written} more rows not shown")
+    return buffer.getvalue() + "".join(f"{note}\n" for note in notes)
+
+
+def encode_values(
+    values: list,
+    max_cell_chars: int = SAMPLE_MAX_CELL_CHARS,
+    token_budget: int = SAMPLE_TOKEN_BUDGET,
+) -> str:
+    """Encode a list of sampled values, one per line, within the token budget."""
+    lines = []
+    used = 0
+    for val in values:
+        text = _truncate(val, max_cell_chars)
+        if lines and used + len(text) + 1 > token_budget * CHARS_PER_TOKEN:
+            lines.append(f"... {len(values) - len(lines)} more values not shown")
+            break
+        lines.append(text)
+        used += len(text) + 1
+    return "\n".join(lines)
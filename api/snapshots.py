@@ -0,0 +1,137 @@
+"""
+Dataset Snapshots
+=================
+The working state of a dataset, shared between the orchestrator process and
+the MCP tool workers without re-parsing the working file.
+
+Every full read of a working file that had to parse it, and every save
+(`table_io.read_table`, `save_table`), publishes the frame as an Arrow IPC
+file in SNAPSHOT_DIR, which is /dev/shm (memory) where it exists. A snapshot
+is stamped with the version of the working file it matches (inode, size and
+modification time), so it is only used while the file is unchanged: anything
+else that rewrites the file (a checkpoint restore, an incremental append)
+makes it stale, and the next read parses the file again.
+
+Readers memory-map the snapshot, so every process maps the same pages and the
+string and categorical columns of the frame are wrapped instead of copied.
+Sampling a column then costs milliseconds instead of a spreadsheet parse.
+pandas copies a mapped column on the first write (copy-on-write), so tools
+modify their frame as before.
+
+Frames Arrow cannot store (columns mixing text and numbers) and frames over
+SNAPSHOT_MAX_MB are not published. SNAPSHOTS=0 turns snapshots off. A job's
+snapshots are removed when it ends (`scope`), and `prune` removes the ones
+left behind by crashed processes after SNAPSHOT_TTL_HOURS.
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import metrics
+import pandas as pd
+import pyarrow as pa
+from storage import replacing
+
+SNAPSHOTS = os.environ.get("SNAPSHOTS", "1") != "0"
+SNAPSHOT_DIR = Path(
+    os.environ.get("SNAPSHOT_DIR")
+    or Path("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+    / "hackeurope-snapshots"
+)
+SNAPSHOT_MAX_MB = float(os.environ.get("SNAPSHOT_MAX_MB", "1024"))
+SNAPSHOT_TTL_HOURS = float(os.environ.get("SNAPSHOT_TTL_HOURS", "24"))
+SNAPSHOT_SUFFIX = ".arrow"
+
+
+def _key(file_path: str | Path) -> str:
+    return hashlib.sha1(os.path.realpath(file_path).encode()).hexdigest()[:16]
+
+
+def _stamp(file_path: str | Path) -> str:
+    st = os.stat(file_path)
+    return f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def snapshot_path(file_path: str | Path) -> Path:
+    """The snapshot matching the current version of a working file."""
+    return SNAPSHOT_DIR / f"{_key(file_path)}-{_stamp(file_path)}{SNAPSHOT_SUFFIX}"
+
+
+def load(file_path: str | Path) -> pd.DataFrame | None:
+    """The frame of the current version of a working file, memory-mapped from
+    its snapshot, or None if there is no up-to-date snapshot."""
+    if not SNAPSHOTS:
+        return None
+    try:
+        with pa.memory_map(str(snapshot_path(file_path))) as source:
+            table = pa.ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowException):
+        metrics.cache_lookup("snapshot", False)
+        return None
+    metrics.cache_lookup("snapshot", True)
+    # The table keeps the mapping open; split blocks avoid consolidating
+    # (copying) the numeric columns.
+    return table.to_pandas(split_blocks=True)
+
+
+def publish(df: pd.DataFrame, file_path: str | Path) -> None:
+    """Publish `df` as the snapshot of the current version of `file_path`,
+    which must just have been read or written, and drop older versions."""
+    if not SNAPSHOTS:
+        return
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if table.nbytes > SNAPSHOT_MAX_MB * 2**20:
+            discard(file_path)
+            return
+        SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        target = snapshot_path(file_path)
+        with replacing(target) as tmp:
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    except (OSError, ValueError, pa.ArrowException) as e:
+        print(
+            f"[snapshot] not published for {Path(file_path).name}: {e}",
+            file=sys.stderr,
+            flush=True,
+        )
+        discard(file_path)
+        return
+    discard(file_path, keep=target)
+
+
+def discard(file_path: str | Path, keep: Path | None = None) -> None:
+    """Remove the snapshots of a working file (except `keep`). Processes that
+    mapped one keep reading it until they let go of their frame."""
+    for path in SNAPSHOT_DIR.glob(f"{_key(file_path)}-*{SNAPSHOT_SUFFIX}"):
+        if path != keep:
+            path.unlink(missing_ok=True)
+
+
+@contextmanager
+def scope(*file_paths: str | Path):
+    """Discard the snapshots of `file_paths` when the enclosed job ends."""
+    try:
+        yield
+    finally:
+        for file_path in file_paths:
+            discard(file_path)
+
+
+def prune(ttl_hours: float = SNAPSHOT_TTL_HOURS) -> int:
+    """Remove snapshots older than `ttl_hours`; returns how many."""
+    removed = 0
+    cutoff = time.time() - ttl_hours * 3600
+    for path in SNAPSHOT_DIR.glob(f"*{SNAPSHOT_SUFFIX}"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
@@ -0,0 +1,276 @@
+"""
+Storage
+=======
+Working copies, atomic writes and a managed artifact store.
+
+Working copies
+--------------
+`working_copy` clones a file instead of copying its bytes whenever the
+filesystem allows it:
+
+  1. a reflink (FICLONE: btrfs, XFS, bcachefs), which shares blocks
+     copy-on-write;
+  2. a hard link (STORAGE_HARDLINKS=1, the default), which shares the inode;
+  3. a plain copy.
+
+A hard link is only safe because every write of the pipeline replaces its
+file atomically (`replacing`): the working copy gets a new inode on its first
+write and the source is never modified. Code that must write in place, such
+as appending rows, calls `break_link` first.
+
+Artifact store
+--------------
+`ArtifactStore` keeps a directory of uploads and results bounded:
+
+  - idle text files (CSV, JSON, ...) are compressed with zstd after
+    STORAGE_COMPRESS_AFTER_MINUTES and restored on access by `materialize`;
+  - files untouched for STORAGE_TTL_HOURS are deleted;
+  - beyond STORAGE_MAX_GB, the least recently used files are deleted first.
+
+A file leased by a running job (`lease`) is never compressed or deleted, and
+neither are the files derived from it (recipe, checkpoint, downloads), which
+share its stem. Leases are files under `<root>/.leases` holding the process
+id, so they are shared between processes and a crashed job's leases expire
+with it.
+"""
+
+import errno
+import fcntl
+import os
+import shutil
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from lazy_imports import lazy_import
+
+# Only needed to compress and decompress artifacts.
+pa = lazy_import("pyarrow")
+
+STORAGE_HARDLINKS = os.environ.get("STORAGE_HARDLINKS", "1") != "0"
+STORAGE_TTL_HOURS = float(os.environ.get("STORAGE_TTL_HOURS", "72"))
+STORAGE_MAX_GB = float(os.environ.get("STORAGE_MAX_GB", "10"))
+STORAGE_COMPRESS_AFTER_MINUTES = float(
+    os.environ.get("STORAGE_COMPRESS_AFTER_MINUTES", "60")
+)
+
+# ioctl request number of FICLONE on Linux.
+FICLONE = 0x40049409
+COMPRESSED_SUFFIX = ".zst"
+# Only these are worth compressing: xlsx, parquet and archives already are.
+COMPRESSIBLE_SUFFIXES = {".csv", ".tsv", ".tab", ".psv", ".txt", ".json", ".jsonl", ".ndjson"}
+LEASE_DIR = ".leases"
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def working_copy(src: str | Path, dst: str | Path) -> str:
+    """Create `dst` as a copy of `src`, as cheaply as the filesystem allows.
+
+    Returns how: "reflink", "hardlink" or "copy".
+    """
+    src, dst = Path(src), Path(dst)
+    dst.unlink(missing_ok=True)
+    if _reflink(src, dst):
+        return "reflink"
+    if STORAGE_HARDLINKS:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def break_link(path: str | Path) -> None:
+    """Give a hard-linked file its own inode before it is modified in place."""
+    path = Path(path)
+    if path.exists() and path.stat().st_nlink > 1:
+        tmp = path.with_name(f".{uuid.uuid4().hex}.{path.name}")
+        shutil.copy2(path, tmp)
+        os.replace(tmp, path)
+
+
+@contextmanager
+def replacing(path: str | Path):
+    """Yield a temporary path to write, which then atomically replaces `path`.
+
+    The temporary file keeps the suffix of `path`, so writers that pick their
+    format by extension behave the same.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{uuid.uuid4().hex}.{path.name}")
+    try:
+        yield str(tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class ArtifactStore:
+    """A directory of files with leases, compression and eviction."""
+
+    def __init__(
+        self,
+        root: str | Path,
+        ttl_hours: float = STORAGE_TTL_HOURS,
+        max_gb: float = STORAGE_MAX_GB,
+        compress_after_minutes: float | None = STORAGE_COMPRESS_AFTER_MINUTES,
+        patterns: tuple[str, ...] = ("*",),
+    ):
+        """`patterns` limits the store to the matching files of `root`, for a
+        directory that other files share."""
+        self.root = Path(root)
+        self.patterns = patterns
+        self.ttl = ttl_hours * 3600
+        self.max_bytes = max_gb * 2**30
+        self.compress_after = (
+            None if compress_after_minutes is None else compress_after_minutes * 60
+        )
+        self.lease_dir = self.root / LEASE_DIR
+
+    # --- leases ---
+
+    @contextmanager
+    def lease(self, *paths: str | Path):
+        """Protect files (and the files derived from them) while in use."""
+        self.lease_dir.mkdir(parents=True, exist_ok=True)
+        leases = []
+        for path in paths:
+            lease = self.lease_dir / f"{Path(path).name}@{os.getpid()}-{uuid.uuid4().hex}"
+            lease.write_text(str(os.getpid()))
+            leases.append(lease)
+        try:
+            yield
+        finally:
+            for lease in leases:
+                lease.unlink(missing_ok=True)
+
+    def leased_stems(self) -> set[str]:
+        """Stems of the leased files; leases of dead processes are removed."""
+        stems = set()
+        if not self.lease_dir.exists():
+            return stems
+        for lease in self.lease_dir.iterdir():
+            name, _, holder = lease.name.rpartition("@")
+            try:
+                pid = int(holder.split("-")[0])
+            except ValueError:
+                pid = -1
+            if pid > 0 and _pid_alive(pid):
+                stems.add(Path(name.removesuffix(COMPRESSED_SUFFIX)).stem)
+            else:
+                lease.unlink(missing_ok=True)
+        return stems
+
+    def _is_leased(self, path: Path, stems: set[str]) -> bool:
+        name = path.name.lstrip(".")
+        return any(name.startswith(stem) for stem in stems)
+
+    # --- compression ---
+
+    def compress(self, path: str | Path) -> Path:
+        """Replace a file by its zstd-compressed copy `<name>.zst`."""
+        path = Path(path)
+        target = path.with_name(path.name + COMPRESSED_SUFFIX)
+        with replacing(target) as tmp:
+            with open(path, "rb") as src, pa.CompressedOutputStream(tmp, "zstd") as out:
+                shutil.copyfileobj(src, out, 1 << 20)
+        shutil.copystat(path, target)
+        path.unlink()
+        return target
+
+    def materialize(self, path: str | Path) -> Path:
+        """Return `path`, decompressing it first if the store compressed it."""
+        path = Path(path)
+        compressed = path.with_name(path.name + COMPRESSED_SUFFIX)
+        if not path.exists() and compressed.exists():
+            with replacing(path) as tmp:
+                with pa.CompressedInputStream(str(compressed), "zstd") as src, open(tmp, "wb") as out:
+                    shutil.copyfileobj(src, out, 1 << 20)
+            shutil.copystat(compressed, path)
+            compressed.unlink()
+        if path.exists():
+            os.utime(path)  # counts as a use for the eviction order
+        return path
+
+    # --- eviction ---
+
+    def _files(self) -> list[Path]:
+        return [
+            p for p in self.root.iterdir()
+            if p.is_file()
+            and not p.name.startswith(".")
+            and any(p.match(pattern) for pattern in self.patterns)
+        ]
+
+    def gc(self) -> dict:
+        """Compress idle files and evict expired ones, then the least recently
+        used until the store fits in its size limit. Leased files are kept."""
+        now = time.time()
+        stats = {"compressed": 0, "deleted": 0, "freed_bytes": 0}
+        if not self.root.exists():
+            return stats
+        stems = self.leased_stems()
+
+        def used(path: Path) -> float:
+            st = path.stat()
+            return max(st.st_mtime, st.st_atime)
+
+        for path in self._files():
+            if self._is_leased(path, stems):
+                continue
+            idle = now - used(path)
+            if idle > self.ttl:
+                stats["freed_bytes"] += path.stat().st_size
+                path.unlink(missing_ok=True)
+                stats["deleted"] += 1
+            elif (
+                self.compress_after is not None
+                and idle > self.compress_after
+                and path.suffix.lower() in COMPRESSIBLE_SUFFIXES
+            ):
+                size = path.stat().st_size
+                stats["freed_bytes"] += size - self.compress(path).stat().st_size
+                stats["compressed"] += 1
+
+        files = sorted(self._files(), key=used)
+        total = sum(p.stat().st_size for p in files)
+        for path in files:
+            if total <= self.max_bytes:
+                break
+            if self._is_leased(path, stems):
+                continue
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            total -= size
+            stats["deleted"] += 1
+            stats["freed_bytes"] += size
+        if stats["deleted"] or stats["compressed"]:
+            print(
+                f"[storage] {self.root}: {stats['compressed']} compressed, "
+                f"{stats['deleted']} deleted, {stats['freed_bytes'] / 2**20:.1f} MiB freed",
+                file=sys.stderr,
+                flush=True,
+            )
+        return stats
@@ -0,0 +1,364 @@
+"""
+Table I/O
+=========
+Reading and writing of the files the pipeline works on, shared by the MCP tool
+server and the recipe replay engine. Excel workbooks are handled here; the
+format of other inputs is sniffed and they are read by `readers`.
+
+Full reads are served from the dataset's memory-mapped snapshot while the file
+is unchanged, and saves publish a new one (see snapshots.py).
+"""
+
+import os
+from pathlib import Path
+
+import display_formats
+import pandas as pd
+import readers
+import snapshots
+import xlsxwriter
+from compaction import COMPACT_FRAMES, MEMORY_REPORT, compact, log_memory, memory_mb
+from storage import replacing
+
+# Spreadsheet engines. calamine (Rust) is the fastest xlsx reader and xlsxwriter
+# in constant-memory mode streams rows to disk instead of building the whole
+# workbook in memory. Both can be switched back to openpyxl via env vars.
+EXCEL_READ_ENGINE = os.environ.get("EXCEL_READ_ENGINE", "calamine")
+EXCEL_WRITE_ENGINE = os.environ.get("EXCEL_WRITE_ENGINE", "xlsxwriter")
+
+# Hard row limit of an Excel worksheet (header row included).
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_MAX_SHEET_NAME = 31
+# Day 0 of Excel's (1900) date system.
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+
+
+def _continuation_sheet_name(sheet_name: str, part: int) -> str:
+    """Name of the `part`-th (1-based) sheet a frame is split into."""
+    if part == 1:
+        return sheet_name
+    suffix = f" ({part})"
+    return sheet_name[: EXCEL_MAX_SHEET_NAME - len(suffix)] + suffix
+
+
+def _continuation_sheets(sheet_names: list[str], sheet_name: str) -> list[str]:
+    """Return the overflow sheets written for `sheet_name`, in order."""
+    parts = []
+    part = 2
+    while _continuation_sheet_name(sheet_name, part) in sheet_names:
+        parts.append(_continuation_sheet_name(sheet_name, part))
+        part += 1
+    return parts
+
+
+def _split_for_excel(sheet_name: str, df: pd.DataFrame):
+    """Yield (sheet_name, chunk) pairs that each fit in one worksheet."""
+    rows_per_sheet = EXCEL_MAX_ROWS - 1
+    if len(df) <= rows_per_sheet:
+        yield sheet_name, df
+        return
+    for part, start in enumerate(range(0, len(df), rows_per_sheet), start=1):
+        yield (
+            _continuation_sheet_name(sheet_name, part),
+            df.iloc[start : start + rows_per_sheet],
+        )
+
+
+def _read_excel(
+    file_path: str,
+    header: int | None = 0,
+    nrows: int | None = None,
+    sheet_name: str | None = None,
+) -> pd.DataFrame:
+    """Read one sheet (the first by default), re-joining any overflow sheets."""
+    with pd.ExcelFile(file_path, engine=EXCEL_READ_ENGINE) as xls:
+        first = sheet_name if sheet_name is not None else xls.sheet_names[0]
+        df = xls.parse(first, header=header, nrows=nrows)
+        if nrows is not None and len(df) >= nrows:
+            return df
+        overflow = _continuation_sheets(xls.sheet_names, first)
+        if not overflow:
+            return df
+        frames = [df]
+        for sheet_name in overflow:
+            part = xls.parse(sheet_name, header=0)
+            part.columns = df.columns
+            frames.append(part)
+        df = pd.concat(frames, ignore_index=True)
+        return df if nrows is None else df.head(nrows)
+
+
+def sheet_names(file_path: str) -> list[str]:
+    """Names of the sheets of a workbook, without overflow sheets."""
+    with pd.ExcelFile(file_path, engine=EXCEL_READ_ENGINE) as xls:
+        names = xls.sheet_names
+    overflow = {o for name in names for o in _continuation_sheets(names, name)}
+    return [name for name in names if name not in overflow]
+
+
+def read_workbook(file_path: str, header: int | None = 0) -> dict[str, pd.DataFrame]:
+    """Read every sheet of a workbook, re-joining overflow sheets to their base."""
+    with pd.ExcelFile(file_path, engine=EXCEL_READ_ENGINE) as xls:
+        names = xls.sheet_names
+        overflow = {o for name in names for o in _continuation_sheets(names, name)}
+        sheets = {}
+        for name in names:
+            if name in overflow:
+                continue
+            frames = [xls.parse(name, header=header)]
+            for part_name in _continuation_sheets(names, name):
+                part = xls.parse(part_name, header=header)
+                part.columns = frames[0].columns
+                frames.append(part)
+            sheets[name] = (
+                frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+            )
+        return sheets
+
+
+def _iter_rows(df: pd.DataFrame):
+    """Yield rows as lists of plain Python values, with missing values as None."""
+    columns = []
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        columns.append(col.astype(object).where(col.notna(), None).tolist())
+    return zip(*columns)
+
+
+def _excel_serials(col: pd.Series) -> pd.Series:
+    """Datetimes as Excel serial day numbers, which a date number format shows
+    as dates (much faster to write than datetime cells)."""
+    return (col - EXCEL_EPOCH) / pd.Timedelta(days=1)
+
+
+def _column_width(number_format: str) -> int:
+    """A column width that shows values of a number format without '###'."""
+    return max(len(number_format) + 2, 10)
+
+
+def _write_excel_xlsxwriter(
+    file_path: str,
+    sheets: dict[str, pd.DataFrame],
+    index: bool = False,
+    header: bool = True,
+    number_formats: dict[str, dict[str, str]] | None = None,
+):
+    """Stream sheets to disk row by row with xlsxwriter in constant-memory mode.
+
+    pandas' own xlsxwriter path writes column by column, which constant-memory
+    mode does not support, so rows are written here directly.
+    """
+    options = {
+        "constant_memory": True,
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+        "nan_inf_to_errors": True,
+        "default_date_format": "yyyy-mm-dd hh:mm:ss",
+    }
+    with xlsxwriter.Workbook(file_path, options) as workbook:
+        cell_formats = {}
+        for sheet_name, df in sheets.items():
+            if index:
+                df = df.reset_index()
+            sheet_formats = (number_formats or {}).get(sheet_name, {})
+            for code in sheet_formats.values():
+                if code not in cell_formats:
+                    cell_formats[code] = workbook.add_format({"num_format": code})
+            for chunk_name, chunk in _split_for_excel(sheet_name, df):
+                worksheet = workbook.add_worksheet(chunk_name)
+                codes = [sheet_formats.get(str(c)) for c in chunk.columns]
+                formats = [cell_formats[code] if code else None for code in codes]
+                for col_idx, code in enumerate(codes):
+                    if not code:
+                        continue
+                    worksheet.set_column(col_idx, col_idx, _column_width(code))
+                    col = chunk.iloc[:, col_idx]
+                    if pd.api.types.is_datetime64_dtype(col.dtype):
+                        chunk = chunk.copy(deep=False)
+                        chunk.isetitem(col_idx, _excel_serials(col))
+                if header:
+                    worksheet.write_row(0, 0, [str(c) for c in chunk.columns])
+                start = int(header)
+                if not any(formats):
+                    for row_idx, row in enumerate(_iter_rows(chunk), start=start):
+                        worksheet.write_row(row_idx, 0, row)
+                    continue
+                # A cell's own format wins over its column's, so formatted
+                # columns are written cell by cell (as write_row does anyway).
+                for row_idx, row in enumerate(_iter_rows(chunk), start=start):
+                    for col_idx, (value, cell_format) in enumerate(zip(row, formats)):
+                        if cell_format is None:
+                            worksheet.write(row_idx, col_idx, value)
+                        elif value is not None:
+                            worksheet.write(row_idx, col_idx, value, cell_format)
+
+
+def _apply_number_formats(
+    worksheet, df: pd.DataFrame, formats: dict[str, str], index: bool, header: bool
+) -> None:
+    """Set the number formats of the columns of a sheet written by openpyxl."""
+    offset = df.index.nlevels if index else 0
+    for col_idx, col in enumerate(df.columns, start=offset + 1):
+        code = formats.get(str(col))
+        if not code:
+            continue
+        letter = worksheet.cell(row=1, column=col_idx).column_letter
+        worksheet.column_dimensions[letter].width = _column_width(code)
+        for (cell,) in worksheet.iter_rows(
+            min_row=int(header) + 1, min_col=col_idx, max_col=col_idx
+        ):
+            cell.number_format = code
+
+
+def write_excel(
+    file_path: str,
+    sheets: dict[str, pd.DataFrame],
+    index: bool = False,
+    header: bool = True,
+    number_formats: dict[str, dict[str, str]] | None = None,
+):
+    """Write one or more sheets to a workbook with the configured engine.
+
+    With `header=False` the column labels are not written, so a sheet read
+    with `header=None` is written back unchanged. `number_formats` gives
+    Excel number formats by sheet and column (see display_formats.py). The
+    workbook replaces the file atomically (see storage.py).
+    """
+    with replacing(file_path) as tmp_path:
+        if EXCEL_WRITE_ENGINE == "xlsxwriter":
+            _write_excel_xlsxwriter(
+                tmp_path, sheets, index=index, header=header, number_formats=number_formats
+            )
+        else:
+            with pd.ExcelWriter(tmp_path, engine=EXCEL_WRITE_ENGINE) as writer:
+                for sheet_name, df in sheets.items():
+                    sheet_formats = (number_formats or {}).get(sheet_name)
+                    for chunk_name, chunk in _split_for_excel(sheet_name, df):
+                        chunk.to_excel(
+                            writer, sheet_name=chunk_name, index=index, header=header
+                        )
+                        if sheet_formats:
+                            _apply_number_formats(
+                                writer.sheets[chunk_name], chunk, sheet_formats, index, header
+                            )
+
+
+def is_excel(file_path: str) -> bool:
+    """Whether a working file is written as a workbook (by its extension)."""
+    return readers.output_format(file_path).format == "excel"
+
+
+def _load_table(
+    file_path: str,
+    header: int | None,
+    nrows: int | None,
+    sheet_name: str | None,
+) -> pd.DataFrame:
+    sniffed = readers.sniff(file_path)
+    if sniffed.format == "excel":
+        return _read_excel(
+            file_path, header=header, nrows=nrows, sheet_name=sheet_name
+        )
+    if sniffed.format == "delimited":
+        return readers.read_delimited(file_path, sniffed, header=header, nrows=nrows)
+    df = readers.apply_header(readers.read_json_table(file_path, sniffed), header)
+    return df if nrows is None else df.head(nrows)
+
+
+def read_table(
+    file_path: str,
+    header: int | None = 0,
+    nrows: int | None = None,
+    sheet_name: str | None = None,
+    compact_frame: bool = COMPACT_FRAMES,
+) -> pd.DataFrame:
+    """Read one sheet of a workbook (the first by default), delimited text or
+    JSON records, depending on the sniffed format of the file.
+
+    Full reads are compacted (categoricals, downcast numbers, Arrow strings)
+    unless `compact_frame` is False. Full reads of the first sheet with the
+    default header come from the file's snapshot when it is up to date.
+    """
+    shared = header == 0 and nrows is None and sheet_name is None
+    shared = shared and compact_frame == COMPACT_FRAMES
+    if shared and (df := snapshots.load(file_path)) is not None:
+        return df
+    df = _load_table(file_path, header, nrows, sheet_name)
+    if nrows is None and compact_frame:
+        before = memory_mb(df) if MEMORY_REPORT else None
+        df = compact(df)
+        log_memory(f"load {Path(file_path).name}", df, before)
+    if shared:
+        snapshots.publish(df, file_path)
+    return df
+
+
+def _number_formats(
+    file_path: str, sheet_name: str, display: dict[str, dict] | None
+) -> dict[str, dict[str, str]]:
+    if display is None:
+        display = display_formats.for_file(file_path)
+    return {sheet_name: display_formats.excel_formats(display)}
+
+
+def save_table(
+    df: pd.DataFrame,
+    file_path: str,
+    index: bool = False,
+    stage: str | None = None,
+    display: dict[str, dict] | None = None,
+):
+    """Save a frame as a single-sheet workbook, or as text in the format of
+    the file's extension. `stage` names the step in the memory report.
+
+    Workbooks show typed columns in their `display` formats, by default those
+    recorded in the file's recipe (see display_formats.py).
+    """
+    if stage:
+        log_memory(stage, df)
+    fmt = readers.output_format(file_path)
+    if fmt.format == "excel":
+        number_formats = _number_formats(file_path, "Sheet1", display)
+        write_excel(file_path, {"Sheet1": df}, index=index, number_formats=number_formats)
+    else:
+        with replacing(file_path) as tmp_path:
+            readers.write_text_table(df, tmp_path, fmt, index=index)
+    if not index:
+        _publish_saved(df, file_path)
+
+
+def _publish_saved(df: pd.DataFrame, file_path: str) -> None:
+    """Publish a saved frame as the snapshot a full read would return."""
+    snapshots.publish(compact(df) if COMPACT_FRAMES else df, file_path)
+
+
+def description_path(file_path: str) -> str:
+    """Where the description of a non-Excel working file is written."""
+    path = Path(file_path)
+    return str(path.with_name(f"{path.stem}_description.csv"))
+
+
+def save_with_description(
+    df: pd.DataFrame,
+    desc_df: pd.DataFrame,
+    file_path: str,
+    display: dict[str, dict] | None = None,
+) -> str:
+    """Save the cleaned data together with its description.
+
+    Workbooks get a "Cleaned_Data" and a "dataset_description" sheet; other
+    files get the description as a CSV next to them. Returns where the
+    description went. `display` is as for `save_table`.
+    """
+    if is_excel(file_path):
+        write_excel(
+            file_path,
+            {"Cleaned_Data": df, "dataset_description": desc_df},
+            number_formats=_number_formats(file_path, "Cleaned_Data", display),
+        )
+        _publish_saved(df, file_path)
+        return "dataset_description sheet"
+    save_table(df, file_path, display=display)
+    desc_path = description_path(file_path)
+    desc_df.to_csv(desc_path, index=False)
+    return desc_path
@@ -0,0 +1,140 @@
+"""
+Non-blocking Tools
+==================
+The MCP tools are CPU-bound pandas code. Running them on the server's event
+loop would make one long `dateparser` run block every other request, even a
+cheap header preview from another job.
+
+`offloaded` turns a synchronous tool into an async handler that runs the tool
+in a bounded executor:
+
+  - TOOL_EXECUTOR=process (default) runs tools in a pool of TOOL_WORKERS
+    worker processes, so CPU-bound tools run in parallel;
+  - TOOL_EXECUTOR=thread runs them in a thread pool of the same size, which
+    starts faster but only overlaps the work that releases the GIL.
+
+Calls on the same `file_path` are serialized by a per-file lock, so
+concurrent tools on one dataset never interleave their reads and writes.
+Calls on different files run concurrently.
+
+Worker processes mark themselves dead in the metrics when they exit (see
+metrics.py), so their live gauges leave the aggregate with them.
+
+`warm_up` starts a worker and imports the modules the tools need in it while
+the server waits for its first call, which then does not pay for process
+start and the pandas import.
+"""
+
+import asyncio
+import atexit
+import functools
+import importlib
+import inspect
+import multiprocessing
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import metrics
+import profiling
+
+TOOL_EXECUTOR = os.environ.get("TOOL_EXECUTOR", "process")
+TOOL_WORKERS = int(os.environ.get("TOOL_WORKERS", str(os.cpu_count() or 1)))
+
+# Synchronous tools by name, so worker processes can find them. A server run
+# as a script registers its tools in workers under "__mp_main__", hence the
+# name alone is the key.
+_TOOLS: dict[str, Callable] = {}
+_file_locks: dict[str, asyncio.Lock] = {}
+_executor: Executor | None = None
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if TOOL_EXECUTOR == "thread":
+            _executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS)
+        else:
+            # Workers are spawned rather than forked: the server process runs
+            # an event loop and transport threads that must not be copied.
+            _executor = ProcessPoolExecutor(
+                max_workers=TOOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_started,
+            )
+    return _executor
+
+
+def _worker_started() -> None:
+    atexit.register(metrics.process_exited)
+
+
+def _file_lock(file_path: str) -> asyncio.Lock:
+    key = os.path.realpath(file_path)
+    lock = _file_locks.get(key)
+    if lock is None:
+        lock = _file_locks[key] = asyncio.Lock()
+    return lock
+
+
+def _call_tool(module: str, name: str, args: tuple, kwargs: dict):
+    """Run a registered tool; importing its module registers it in a worker."""
+    if name not in _TOOLS:
+        importlib.import_module(module)
+    fn = _TOOLS[name]
+    if not profiling.enabled():
+        return fn(*args, **kwargs)
+    file_path = inspect.signature(fn).bind(*args, **kwargs).arguments.get("file_path")
+    with profiling.profiled(name, file_path):
+        return fn(*args, **kwargs)
+
+
+def _preload(modules: tuple[str, ...]) -> None:
+    for name in modules:
+        # Any attribute access executes a module declared with lazy_import.
+        getattr(importlib.import_module(name), "__name__")
+
+
+def warm_up(*modules: str) -> None:
+    """Import `modules` in the executor in the background (see the module
+    docstring)."""
+    _get_executor().submit(_preload, modules)
+
+
+def offloaded(fn: Callable) -> Callable:
+    """Wrap a synchronous tool into an async handler (see the module docstring).
+
+    The handler keeps the tool's name, docstring and signature, from which the
+    MCP tool schema is built. The synchronous tool stays available as
+    `handler.__wrapped__`.
+    """
+    _TOOLS[fn.__name__] = fn
+    signature = inspect.signature(fn)
+    duration = metrics.tool_seconds.labels(fn.__name__)
+
+    async def run(call):
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(_get_executor(), call)
+        finally:
+            duration.observe(time.perf_counter() - start)
+
+    @functools.wraps(fn)
+    async def handler(*args, **kwargs):
+        file_path = signature.bind(*args, **kwargs).arguments.get("file_path")
+        call = functools.partial(_call_tool, fn.__module__, fn.__name__, args, kwargs)
+        if file_path is None:
+            return await run(call)
+        async with _file_lock(file_path):
+            return await run(call)
+
+    return handler
+
+
+def shutdown_executor() -> None:
+    """Stop the worker pool, e.g. before the server exits."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
@@ -0,0 +1,522 @@
+"""
+Column Transforms
+=================
+Pure pandas implementations of every cleaning operation the agents can decide
+on. The MCP tools apply them to the working file; the recipe replay engine
+applies the same functions to new files without any model calls.
+
+Each function takes the already-decided parameters and returns a new frame or
+series; nothing here reads or writes files. Per-value parsers run once per
+distinct value and the results are broadcast back to the rows.
+
+dateparser is only imported when a date is first parsed: it loads timezone and
+language data for a third of a second, which every process importing this
+module would otherwise pay before serving anything. Dates are parsed in the
+DATE_LANGUAGES only (comma-separated codes, "en" by default) instead of trying
+every language dateparser knows.
+"""
+
+import functools
+import os
+import re
+import string
+import unicodedata
+
+import numpy as np
+import pandas as pd
+from compaction import CATEGORY_MAX_RATIO
+from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype
+
+DATE_LANGUAGES = [
+    code.strip() for code in os.environ.get("DATE_LANGUAGES", "en").split(",") if code.strip()
+]
+
+CURRENCY_RE = re.compile(
+    r"([\$\u20ac\u00a3\u00a5]|(?:usd|eur|gbp|jpy|dollars?|euros?|pounds?|yen))",
+    re.IGNORECASE,
+)
+CURRENCY_CODES = {
+    "dollar": "USD",
+    "dollars": "USD",
+    "$": "USD",
+    "usd": "USD",
+    "euro": "EUR",
+    "euros": "EUR",
+    "eur": "EUR",
+    "\u20ac": "EUR",
+    "pound": "GBP",
+    "pounds": "GBP",
+    "gbp": "GBP",
+    "\u00a3": "GBP",
+    "yen": "JPY",
+    "jpy": "JPY",
+    "\u00a5": "JPY",
+}
+
+_ORDINAL_WORDS = {
+    "first": "1st",
+    "second": "2nd",
+    "third": "3rd",
+    "fourth": "4th",
+    "fifth": "5th",
+    "sixth": "6th",
+    "seventh": "7th",
+    "eighth": "8th",
+    "ninth": "9th",
+    "tenth": "10th",
+    "eleventh": "11th",
+    "twelfth": "12th",
+    "thirteenth": "13th",
+    "fourteenth": "14th",
+    "fifteenth": "15th",
+    "sixteenth": "16th",
+    "seventeenth": "17th",
+    "eighteenth": "18th",
+    "nineteenth": "19th",
+    "twentieth": "20th",
+    "twenty-first": "21st",
+    "twenty first": "21st",
+    "twenty-second": "22nd",
+    "twenty second": "22nd",
+    "twenty-third": "23rd",
+    "twenty third": "23rd",
+    "twenty-fourth": "24th",
+    "twenty fourth": "24th",
+    "twenty-fifth": "25th",
+    "twenty fifth": "25th",
+    "twenty-sixth": "26th",
+    "twenty sixth": "26th",
+    "twenty-seventh": "27th",
+    "twenty seventh": "27th",
+    "twenty-eighth": "28th",
+    "twenty eighth": "28th",
+    "twenty-ninth": "29th",
+    "twenty ninth": "29th",
+    "thirtieth": "30th",
+    "thirty-first": "31st",
+    "thirty first": "31st",
+    "last": "last",
+}
+
+_SCALE_DIVISORS = {
+    "Billions": (1_000_000_000, "in billions"),
+    "Millions": (1_000_000, "in millions"),
+    "Thousands": (1_000, "in thousands"),
+}
+
+# Words skipped when abbreviating multi-word labels to their initials, so
+# 'United States of America' abbreviates to 'usa'.
+_INITIALS_STOPWORDS = {"of", "the", "and", "&"}
+# Inflections stripped from single-word labels, so 'failed' clusters with 'fail'.
+_LABEL_SUFFIXES = ("ing", "ed", "es", "s")
+_PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+
+
+def map_distinct(series: pd.Series, func) -> pd.Series:
+    """Apply `func` once per distinct value of `series` and broadcast the results.
+
+    Missing values are passed to `func` once as well. Falls back to a plain
+    element-wise apply when the values are not hashable. Text results come
+    back compact: categorical when they repeat a lot, Arrow strings otherwise.
+    """
+    try:
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    except TypeError:
+        return series.apply(func)
+    results = np.empty(len(uniques) + 1, dtype=object)
+    for i, val in enumerate(uniques):
+        results[i] = func(val)
+    results[-1] = func(pd.NA)
+
+    # codes of -1 (missing) pick the last result, func(pd.NA).
+    labels, categories = pd.factorize(pd.Series(results, dtype=object))
+    if len(categories) and all(isinstance(c, str) for c in categories):
+        if len(categories) <= len(series) * CATEGORY_MAX_RATIO:
+            values = pd.Categorical.from_codes(labels[codes], categories=categories)
+        else:
+            values = pd.array(results[codes], dtype="str")
+        return pd.Series(values, index=series.index, name=series.name)
+    return pd.Series(results[codes], index=series.index, name=series.name)
+
+
+def stack_columns(df: pd.DataFrame, columns: list) -> pd.Series:
+    """The values of several columns as one series, column after column."""
+    if len(columns) == 1:
+        return df[columns[0]]
+    return pd.concat([df[col] for col in columns], ignore_index=True)
+
+
+def format_columns(df: pd.DataFrame, columns: list, transform, *args) -> pd.DataFrame:
+    """Apply a series transform to several columns at once.
+
+    The columns are stacked into one series, so a per-value transform handles
+    each distinct value once for all of them, and the result is split back.
+    """
+    result = transform(stack_columns(df, columns), *args)
+    rows = len(df)
+    for i, col in enumerate(columns):
+        df[col] = result.iloc[i * rows : (i + 1) * rows].set_axis(df.index)
+    return df
+
+
+def crop_columns(df: pd.DataFrame, header_col_index: int) -> pd.DataFrame:
+    """Drop the empty columns to the left of the data table."""
+    if header_col_index > 0:
+        return df.iloc[:, header_col_index:]
+    return df
+
+
+def wipe_na_strings(df: pd.DataFrame, na_strings: list[str]) -> pd.DataFrame:
+    """Replace cells whose stripped text is one of `na_strings` with NA.
+
+    Only the distinct values of each text column are inspected.
+    """
+    na_strings = set(na_strings)
+    df = df.copy(deep=False)
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            distinct = col.cat.categories
+        elif is_numeric_dtype(col.dtype) or is_datetime64_any_dtype(col.dtype):
+            continue
+        else:
+            distinct = col.dropna().unique()
+        wipe = [v for v in distinct if isinstance(v, str) and v.strip() in na_strings]
+        if wipe:
+            df.isetitem(i, col.mask(col.isin(wipe)))
+    return df
+
+
+def empty_columns(df: pd.DataFrame) -> list:
+    """Return the labels of columns where every value is missing."""
+    return list(df.columns[df.isna().all(axis=0)])
+
+
+@functools.cache
+def _date_parser():
+    from dateparser.date import DateDataParser
+
+    return DateDataParser(languages=DATE_LANGUAGES or None)
+
+
+def parse_natural_date(date_str):
+    """Parse a date written in free text, e.g. 'first of january 2016'."""
+    if pd.isna(date_str):
+        return pd.NaT
+
+    clean_str = str(date_str).lower()
+    for word, num in _ORDINAL_WORDS.items():
+        clean_str = clean_str.replace(word, num)
+
+    parsed = _date_parser().get_date_data(clean_str).date_obj
+    return parsed if parsed else pd.NaT
+
+
+def is_date_format(target_format: str) -> bool:
+    """Whether a strftime format shows a date (not only a time of day)."""
+    return any(directive in target_format for directive in ("%d", "%m", "%Y"))
+
+
+def _truncate_to_format(parsed: pd.Series, target_format: str) -> pd.Series:
+    """Drop the parts of datetimes a date format does not show."""
+    for directive, unit in (("%S", "s"), ("%M", "min"), ("%H", "h"), ("%d", "D")):
+        if directive in target_format:
+            return parsed.dt.floor(unit)
+    # '%m/%Y' and '%Y': the first day of the month or year.
+    days = parsed.dt.day if "%m" in target_format else parsed.dt.dayofyear
+    return parsed.dt.floor("D") - pd.to_timedelta(days - 1, unit="D")
+
+
+def format_time(series: pd.Series, target_format: str, typed: bool = False) -> pd.Series:
+    """Parse a time/date column and render it with a strftime format.
+
+    With `typed`, date formats keep the values as datetimes, cut to what the
+    format shows; the format is then only their display (see display_formats.py).
+    """
+    parsed = pd.to_datetime(map_distinct(series, parse_natural_date))
+    if typed and is_date_format(target_format):
+        return _truncate_to_format(parsed, target_format)
+    return parsed.dt.strftime(target_format)
+
+
+def parse_money(val, decimal_separator: str):
+    """Split a money string into (amount, currency code).
+
+    Scale words such as 'million' or 'k' are applied to the amount.
+    """
+    if pd.isna(val):
+        return pd.NA, ""
+
+    val_str = str(val).lower().strip()
+    original_str = str(val).strip()
+
+    symbol_match = CURRENCY_RE.search(original_str)
+    raw_symbol = symbol_match.group(1).lower() if symbol_match else ""
+    symbol = CURRENCY_CODES.get(raw_symbol, raw_symbol.upper())
+
+    if decimal_separator == ",":
+        val_str = val_str.replace(".", "").replace(",", ".")
+    else:
+        val_str = val_str.replace(",", "")
+
+    if val_str.count(".") > 1:
+        parts = val_str.rsplit(".", 1)
+        val_str = parts[0].replace(".", "") + "." + parts[1]
+
+    match = re.search(r"[\d\.]+", val_str)
+    if not match:
+        return pd.NA, symbol
+    try:
+        num = float(match.group())
+    except ValueError:
+        return pd.NA, symbol
+
+    isolated_words = re.sub(r"[\d\.\,\u20ac\$\u00a3\u00a5]", " ", val_str).split()
+
+    if any(w in isolated_words for w in ["billion", "billions", "bill", "bil", "b"]):
+        num *= 1_000_000_000
+    elif any(w in isolated_words for w in ["million", "millions", "mill", "mil", "m"]):
+        num *= 1_000_000
+    elif any(w in isolated_words for w in ["thousand", "thousands", "k"]):
+        num *= 1_000
+    elif any(w in isolated_words for w in ["cent", "cents"]):
+        num /= 100
+
+    return num, symbol
+
+
+def format_money(
+    df: pd.DataFrame,
+    col_name: str,
+    is_mixed_currency: bool,
+    detected_currency: str,
+    scale_decision: str,
+    decimal_separator: str,
+) -> pd.DataFrame:
+    """Convert a money column to numbers in the chosen scale.
+
+    Mixed currencies get a `<col>_currency` column inserted to the right; a
+    single currency and the scale are appended to the column header instead.
+    """
+    df = df.copy()
+    parsed_data = map_distinct(
+        df[col_name], lambda val: parse_money(val, decimal_separator)
+    )
+    nums = [x[0] if isinstance(x, tuple) else pd.NA for x in parsed_data]
+    symbols = [x[1] if isinstance(x, tuple) else "" for x in parsed_data]
+
+    df[col_name] = pd.array(nums, dtype="Float64")
+
+    scale_suffix = ""
+    if scale_decision in _SCALE_DIVISORS:
+        divisor, scale_suffix = _SCALE_DIVISORS[scale_decision]
+        df[col_name] = df[col_name] / divisor
+
+    if is_mixed_currency:
+        # Insert a separate currency column to the right
+        col_idx = df.columns.get_loc(col_name)
+        new_currency_col = f"{col_name}_currency"
+        df.insert(loc=col_idx + 1, column=new_currency_col, value=symbols)
+
+        if scale_suffix:
+            new_col_name = f"{col_name} ({scale_suffix})"
+            df.rename(columns={col_name: new_col_name}, inplace=True)
+    else:
+        parts = []
+        if detected_currency and detected_currency != "Unknown":
+            parts.append(detected_currency)
+        if scale_suffix:
+            parts.append(scale_suffix)
+
+        if parts:
+            header_addition = " ".join(parts)
+            new_col_name = f"{col_name} ({header_addition})"
+            df.rename(columns={col_name: new_col_name}, inplace=True)
+
+    return df
+
+
+def format_int(series: pd.Series) -> pd.Series:
+    """Clean and truncate values to nullable integers."""
+
+    def parse_int(val):
+        if pd.isna(val):
+            return pd.NA
+        val_str = str(val).lower().replace(",", "").strip()
+        try:
+            num = float(val_str)
+            return int(num)
+        except ValueError:
+            return pd.NA
+
+    return map_distinct(series, parse_int).astype("Int64")
+
+
+def parse_floats(series: pd.Series) -> pd.Series:
+    """Extract floats from a column, with NA where a value does not parse."""
+
+    def extract_float(val):
+        if pd.isna(val):
+            return pd.NA
+        val_str = str(val).lower().replace(",", "").strip()
+        try:
+            return float(val_str)
+        except ValueError:
+            return pd.NA
+
+    return map_distinct(series, extract_float)
+
+
+def max_decimals(floats: pd.Series) -> int:
+    """Return the largest number of decimal places among parsed floats."""
+    decimals = 0
+    for val in floats.dropna():
+        parts = str(val).split(".")
+        if len(parts) == 2 and decimals < len(parts[1]):
+            decimals = len(parts[1])
+    return decimals
+
+
+def format_float(floats: pd.Series, decimals: int, typed: bool = False) -> pd.Series:
+    """Render parsed floats with a fixed number of decimal places, or with
+    `typed`, round them and keep them floats."""
+    if typed:
+        return pd.to_numeric(floats).astype("Float64").round(decimals)
+
+    def pad_float(val):
+        if pd.isna(val):
+            return pd.NA
+        return f"{val:.{decimals}f}"
+
+    return map_distinct(floats, pad_float)
+
+
+def format_name(series: pd.Series, entity_type: str, dominant_format: str) -> pd.Series:
+    """Title-case proper nouns and put human names in 'First Last' order."""
+
+    def parse_name(val):
+        if pd.isna(val):
+            return pd.NA
+        clean_name = str(val).strip().title()
+        if entity_type == "Locations/Other":
+            return clean_name
+        if "," in clean_name:
+            parts = [p.strip() for p in clean_name.split(",")]
+            if len(parts) == 2:
+                return f"{parts[1]} {parts[0]}"
+        if dominant_format == "Last First":
+            parts = clean_name.split()
+            if len(parts) == 2:
+                return f"{parts[1]} {parts[0]}"
+        return clean_name
+
+    return map_distinct(series, parse_name)
+
+
+def _label_tokens(val: str) -> list[str]:
+    text = unicodedata.normalize("NFKD", val).encode("ascii", "ignore").decode()
+    return text.lower().translate(_PUNCTUATION_TABLE).split()
+
+
+def fingerprint_key(val: str) -> str:
+    """Order- and punctuation-insensitive key: 'U.S.A.' and 'usa' -> 'usa'."""
+    return " ".join(sorted(set(_label_tokens(val))))
+
+
+def ngram_key(val: str, n: int = 2) -> str:
+    """Sorted distinct character n-grams, robust to spacing: 'NewYork' == 'new york'."""
+    compact = "".join(_label_tokens(val))
+    grams = {compact[i : i + n] for i in range(max(1, len(compact) - n + 1))}
+    return "".join(sorted(grams))
+
+
+def _initials_key(val: str) -> str | None:
+    tokens = [t for t in _label_tokens(val) if t not in _INITIALS_STOPWORDS]
+    return "".join(t[0] for t in tokens) if len(tokens) > 1 else None
+
+
+def _stem_key(val: str) -> str | None:
+    tokens = _label_tokens(val)
+    if len(tokens) != 1:
+        return None
+    word = tokens[0]
+    for suffix in _LABEL_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def cluster_categories(counts: pd.Series) -> dict[str, str]:
+    """Cluster the variants of a categorical column and pick a canonical value.
+
+    `counts` holds the occurrences of each distinct (stripped) value. Values are
+    joined when they share a fingerprint, an n-gram key, a stem, or when one is
+    the initials of another ('UK' / 'United Kingdom'). The most frequent
+    variant of each cluster is its canonical value.
+
+    Returns {variant: canonical} for the variants that change.
+    """
+    values = [str(v) for v in counts.index]
+    parent = list(range(len(values)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union_by(keys):
+        first = {}
+        for i, key in enumerate(keys):
+            if not key:
+                continue
+            if key in first:
+                parent[find(i)] = find(first[key])
+            else:
+                first[key] = i
+
+    compact = ["".join(_label_tokens(v)) for v in values]
+    union_by([fingerprint_key(v) for v in values])
+    union_by([ngram_key(v) for v in values])
+    union_by([_stem_key(v) for v in values])
+    # An abbreviation shares the key of the compact form of the short value.
+    initials = {}
+    for i, v in enumerate(values):
+        key = _initials_key(v)
+        if key:
+            initials.setdefault(key, i)
+    for i, key in enumerate(compact):
+        if key in initials:
+            parent[find(i)] = find(initials[key])
+
+    clusters: dict[int, list[int]] = {}
+    for i in range(len(values)):
+        clusters.setdefault(find(i), []).append(i)
+
+    weights = counts.to_numpy()
+    mapping = {}
+    for members in clusters.values():
+        if len(members) < 2:
+            continue
+        canonical = values[max(members, key=lambda i: weights[i])]
+        for i in members:
+            if values[i] != canonical:
+                mapping[values[i]] = canonical
+    return mapping
+
+
+def apply_category_mapping(series: pd.Series, mapping: dict[str, str]) -> pd.Series:
+    """Replace variants by their canonical value through the categorical codes.
+
+    Only the categories are looked up; rows are remapped with one integer take.
+    """
+    cat = series.astype("category")
+    categories = [
+        mapping.get(str(c).strip(), str(c).strip()) if isinstance(c, str) else c
+        for c in cat.cat.categories
+    ]
+    new_codes, new_categories = pd.factorize(pd.Index(categories, dtype=object))
+    codes = cat.cat.codes.to_numpy()
+    remapped = np.where(codes >= 0, new_codes[codes], -1)
+    values = pd.Categorical.from_codes(remapped, categories=new_categories)
+    return pd.Series(values, index=series.index, name=series.name)
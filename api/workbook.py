@@ -0,0 +1,193 @@
+"""
+Multi-sheet Workbooks
+=====================
+Workbooks with several data sheets (e.g. one sheet per month) are split into
+one working file per sheet next to the workbook:
+
+    <stem>.sheet1.xlsx, <stem>.sheet2.xlsx, ...
+
+Sheets are grouped by schema. The first sheet of every group is cleaned by the
+agent pipeline; the other sheets of the group replay its recipe without model
+calls. The results are merged back into the workbook, one cleaned sheet per
+source sheet, followed by a single `dataset_description` sheet.
+"""
+
+import glob
+import os
+import re
+from pathlib import Path
+
+import checkpoints
+import pandas as pd
+import transforms
+from display_formats import column_formats, excel_formats
+from recipe import load_recipe, recipe_path, replay_frame, save_recipe, split_recipe
+from table_io import read_table, read_workbook, sheet_names, write_excel
+
+# Maximum number of sheets cleaned by the agent pipeline at the same time.
+SHEET_CONCURRENCY = int(os.environ.get("SHEET_CONCURRENCY", "4"))
+
+DESCRIPTION_SHEET = "dataset_description"
+# The header row of a sheet is looked for in its first rows only.
+SIGNATURE_SCAN_ROWS = 15
+
+
+def sheet_path(file_path: str | Path, index: int) -> Path:
+    path = Path(file_path)
+    return path.with_name(f"{path.stem}.sheet{index}{path.suffix}")
+
+
+def sheet_files(file_path: str | Path) -> list[Path]:
+    """The sheet working files split from a workbook that are on disk."""
+    path = Path(file_path)
+    name = re.compile(rf"{re.escape(path.stem)}\.sheet\d+{re.escape(path.suffix)}")
+    return sorted(
+        p for p in path.parent.glob(f"{glob.escape(path.stem)}.sheet*") if name.fullmatch(p.name)
+    )
+
+
+def has_sheet_checkpoint(file_path: str | Path) -> bool:
+    """Whether a sheet of a workbook has a checkpoint to resume from."""
+    return any(checkpoints.has_checkpoint(path) for path in sheet_files(file_path))
+
+
+def discard_sheets(file_path: str | Path) -> None:
+    """Remove the sheet working files of a failed run that have no checkpoint,
+    with their recipes; a resumed run splits them from the workbook again."""
+    for path in sheet_files(file_path):
+        if not checkpoints.has_checkpoint(path):
+            checkpoints.clear(path)
+            recipe_path(path).unlink(missing_ok=True)
+            path.unlink(missing_ok=True)
+
+
+def _labels(row: pd.Series) -> tuple[str, ...]:
+    return tuple(
+        str(val).strip().lower() for val in row.dropna() if isinstance(val, str) and val.strip()
+    )
+
+
+def likely_header_row(raw: pd.DataFrame) -> int:
+    """Return the position of the likely header row of a sheet read without header.
+
+    The likely header is the first of the leading rows with the most text
+    cells, so title rows and export dates above the table do not affect it.
+    """
+    best, best_count = 0, 0
+    for position, (_, row) in enumerate(raw.head(SIGNATURE_SCAN_ROWS).iterrows()):
+        count = len(_labels(row))
+        if count > best_count:
+            best, best_count = position, count
+    return best
+
+
+def schema_signature(raw: pd.DataFrame) -> tuple[str, ...]:
+    """Return the labels of the likely header row of a sheet read without header."""
+    if raw.empty:
+        return ()
+    return _labels(raw.iloc[likely_header_row(raw)])
+
+
+def data_sheet_names(file_path: str | Path) -> list[str]:
+    return [n for n in sheet_names(str(file_path)) if n != DESCRIPTION_SHEET]
+
+
+def split_sheets(file_path: str | Path) -> dict[str, dict]:
+    """Write every data sheet of a workbook to its own working file.
+
+    Returns {sheet_name: {"path": ..., "signature": ...}} in sheet order.
+    Working files with a checkpoint from an earlier attempt are left as they
+    are so their run can resume.
+    """
+    raw_sheets = read_workbook(str(file_path), header=None)
+    raw_sheets.pop(DESCRIPTION_SHEET, None)
+    sheets = {}
+    for index, (name, raw) in enumerate(raw_sheets.items(), start=1):
+        if raw.dropna(how="all").empty:
+            continue
+        path = sheet_path(file_path, index)
+        if not checkpoints.has_checkpoint(path):
+            write_excel(str(path), {name: raw}, header=False)
+        sheets[name] = {"path": path, "signature": schema_signature(raw)}
+    return sheets
+
+
+def group_by_schema(sheets: dict[str, dict]) -> list[list[str]]:
+    """Group sheet names with the same signature, keeping the sheet order."""
+    groups: dict[tuple, list[str]] = {}
+    for name, sheet in sheets.items():
+        groups.setdefault(sheet["signature"] or (name,), []).append(name)
+    return list(groups.values())
+
+
+def load_with_header(
+    path: str | Path,
+    recipe: dict,
+    sheet_name: str | None = None,
+    nrows: int | None = None,
+) -> pd.DataFrame:
+    """Read a table with the header row and first column of a recipe."""
+    header, _, _ = split_recipe(recipe)
+    header_row = header["header_row_index"] if header else 0
+    df = read_table(str(path), header=header_row, nrows=nrows, sheet_name=sheet_name)
+    return transforms.crop_columns(df, header["header_col_index"] if header else 0)
+
+
+def replay_sheet(
+    workbook_path: str | Path, leader: str, recipe: dict, path: Path
+) -> bool:
+    """Clean a sheet working file with the recipe of a sheet of the same schema.
+
+    The header of the recipe must yield the same columns on this sheet as on
+    the `leader` sheet of the (not yet merged) workbook. Returns False,
+    leaving the file untouched, when it does not.
+    """
+    expected = load_with_header(workbook_path, recipe, sheet_name=leader, nrows=0)
+    df = load_with_header(path, recipe)
+    if list(df.columns) != list(expected.columns):
+        return False
+    _, operations, _ = split_recipe(recipe)
+    df = replay_frame(df, operations)
+    number_formats = {"Cleaned_Data": excel_formats(column_formats(operations))}
+    write_excel(str(path), {"Cleaned_Data": df}, number_formats=number_formats)
+    save_recipe(path, {**recipe, "source": path.name})
+    return True
+
+
+def merge_sheets(file_path: str | Path, sheets: dict[str, dict]) -> None:
+    """Write the cleaned sheets and one description sheet back into the workbook.
+
+    The workbook's recipe keeps the operations of every sheet under "sheets";
+    its top-level operations are those of the first sheet.
+    """
+    cleaned = {}
+    descriptions = []
+    sheet_operations = {}
+    for name, sheet in sheets.items():
+        cleaned[name] = read_table(str(sheet["path"]))
+        recipe = load_recipe(sheet["path"])
+        sheet_operations[name] = recipe["operations"]
+        _, _, description = split_recipe(recipe)
+        if description is not None:
+            features = pd.DataFrame(description["features"])
+            features.insert(0, "Sheet", name)
+            descriptions.append(features)
+
+    output = dict(cleaned)
+    if descriptions:
+        output[DESCRIPTION_SHEET] = pd.concat(descriptions, ignore_index=True)
+    number_formats = {
+        name: excel_formats(column_formats(operations))
+        for name, operations in sheet_operations.items()
+    }
+    write_excel(str(file_path), output, number_formats=number_formats)
+
+    recipe = load_recipe(file_path)
+    recipe["operations"] = next(iter(sheet_operations.values()))
+    recipe["sheets"] = sheet_operations
+    save_recipe(file_path, recipe)
+
+    for sheet in sheets.values():
+        checkpoints.clear(sheet["path"])
+        recipe_path(sheet["path"]).unlink(missing_ok=True)
+        sheet["path"].unlink(missing_ok=True)
@@ -0,0 +1,97 @@
+"""
+Column Group Benchmark
+======================
+Builds a wide table of a few repeated column shapes (dates, amounts, status
+labels, numbered like generated or sensor data) and compares formatting it
+column by column with formatting it by group (see api/column_groups.py).
+Reports the number of groups against the number of columns (which bounds the
+reader's classifications and the orchestrator's model and tool calls), the
+time to compute the signatures, and the time of the date and float
+transforms per column and per group.
+
+Usage:
+    python benchmarks/bench_column_groups.py --rows 5000 --columns 300
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import transforms  # noqa: E402
+from column_groups import group_columns  # noqa: E402
+
+
+def _make_frame(rows: int, columns: int) -> pd.DataFrame:
+    rng = random.Random(42)
+    data = {"id": [f"ID-{i:07d}" for i in range(rows)]}
+    for k in range(columns):
+        kind = k % 3
+        if kind == 0:
+            data[f"date_{k:03d}"] = [
+                f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" for _ in range(rows)
+            ]
+        elif kind == 1:
+            data[f"reading_{k:03d}"] = [f"{rng.uniform(0, 500):.3f}" for _ in range(rows)]
+        else:
+            data[f"status_{k:03d}"] = [rng.choice(["ok", "OK", "fail", "FAILED"]) for _ in range(rows)]
+    return pd.DataFrame(data)
+
+
+def _timed(fn, repeat: int) -> tuple[float, object]:
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def _per_column(df: pd.DataFrame, columns: list[str], transform, *args) -> pd.DataFrame:
+    df = df.copy()
+    for col in columns:
+        df[col] = transform(df[col], *args)
+    return df
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="column group benchmark")
+    parser.add_argument("--rows", type=int, default=5_000)
+    parser.add_argument("--columns", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = _make_frame(args.rows, args.columns)
+    seconds, groups = _timed(lambda: group_columns(df), args.repeat)
+    grouped = sum(len(members) for members in groups.values())
+    print(
+        f"{args.rows:,} rows x {df.shape[1]} columns -> {df.shape[1] - grouped} to classify "
+        f"and format ({len(groups)} groups), signatures in {seconds * 1000:.0f} ms"
+    )
+    for prefix, transform, extra in (
+        ("date_", transforms.format_time, ("%d/%m/%Y",)),
+        ("reading_", transforms.parse_floats, ()),
+    ):
+        leader = next(col for col in groups if col.startswith(prefix))
+        columns = [leader, *groups[leader]]
+        per_column, expected = _timed(
+            lambda: _per_column(df, columns, transform, *extra), args.repeat
+        )
+        per_group, result = _timed(
+            lambda: transforms.format_columns(df.copy(), columns, transform, *extra), args.repeat
+        )
+        assert result[columns].equals(expected[columns]), "group transform differs"
+        print(
+            f"  {transform.__name__:<12} {len(columns)} columns: per column "
+            f"{per_column * 1000:8.0f} ms  per group {per_group * 1000:8.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
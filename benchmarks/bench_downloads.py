@@ -0,0 +1,74 @@
+"""
+Download Format Benchmark
+=========================
+Compares the size and production time of the download formats of
+api/downloads.py on a wide numeric table, shaped like a cleaned export of
+measurements: integer counts, amounts with two decimals, ratios and a few
+categorical columns.
+
+Usage:
+    python benchmarks/bench_downloads.py --rows 100000 --columns 40
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import downloads  # noqa: E402
+import table_io  # noqa: E402
+
+
+def _make_frame(rows: int, columns: int) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    data = {"row_id": np.arange(rows)}
+    for i in range(columns):
+        kind = i % 4
+        if kind == 0:
+            data[f"count_{i}"] = rng.poisson(20, rows)
+        elif kind == 1:
+            data[f"amount_{i}"] = np.round(rng.lognormal(5, 1, rows), 2)
+        elif kind == 2:
+            data[f"ratio_{i}"] = np.round(rng.uniform(0, 1, rows), 3)
+        else:
+            data[f"status_{i}"] = rng.choice(["COMPLETED", "PENDING", "FAILED"], rows)
+    return pd.DataFrame(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="download format benchmark")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--columns", type=int, default=40)
+    args = parser.parse_args()
+
+    df = _make_frame(args.rows, args.columns)
+    print(f"{args.rows:,} rows x {df.shape[1]} columns")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "result.xlsx"
+        table_io.save_table(df, str(path))
+        xlsx_size = path.stat().st_size
+        print(f"{'xlsx':<8} {xlsx_size / 2**20:8.2f} MiB")
+
+        for fmt in ("csv.gz", "csv.zst", "parquet"):
+            start = time.perf_counter()
+            artifact = downloads.ensure_artifact(path, fmt)
+            elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            downloads.ensure_artifact(path, fmt)
+            cached = time.perf_counter() - start
+            size = artifact.stat().st_size
+            print(
+                f"{fmt:<8} {size / 2**20:8.2f} MiB  x{xlsx_size / size:5.1f} smaller  "
+                f"produced in {elapsed:5.2f}s, cached in {cached * 1000:.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
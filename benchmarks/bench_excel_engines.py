@@ -0,0 +1,77 @@
+"""
+Spreadsheet Engine Benchmark
+============================
+Compares the xlsx read/write engines supported by api/table_io.py on a
+synthetic table shaped like the generated messy sales data.
+
+Usage:
+    python benchmarks/bench_excel_engines.py --rows 200000 --repeat 3
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import table_io  # noqa: E402
+
+READ_ENGINES = ["openpyxl", "calamine"]
+WRITE_ENGINES = ["openpyxl", "xlsxwriter"]
+
+
+def _make_frame(rows: int) -> pd.DataFrame:
+    rng = random.Random(42)
+    statuses = ["COMPLETED", "PENDING", "FAILED"]
+    countries = ["US", "UK", "DE", "FR", "JP", "CA", "AU"]
+    return pd.DataFrame(
+        {
+            "transaction_id": [f"TXN-{i:06d}" for i in range(rows)],
+            "date": pd.date_range("2023-01-01", periods=rows, freq="15min"),
+            "customer_id": [f"CUST-{rng.randint(1000, 9999)}" for _ in range(rows)],
+            "amount": [round(rng.uniform(10.0, 5000.0), 2) for _ in range(rows)],
+            "status": [rng.choice(statuses) for _ in range(rows)],
+            "country": [rng.choice(countries) for _ in range(rows)],
+        }
+    )
+
+
+def _best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="xlsx engine benchmark")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = _make_frame(args.rows)
+    print(f"Benchmarking {args.rows:,} rows x {df.shape[1]} columns")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "bench.xlsx")
+
+        for engine in WRITE_ENGINES:
+            table_io.EXCEL_WRITE_ENGINE = engine
+            elapsed = _best_of(args.repeat, lambda: table_io.save_table(df, path))
+            print(f"write  {engine:<12} {elapsed:8.2f}s  {args.rows / elapsed:>12,.0f} rows/s")
+
+        for engine in READ_ENGINES:
+            table_io.EXCEL_READ_ENGINE = engine
+            elapsed = _best_of(args.repeat, lambda: table_io.read_table(path))
+            print(f"read   {engine:<12} {elapsed:8.2f}s  {args.rows / elapsed:>12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Cold Start Benchmark
+====================
+Measures how long the backend processes take to start, each in a fresh
+interpreter:
+
+  - the import of runner.py, mcp_server.py and app.py (with -X importtime),
+    with the heaviest modules each of them imports directly;
+  - the MCP server as the pipeline starts it: until it answers `list_tools`,
+    and until its first tool call (a header detection on a small CSV) returns.
+
+The import of runner.py bounds how soon a job starts working; the MCP
+server's readiness how soon its agents can call tools.
+
+Usage:
+    python benchmarks/bench_import_time.py --repeat 5 --top 8
+    TOOL_EXECUTOR=thread python benchmarks/bench_import_time.py --modules mcp_server
+"""
+
+import argparse
+import asyncio
+import csv
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+API_DIR = Path(__file__).resolve().parent.parent / "api"
+
+
+def _import_times(module: str) -> tuple[float, dict[str, float]]:
+    """Wall time of `import module` in a new interpreter, and the cumulative
+    import time of the module and of every module it imports directly."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=API_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall = time.perf_counter() - start
+    times, children = {}, {}
+    # "import time: <self us> | <cumulative us> | <indented name>", children
+    # listed before their parent, two more spaces indented.
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:]
+        indent, name = len(name) - len(name.lstrip()), name.strip()
+        if indent == 2:
+            children[name] = children.get(name, 0) + int(parts[1]) / 1e6
+        elif indent == 0:
+            if name == module:
+                times = {**children, module: int(parts[1]) / 1e6}
+            children = {}
+    return wall, times
+
+
+def _report_imports(module: str, repeat: int, top: int) -> None:
+    runs = [_import_times(module) for _ in range(repeat)]
+    wall = statistics.median(w for w, _ in runs)
+    total = statistics.median(t.get(module, 0.0) for _, t in runs)
+    print(f"import {module:<12} {total * 1000:8.0f} ms import  {wall * 1000:8.0f} ms process")
+    children = {name for _, t in runs for name in t if name != module}
+    heaviest = sorted(
+        ((statistics.median(t.get(name, 0.0) for _, t in runs), name) for name in children),
+        reverse=True,
+    )
+    for seconds, name in heaviest[:top]:
+        print(f"    {name:<28} {seconds * 1000:8.0f} ms")
+
+
+async def _server_start(csv_path: Path) -> tuple[float, float]:
+    params = StdioServerParameters(
+        command=sys.executable,
+        args=[str(API_DIR / "mcp_server.py")],
+        env=dict(os.environ),
+        cwd=str(API_DIR),
+    )
+    start = time.perf_counter()
+    with open(os.devnull, "w") as server_log:
+        async with stdio_client(params, errlog=server_log) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                await session.list_tools()
+                ready = time.perf_counter() - start
+                await session.call_tool("execute_header_detection", {"file_path": str(csv_path)})
+                first_call = time.perf_counter() - start
+    return ready, first_call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="cold start benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=6, help="heaviest direct imports shown")
+    parser.add_argument("--modules", nargs="+", default=["runner", "mcp_server", "app"])
+    args = parser.parse_args()
+
+    print(f"python {sys.version.split()[0]}, median of {args.repeat} runs")
+    for module in args.modules:
+        _report_imports(module, args.repeat, args.top)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "small.csv"
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["date", "amount", "customer"])
+            writer.writerows([f"2024-01-{d:02d}", f"${d * 10}.50", "jane doe"] for d in range(1, 29))
+        runs = [asyncio.run(_server_start(csv_path)) for _ in range(args.repeat)]
+    ready = statistics.median(r for r, _ in runs)
+    first_call = statistics.median(c for _, c in runs)
+    print(
+        f"mcp server ({os.environ.get('TOOL_EXECUTOR', 'process')} executor): "
+        f"ready {ready * 1000:.0f} ms, first tool result {first_call * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Model Scheduler Benchmark
+=========================
+Runs several concurrent jobs against a local fake provider that enforces its
+own rate limit and answers 429 beyond it, like the real API. Half of the jobs
+are interactive and half are bulk backfills. Every job is run once with calls
+going straight to the provider (retrying on its own after a fixed delay, as
+jobs did before) and once through api/model_scheduler.py.
+
+Reports, per job, the calls rejected with 429, the time spent queued by the
+scheduler and the time to finish.
+
+Usage:
+    python benchmarks/bench_model_scheduler.py --jobs 6 --calls 15 --rpm 600
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+from agents import Model, ModelProvider, ModelResponse, ModelSettings, ModelTracing, Usage  # noqa: E402
+from openai.types.responses.response_usage import InputTokensDetails  # noqa: E402
+
+NAIVE_RETRY_SECONDS = 1.0
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+
+class FakeModel(Model):
+    """Answers after `latency` seconds, within `rpm` calls per minute."""
+
+    def __init__(self, rpm: int, burst_seconds: float, latency: float):
+        self.rate = rpm / 60.0
+        self.capacity = self.rate * burst_seconds
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.latency = latency
+        self.rejected = 0
+
+    async def get_response(self, system_instructions, input, *args, **kwargs):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.level < 1:
+            self.rejected += 1
+            raise FakeRateLimitError("Rate limit reached")
+        self.level -= 1
+        await asyncio.sleep(self.latency)
+        usage = Usage(
+            requests=1,
+            input_tokens=400,
+            output_tokens=100,
+            total_tokens=500,
+            input_tokens_details=InputTokensDetails.model_construct(cached_tokens=0),
+        )
+        return ModelResponse(output=[], usage=usage, response_id=None)
+
+    async def stream_response(self, *args, **kwargs):
+        raise NotImplementedError
+        yield
+
+
+class FakeProvider(ModelProvider):
+    def __init__(self, model: FakeModel):
+        self.model = model
+
+    def get_model(self, model_name):
+        return self.model
+
+
+async def _call(model: Model, retry: bool) -> int:
+    """One model call; returns the number of 429 answers it got."""
+    rejected = 0
+    while True:
+        try:
+            await model.get_response(
+                "You are a data cleaning agent.",
+                "Classify the column 'amount'.",
+                ModelSettings(max_tokens=100),
+                [],
+                None,
+                [],
+                ModelTracing.DISABLED,
+                previous_response_id=None,
+                conversation_id=None,
+                prompt=None,
+            )
+            return rejected
+        except FakeRateLimitError:
+            if not retry:
+                raise
+            rejected += 1
+            await asyncio.sleep(NAIVE_RETRY_SECONDS)
+
+
+async def _job(model: Model, calls: int, retry: bool) -> tuple[int, float]:
+    start = time.perf_counter()
+    rejected = 0
+    for _ in range(calls):
+        rejected += await _call(model, retry)
+    return rejected, time.perf_counter() - start
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="model scheduler benchmark")
+    parser.add_argument("--jobs", type=int, default=6)
+    parser.add_argument("--calls", type=int, default=15)
+    parser.add_argument("--rpm", type=int, default=600)
+    parser.add_argument("--burst-seconds", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["SCHEDULER_STATE"] = str(Path(tmp) / "scheduler.json")
+    os.environ["MODEL_RPM"] = str(args.rpm)
+    os.environ["MODEL_TPM"] = str(args.rpm * 1000)
+    os.environ["MODEL_BURST_SECONDS"] = str(args.burst_seconds)
+    from model_scheduler import ModelScheduler, ScheduledModelProvider
+
+    lanes = ["interactive" if i % 2 == 0 else "bulk" for i in range(args.jobs)]
+    print(
+        f"{args.jobs} jobs x {args.calls} calls, provider limit {args.rpm} RPM "
+        f"(bursts of {args.burst_seconds:g}s)"
+    )
+
+    fake = FakeModel(args.rpm, args.burst_seconds, args.latency)
+    results = await asyncio.gather(
+        *(_job(fake, args.calls, retry=True) for _ in range(args.jobs))
+    )
+    print("\nunscheduled")
+    for i, (rejected, elapsed) in enumerate(results):
+        print(f"  job{i} {lanes[i]:<12} {rejected:>4} x 429  {elapsed:6.2f}s")
+
+    fake = FakeModel(args.rpm, args.burst_seconds, args.latency)
+    schedulers = [ModelScheduler(f"job{i}", lane=lanes[i]) for i in range(args.jobs)]
+    models = [ScheduledModelProvider(s, FakeProvider(fake)).get_model(None) for s in schedulers]
+    results = await asyncio.gather(
+        *(_job(model, args.calls, retry=False) for model in models)
+    )
+    print("\nscheduled")
+    for scheduler, (_, elapsed) in zip(schedulers, results):
+        stats = scheduler.stats()
+        print(
+            f"  {stats['jobId']} {stats['lane']:<12} {stats['rateLimited']:>4} x 429  "
+            f"{elapsed:6.2f}s  queued {stats['queueWaitSeconds']:6.2f}s "
+            f"(max {stats['maxQueueWaitSeconds']:.2f}s)"
+        )
+    print(f"  provider rejected {fake.rejected} calls")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""
+Dataset Snapshot Benchmark
+==========================
+Compares a full read of a working file by parsing it (as every tool and
+sampling call did) with a read of its memory-mapped Arrow snapshot (see
+api/snapshots.py), for a workbook and a CSV of the same data. Reports the
+time per read, the time to sample every column the way the orchestrator's
+`read_column_sample` does, and the Arrow memory the read allocated (a mapped
+snapshot allocates next to none).
+
+Usage:
+    python benchmarks/bench_snapshots.py --rows 200000 --repeat 5
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+os.environ.setdefault("MEMORY_REPORT", "0")
+
+import snapshots  # noqa: E402
+from sampling import representative_values  # noqa: E402
+from table_io import read_table, save_table  # noqa: E402
+
+
+def _make_frame(rows: int) -> pd.DataFrame:
+    rng = random.Random(42)
+    return pd.DataFrame(
+        {
+            "transaction_id": [f"TXN-{i:07d}" for i in range(rows)],
+            "date": [f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2023" for _ in range(rows)],
+            "amount": [round(rng.uniform(10.0, 5000.0), 2) for _ in range(rows)],
+            "quantity": [rng.randint(1, 100) for _ in range(rows)],
+            "status": [rng.choice(["COMPLETED", "failed", "Pending"]) for _ in range(rows)],
+            "customer": [f"customer {rng.randint(1, rows // 10 + 1)}" for _ in range(rows)],
+        }
+    )
+
+
+def _timed(fn, repeat: int) -> tuple[float, object]:
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def _read_and_sample(path: str) -> pd.DataFrame:
+    df = read_table(path)
+    for col in df.columns:
+        representative_values(df[col], 10)
+    return df
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="dataset snapshot benchmark")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = _make_frame(args.rows)
+    print(f"{args.rows:,} rows x {df.shape[1]} columns, snapshots in {snapshots.SNAPSHOT_DIR}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("data.xlsx", "data.csv"):
+            path = str(Path(tmp) / name)
+            save_table(df, path)
+            size = snapshots.snapshot_path(path).stat().st_size
+
+            snapshots.SNAPSHOTS = False
+            parse, _ = _timed(lambda: read_table(path), args.repeat)
+            parse_sample, _ = _timed(lambda: _read_and_sample(path), args.repeat)
+            before = pa.total_allocated_bytes()
+            parsed = read_table(path)
+            parse_alloc = pa.total_allocated_bytes() - before
+
+            snapshots.SNAPSHOTS = True
+            mapped, _ = _timed(lambda: read_table(path), args.repeat)
+            mapped_sample, _ = _timed(lambda: _read_and_sample(path), args.repeat)
+            before = pa.total_allocated_bytes()
+            loaded = read_table(path)
+            mapped_alloc = pa.total_allocated_bytes() - before
+
+            assert loaded.equals(parsed), "snapshot differs from the parsed file"
+            print(f"{name} ({Path(path).stat().st_size / 2**20:.1f} MiB, snapshot {size / 2**20:.1f} MiB)")
+            for label, read, sample, alloc in (
+                ("parse", parse, parse_sample, parse_alloc),
+                ("snapshot", mapped, mapped_sample, mapped_alloc),
+            ):
+                print(
+                    f"  {label:<9} read {read * 1000:8.1f} ms  read+sample {sample * 1000:8.1f} ms  "
+                    f"Arrow allocated {alloc / 2**20:7.1f} MiB"
+                )
+            snapshots.discard(path)
+
+
+if __name__ == "__main__":
+    main()
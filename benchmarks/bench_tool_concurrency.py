@@ -0,0 +1,128 @@
+"""
+MCP Tool Concurrency Benchmark
+==============================
+Calls the MCP tools of api/mcp_server.py through FastMCP, the way the agents
+do, with an increasing number of parallel calls on separate datasets, and
+reports the throughput of every level. It then measures the latency of a
+cheap header preview issued while a long tool call runs on another file.
+
+With the process executor, throughput should scale with the parallel calls up
+to the number of cores.
+
+Usage:
+    python benchmarks/bench_tool_concurrency.py --rows 50000 --levels 1 2 4 8
+    TOOL_EXECUTOR=thread python benchmarks/bench_tool_concurrency.py
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+os.environ.setdefault("MEMORY_REPORT", "0")
+
+import mcp_server  # noqa: E402
+import tool_executor  # noqa: E402
+
+
+def _make_frame(rows: int) -> pd.DataFrame:
+    rng = random.Random(42)
+    return pd.DataFrame(
+        {
+            "transaction_id": [f"TXN-{i:06d}" for i in range(rows)],
+            "amount": [f"${rng.uniform(10.0, 5000.0):,.2f}" for _ in range(rows)],
+            "ratio": [f"{rng.uniform(0, 1):.6f}" for _ in range(rows)],
+            "customer": [
+                rng.choice(["jane DOE", "Smith, John", "li wei", "O'NEIL, ann"])
+                for _ in range(rows)
+            ],
+        }
+    )
+
+
+async def _call(tool: str, **arguments) -> None:
+    await mcp_server.mcp.call_tool(tool, arguments)
+
+
+async def _throughput(files: list[Path], source: Path, calls: int) -> float:
+    for path in files:
+        shutil.copyfile(source, path)
+    queue = list(range(calls))
+
+    async def worker(path: Path) -> None:
+        while queue:
+            queue.pop()
+            await _call("execute_float_formatting", file_path=str(path), col_name="ratio")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(path) for path in files))
+    return calls / (time.perf_counter() - start)
+
+
+async def _preview_latency(tmp: Path, source: Path) -> float:
+    busy, cheap = tmp / "busy.csv", tmp / "cheap.csv"
+    shutil.copyfile(source, busy)
+    shutil.copyfile(source, cheap)
+    long_call = asyncio.create_task(
+        _call(
+            "execute_name_formatting",
+            file_path=str(busy),
+            col_name="customer",
+            entity_type="Human Names",
+            dominant_format="First Last",
+        )
+    )
+    await asyncio.sleep(0.2)
+    start = time.perf_counter()
+    await _call("execute_header_detection", file_path=str(cheap))
+    latency = time.perf_counter() - start
+    await long_call
+    return latency
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="MCP tool concurrency benchmark")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--calls", type=int, default=16)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    tool_executor.TOOL_WORKERS = max(args.levels)
+    print(
+        f"{args.rows:,} rows, {args.calls} calls per level, executor="
+        f"{tool_executor.TOOL_EXECUTOR} x {tool_executor.TOOL_WORKERS}, "
+        f"{os.cpu_count()} CPUs"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source = tmp / "source.csv"
+        _make_frame(args.rows).to_csv(source, index=False)
+
+        # Start the workers before timing.
+        await _throughput([tmp / "warmup.csv"], source, tool_executor.TOOL_WORKERS)
+
+        baseline = None
+        for level in args.levels:
+            files = [tmp / f"parallel{i}.csv" for i in range(level)]
+            rate = await _throughput(files, source, args.calls)
+            baseline = baseline or rate
+            print(f"parallel {level:>3}  {rate:8.2f} calls/s  x{rate / baseline:.2f}")
+
+        latency = await _preview_latency(tmp, source)
+        print(f"header preview during a long call: {latency * 1000:.0f} ms")
+
+    tool_executor.shutdown_executor()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
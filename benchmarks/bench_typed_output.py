@@ -0,0 +1,109 @@
+"""
+Typed Output Benchmark
+======================
+Formats a table of dates and amounts both ways (see api/display_formats.py):
+as text, the default, and typed with TYPED_OUTPUT. Reports for each the
+memory of the formatted frame, the size and write time of the xlsx and
+Parquet outputs, and the time to load the Parquet output back with dates and
+numbers a consumer can compute with (text columns parsed again).
+
+Usage:
+    python benchmarks/bench_typed_output.py --rows 200000
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import display_formats  # noqa: E402
+import downloads  # noqa: E402
+import transforms  # noqa: E402
+from table_io import write_excel  # noqa: E402
+
+DATE_COLUMNS = ("ordered", "shipped")
+FLOAT_COLUMNS = ("price", "weight")
+
+
+def _make_frame(rows: int) -> pd.DataFrame:
+    rng = random.Random(42)
+    data = {}
+    for col in DATE_COLUMNS:
+        data[col] = [
+            f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" for _ in range(rows)
+        ]
+    for col in FLOAT_COLUMNS:
+        data[col] = [f"{rng.uniform(0, 1000):.2f}" for _ in range(rows)]
+    return pd.DataFrame(data)
+
+
+def _format(raw: pd.DataFrame, typed: bool) -> tuple[pd.DataFrame, list[dict]]:
+    df = transforms.format_columns(
+        raw.copy(), list(DATE_COLUMNS), transforms.format_time, "%d/%m/%Y", typed
+    )
+    operations = []
+    for col in DATE_COLUMNS:
+        params = {"col_name": col, "target_format": "%d/%m/%Y", "typed": typed}
+        operations.append({"op": "time_formatting", "params": params})
+    for col in FLOAT_COLUMNS:
+        floats = transforms.parse_floats(df[col])
+        decimals = transforms.max_decimals(floats)
+        df[col] = transforms.format_float(floats, decimals, typed)
+        params = {"col_name": col, "decimals": decimals, "typed": typed}
+        operations.append({"op": "float_formatting", "params": params})
+    return df, operations
+
+
+def _load_parquet(path: Path, typed: bool) -> pd.DataFrame:
+    df = pd.read_parquet(path)
+    if not typed:
+        for col in DATE_COLUMNS:
+            df[col] = pd.to_datetime(df[col], format="%d/%m/%Y")
+        for col in FLOAT_COLUMNS:
+            df[col] = pd.to_numeric(df[col])
+    return df
+
+
+def _timed(fn) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="typed output benchmark")
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    raw = _make_frame(args.rows)
+    print(f"{args.rows:,} rows, {len(DATE_COLUMNS)} date and {len(FLOAT_COLUMNS)} float columns")
+    with tempfile.TemporaryDirectory() as tmp:
+        for typed in (False, True):
+            label = "typed" if typed else "text"
+            df, operations = _format(raw, typed)
+            display = display_formats.column_formats(operations)
+            memory = df.memory_usage(deep=True).sum() / 2**20
+            xlsx, parquet = Path(tmp, f"{label}.xlsx"), Path(tmp, f"{label}.parquet")
+            number_formats = {"Cleaned_Data": display_formats.excel_formats(display)}
+            xlsx_seconds, _ = _timed(
+                lambda: write_excel(str(xlsx), {"Cleaned_Data": df}, number_formats=number_formats)
+            )
+            parquet_seconds, _ = _timed(
+                lambda: downloads.write_artifact(df, parquet, "parquet", display)
+            )
+            load_seconds, _ = _timed(lambda: _load_parquet(parquet, typed))
+            print(
+                f"  {label:<5} frame {memory:7.1f} MiB | xlsx {xlsx.stat().st_size / 2**20:6.1f} MiB "
+                f"in {xlsx_seconds:5.2f}s | parquet {parquet.stat().st_size / 2**20:5.1f} MiB "
+                f"in {parquet_seconds:5.2f}s, loaded in {load_seconds:5.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
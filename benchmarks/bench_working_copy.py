@@ -0,0 +1,66 @@
+"""
+Working Copy Benchmark
+======================
+Compares creating a job's working copy with a plain copy (shutil.copy2, as
+the runner did) and with `storage.working_copy`, which clones the file by
+reflink or hard link where the filesystem allows it. Reports the time per
+copy and the disk space the copies take.
+
+Usage:
+    python benchmarks/bench_working_copy.py --size-mb 500 --copies 5 --dir /data/uploads
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import storage  # noqa: E402
+
+
+def _disk_usage(paths: list[Path]) -> int:
+    """Allocated bytes of distinct inodes (hard links are counted once)."""
+    seen = {}
+    for path in paths:
+        st = path.stat()
+        seen[st.st_ino] = st.st_blocks * 512
+    return sum(seen.values())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="working copy benchmark")
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--copies", type=int, default=5)
+    parser.add_argument("--dir", help="directory on the filesystem to test (default: a temp dir)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        src = Path(tmp) / "source.csv"
+        with open(src, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1 << 20))
+        print(f"{args.size_mb} MiB source, {args.copies} copies in {tmp}")
+
+        for name, copy in (("copy2", shutil.copy2), ("working_copy", storage.working_copy)):
+            copies = [Path(tmp) / f"{name}_{i}.csv" for i in range(args.copies)]
+            start = time.perf_counter()
+            for dst in copies:
+                method = copy(src, dst)
+            elapsed = (time.perf_counter() - start) / args.copies
+            extra = _disk_usage([src, *copies]) - _disk_usage([src])
+            label = f"{name} ({method})" if copy is storage.working_copy else name
+            print(
+                f"{label:<26} {elapsed * 1000:8.1f} ms per copy  "
+                f"{extra / 2**20:8.1f} MiB of extra disk"
+            )
+            for dst in copies:
+                dst.unlink()
+
+
+if __name__ == "__main__":
+    main()
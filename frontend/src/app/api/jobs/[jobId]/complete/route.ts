@@ -26,12 +26,13 @@ export const POST = async (
     }
 
     const body = (await request.json()) as {
-      status: "SUCCEEDED" | "FAILED";
+      status: "RUNNING" | "SUCCEEDED" | "FAILED";
       resultJson?: unknown;
       errorMessage?: string;
+      progress?: unknown;
     };
 
-    if (!["SUCCEEDED", "FAILED"].includes(body.status)) {
+    if (!["RUNNING", "SUCCEEDED", "FAILED"].includes(body.status)) {
       return Response.json({ error: "Invalid status" }, { status: 400 });
     }
 
@@ -41,6 +42,18 @@ export const POST = async (
     });
     if (!job) return Response.json({ error: "Job not found" }, { status: 404 });
 
+    // Progress updates while the job runs; never overwrite a final result.
+    if (body.status === "RUNNING") {
+      await prisma.datasetAgentJob.updateMany({
+        where: { id: jobId, status: { in: ["QUEUED", "RUNNING"] } },
+        data: {
+          status: "RUNNING",
+          resultJson: body.progress ? { progress: body.progress } : undefined,
+        },
+      });
+      return Response.json({ ok: true });
+    }
+
     await prisma.datasetAgentJob.update({
       where: { id: jobId },
       data: {
@@ -7,8 +7,10 @@ const uploadRoot = path.join(process.cwd(), "uploads");
 
 const contentTypeByExtension: Record<string, string> = {
   ".csv": "text/csv",
+  ".gz": "application/gzip",
   ".json": "application/json",
-  ".parquet": "application/octet-stream",
+  ".parquet": "application/vnd.apache.parquet",
+  ".zst": "application/zstd",
   ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 };
 
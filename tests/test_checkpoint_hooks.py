@@ -0,0 +1,77 @@
+"""
+Checkpoint Hooks
+================
+The run hooks checkpoint the stages finished by MCP tools, whose results the
+Agents SDK hands over as {"type": "text", "text": ...} items rather than
+strings. A resumed job must be told to skip those stages.
+
+Usage:
+    python -m unittest discover tests
+"""
+
+import asyncio
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import checkpoints  # noqa: E402
+from agents.tool import ToolOutputTextDict  # noqa: E402
+from storage import replacing  # noqa: E402
+
+
+def _tool_end(hooks, name: str, result, arguments: dict | None = None) -> None:
+    context = SimpleNamespace(tool_arguments=json.dumps(arguments or {}))
+    asyncio.run(hooks.on_tool_end(context, None, SimpleNamespace(name=name), result))
+
+
+class CheckpointHooksTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.working = Path(self.tmp.name) / "job1_cleaned_sales.csv"
+        self.working.write_text("id,amount\n1,2.5\n2,3.75\n")
+        self.hooks = checkpoints.CheckpointHooks(str(self.working))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_mcp_results_are_checkpointed(self):
+        _tool_end(self.hooks, "apply_header_and_crop", ToolOutputTextDict(type="text", text="Header set."))
+        _tool_end(self.hooks, "execute_na_cleaning", [ToolOutputTextDict(type="text", text="Done.")])
+        _tool_end(
+            self.hooks,
+            "execute_float_formatting",
+            ToolOutputTextDict(type="text", text="Formatted."),
+            {"col_name": "amount"},
+        )
+
+        manifest = checkpoints.load_manifest(self.working)
+        self.assertEqual(manifest["completed"], ["header", "na"])
+        self.assertEqual(manifest["columns_done"], ["amount"])
+
+    def test_failed_mcp_result_is_not_checkpointed(self):
+        result = ToolOutputTextDict(type="text", text="Error applying header: no such row")
+        _tool_end(self.hooks, "apply_header_and_crop", result)
+
+        self.assertIsNone(checkpoints.load_manifest(self.working))
+
+    def test_resume_skips_finished_stages(self):
+        _tool_end(self.hooks, "apply_header_and_crop", ToolOutputTextDict(type="text", text="Header set."))
+        cropped = self.working.read_text()
+        with replacing(self.working) as tmp:
+            Path(tmp).write_text("half written by the failed run\n")
+
+        manifest = checkpoints.restore(self.working)
+        instructions = checkpoints.resume_instructions(manifest)
+
+        self.assertEqual(self.working.read_text(), cropped)
+        self.assertIn("Completed steps: STEP 1 - SCOUT.", instructions)
+        self.assertNotIn("SWEEP", instructions)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+"""
+Duplicate Rows
+==============
+Near-duplicate keys keep the prefix of IDs, so rows that differ only in it
+are never grouped, and exact-duplicate detection ignores normalization.
+
+Usage:
+    python -m unittest discover tests
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import dedup  # noqa: E402
+
+
+class DeduplicationTest(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame(
+            {"id": ["INV-7", "CRN-7", "inv 007", "INV-7"], "amount": [10.0, 10.0, 10.0, 10.0]}
+        )
+
+    def test_id_prefix_is_kept(self):
+        self.assertEqual(dedup._normalize_value("INV-7"), "inv7")
+        self.assertEqual(dedup._normalize_value("CRN-7"), "crn7")
+        self.assertEqual(dedup._normalize_value("TXN-000095"), dedup._normalize_value("txn 95"))
+
+    def test_near_duplicates_need_the_same_prefix(self):
+        labels = dedup.find_duplicates(self.df, near_duplicates=True)
+        self.assertEqual(dedup.duplicate_groups(labels), [[0, 2, 3]])
+
+    def test_exact_duplicates_by_default(self):
+        kept = dedup.drop_duplicates(self.df, dedup.find_duplicates(self.df))
+        self.assertEqual(kept["id"].tolist(), ["INV-7", "CRN-7", "inv 007"])
+
+
+if __name__ == "__main__":
+    unittest.main()
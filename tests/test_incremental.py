@@ -0,0 +1,89 @@
+"""
+Incremental Processing
+======================
+Rows appended to a source are cleaned with the stored recipe and appended to
+the output, as a full run would have cleaned them: a new row duplicating an
+old one is dropped, and a source without a final line break is appended to
+on a new line.
+
+Usage:
+    python -m unittest discover tests
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import incremental  # noqa: E402
+import recipe  # noqa: E402
+
+HEADER = {"op": "header", "params": {"header_row_index": 0, "header_col_index": 0}}
+DEDUP = {
+    "op": "deduplication",
+    "params": {"near_duplicates": False, "similarity_threshold": 1.0, "ignore_columns": []},
+}
+FLOATS = {"op": "float_formatting", "params": {"col_name": "amount", "decimals": 2}}
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = Path(self.tmp.name) / "sales.csv"
+        self.cleaned = Path(self.tmp.name) / "cleaned_sales.csv"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _full_run(self, text: str, operations: list[dict]) -> None:
+        self.source.write_text(text)
+        cleaning = {**recipe._new_recipe(self.source), "operations": [HEADER, *operations]}
+        recipe.replay(cleaning, str(self.source), str(self.cleaned))
+        recipe.save_recipe(self.cleaned, cleaning)
+        incremental.save_state(self.source, self.cleaned)
+
+    def _refresh(self, appended: str) -> int:
+        with open(self.source, "a") as f:
+            f.write(appended)
+        state = incremental.load_state(self.cleaned)
+        self.assertTrue(incremental.is_append_of(state, self.source))
+        return incremental.process_increment(self.source, self.cleaned, state)
+
+    def _output(self) -> list[list[str]]:
+        return pd.read_csv(self.cleaned, dtype=str).values.tolist()
+
+    def test_append_round_trip(self):
+        self._full_run("id,amount\nA1,1.5\nA2,2.25\n", [FLOATS])
+
+        self.assertEqual(self._refresh("A3,3\n"), 1)
+        self.assertEqual(self._refresh(""), 0)
+        self.assertEqual(self._output(), [["A1", "1.50"], ["A2", "2.25"], ["A3", "3.00"]])
+        self.assertEqual(incremental.load_state(self.cleaned)["rows"], 3)
+
+    def test_new_duplicate_of_an_old_row_is_dropped(self):
+        self._full_run("id,amount\nA1,1.5\nA2,2.25\nA1,1.5\n", [DEDUP, FLOATS])
+
+        self.assertEqual(self._refresh("A2,2.25\nA3,3\nA3,3\n"), 1)
+        self.assertEqual(self._output(), [["A1", "1.50"], ["A2", "2.25"], ["A3", "3.00"]])
+        self.assertEqual(incremental.load_state(self.cleaned)["rows"], 6)
+
+    def test_source_without_final_line_break(self):
+        self._full_run("id,amount\nA1,1.5\nA2,2.25", [FLOATS])
+
+        self.assertEqual(self._refresh("\nA3,3\n"), 1)
+        self.assertEqual(self._output(), [["A1", "1.50"], ["A2", "2.25"], ["A3", "3.00"]])
+
+    def test_continued_last_row_is_not_an_append(self):
+        self._full_run("id,amount\nA1,1.5\nA2,2.25", [FLOATS])
+        with open(self.source, "a") as f:
+            f.write("5\nA3,3\n")
+
+        self.assertFalse(incremental.is_append_of(incremental.load_state(self.cleaned), self.source))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Leftover Collection
+===================
+The runner collects the checkpoints that failed jobs leave in the upload
+directory. A checkpoint idle for longer than STORAGE_COMPRESS_AFTER_MINUTES
+must still be resumable after a collection, and expired ones must go.
+
+Usage:
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import checkpoints  # noqa: E402
+import runner  # noqa: E402
+from storage import replacing  # noqa: E402
+
+
+def _age(paths, hours: float) -> None:
+    past = time.time() - hours * 3600
+    for path in paths:
+        os.utime(path, (past, past))
+
+
+class LeftoverCollectionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.working = self.dir / "job1_cleaned_sales.csv"
+        self.working.write_text("id,amount\n1,2.50\n2,3.75\n")
+        checkpoints.save(self.working, {"version": checkpoints.MANIFEST_VERSION, "completed": ["header"]})
+        self.leftovers = [checkpoints.snapshot_path(self.working), checkpoints.manifest_path(self.working)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_idle_checkpoint_still_resumes(self):
+        _age([self.working, *self.leftovers], hours=2)
+        stats = runner.collect_leftovers(self.dir)
+
+        self.assertEqual(stats["compressed"], 0)
+        self.assertTrue(all(path.exists() for path in self.leftovers))
+        self.assertTrue(checkpoints.has_checkpoint(self.working))
+        # Writers replace the working file (the snapshot may be a hard link).
+        with replacing(self.working) as tmp:
+            Path(tmp).write_text("changed after the checkpoint\n")
+        manifest = checkpoints.restore(self.working)
+        self.assertEqual(manifest["completed"], ["header"])
+        self.assertEqual(self.working.read_text(), "id,amount\n1,2.50\n2,3.75\n")
+
+    def test_expired_checkpoint_is_evicted(self):
+        compressed = self.dir / "job0_cleaned_old.csv.manifest.json.zst"
+        compressed.write_bytes(b"left by an earlier collection")
+        _age([*self.leftovers, compressed], hours=runner.ArtifactStore(self.dir).ttl / 3600 + 1)
+        runner.collect_leftovers(self.dir)
+
+        self.assertFalse(any(path.exists() for path in [*self.leftovers, compressed]))
+        self.assertFalse(checkpoints.has_checkpoint(self.working))
+        self.assertTrue(self.working.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Progress Hooks
+==============
+Stages finished by MCP tools, whose results the Agents SDK hands over as
+{"type": "text", "text": ...} items, are reported as finished, and formatted
+columns are counted.
+
+Usage:
+    python -m unittest discover tests
+"""
+
+import asyncio
+import json
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import progress  # noqa: E402
+from agents.tool import ToolOutputTextDict  # noqa: E402
+
+
+class _Reporter:
+    def __init__(self):
+        self.finished, self.columns = [], []
+
+    def stage_started(self, stage):
+        pass
+
+    def stage_finished(self, stage):
+        self.finished.append(stage)
+
+    def column_done(self, *col_names):
+        self.columns.extend(col_names)
+
+
+class ProgressHooksTest(unittest.TestCase):
+    def _tool_end(self, hooks, name, result, arguments=None):
+        context = SimpleNamespace(tool_arguments=json.dumps(arguments or {}))
+        asyncio.run(hooks.on_tool_end(context, None, SimpleNamespace(name=name), result))
+
+    def test_mcp_results_are_reported(self):
+        reporter = _Reporter()
+        hooks = progress.ProgressHooks(reporter)
+        self._tool_end(hooks, "apply_header_and_crop", ToolOutputTextDict(type="text", text="Header set."))
+        self._tool_end(
+            hooks,
+            "execute_int_formatting",
+            [ToolOutputTextDict(type="text", text="Formatted.")],
+            {"col_name": "qty", "also_apply_to": ["units"]},
+        )
+        self._tool_end(
+            hooks, "execute_na_cleaning", ToolOutputTextDict(type="text", text="Error cleaning: boom")
+        )
+
+        self.assertEqual(reporter.finished, ["header"])
+        self.assertEqual(reporter.columns, ["qty", "units"])
+
+
+if __name__ == "__main__":
+    unittest.main()
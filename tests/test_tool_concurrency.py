@@ -0,0 +1,58 @@
+"""
+Tool Concurrency
+================
+Offloaded MCP tools called on the same file run one after the other (the
+per-file lock), while calls on different files overlap.
+
+Usage:
+    python -m unittest discover tests
+"""
+
+import asyncio
+import sys
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import tool_executor  # noqa: E402
+
+TOOL_SECONDS = 0.2
+
+
+def slow_tool(file_path: str) -> tuple[float, float]:
+    start = time.monotonic()
+    time.sleep(TOOL_SECONDS)
+    return start, time.monotonic()
+
+
+class ToolConcurrencyTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = tool_executor.TOOL_EXECUTOR, tool_executor.TOOL_WORKERS
+        # Threads share the clock and need no importable tool module.
+        tool_executor.TOOL_EXECUTOR, tool_executor.TOOL_WORKERS = "thread", 4
+        self.tool = tool_executor.offloaded(slow_tool)
+
+    def tearDown(self):
+        tool_executor.shutdown_executor()
+        tool_executor.TOOL_EXECUTOR, tool_executor.TOOL_WORKERS = self.settings
+
+    def _run(self, *file_paths: str) -> list[tuple[float, float]]:
+        async def calls():
+            return await asyncio.gather(*(self.tool(file_path=path) for path in file_paths))
+
+        return sorted(asyncio.run(calls()))
+
+    def test_same_file_is_serialized(self):
+        runs = self._run("data/sales.csv", "data/sales.csv", "data/./sales.csv")
+        for (_, end), (start, _) in zip(runs, runs[1:]):
+            self.assertGreaterEqual(start, end)
+
+    def test_different_files_overlap(self):
+        runs = self._run("data/a.csv", "data/b.csv", "data/c.csv")
+        self.assertLess(max(start for start, _ in runs), min(end for _, end in runs))
+
+
+if __name__ == "__main__":
+    unittest.main()